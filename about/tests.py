@@ -1,3 +1,59 @@
-from django.test import TestCase
+from io import BytesIO
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+from about.models import AboutModel
+from backblaze.utils.storage import get_storage
 
-# Create your tests here.
+
+def make_upload(name, color):
+    byte_arr = BytesIO()
+    Image.new("RGB", (64, 48), color).save(byte_arr, format="PNG")
+    return SimpleUploadedFile(name, byte_arr.getvalue())
+
+
+@override_settings(
+    IMAGE_JOBS_ASYNC=False,
+    IMAGE_POOL_SIZE=0,
+    IMAGE_STORAGE_BACKEND="backblaze.utils.storage.InMemoryStorage",
+)
+class AboutImagesUploadTests(TestCase):
+    def setUp(self):
+        get_storage().clear()
+        self.about = AboutModel.objects.create(
+            id=2,
+            quantity_of_animals=1,
+            quantity_of_employees=1,
+            quantity_of_succeeds_adoptions=1,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+
+    def test_uploads_many_files_in_one_request(self):
+        images = [make_upload(f"dog{i}.png", (i * 40, 80, 40)) for i in range(3)]
+        images.append(SimpleUploadedFile("notes.txt", b"text"))
+        response = self.client.post(
+            reverse("about-images"), {"images": images}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [result["name"] for result in response.data],
+            ["dog0.png", "dog1.png", "dog2.png", "notes.txt"],
+        )
+        self.assertIn("error", response.data[3])
+        self.assertEqual(self.about.images.count(), 3)
+
+    def test_all_files_rejected_is_a_bad_request(self):
+        response = self.client.post(
+            reverse("about-images"),
+            {"images": [SimpleUploadedFile("notes.txt", b"text")]},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.about.images.count(), 0)
@@ -2,7 +2,9 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from about.models import AboutModel
 from rest_framework.permissions import AllowAny
-from backblaze.utils.b2_utils import converter_to_webP
+from django.db import transaction
+from backblaze.utils.b2_utils import release_file
+from backblaze.utils.image_jobs import submit_images
 from about.serializer import AboutSerializer, ImagesSerializer, EmploymentSerializer
 from rest_framework import status
 from backblaze.models import FileModel
@@ -13,6 +15,17 @@ from drf_spectacular.utils import extend_schema
 from rest_framework.validators import ValidationError
 from api.models import IsApprovedUser
 
+# Files accepted by one AboutImages upload request
+MAX_IMAGES_PER_UPLOAD = 30
+
+
+def error_description(error):
+    detail = getattr(error, "detail", None)
+    if isinstance(detail, dict) and "description" in detail:
+        return str(detail["description"])
+    return str(error)
+
+
 # get about data
 
 
@@ -80,55 +93,72 @@ class AboutImages(mixins.ListModelMixin, mixins.CreateModelMixin, GenericViewSet
 
     @extend_schema(
         summary="Upload images to AboutModel",
-        description="Uploads multiple images to AboutModel, automatically converting them to webP format. Supports bulk upload.",
+        description="Uploads one or more images to AboutModel in one request. They are converted "
+        "to webP in parallel and the response lists the result for every file, in upload order.",
         request={
             "multipart/form-data": {
                 "type": "object",
-                "properties": {"images": {"type": "string", "format": "binary"}},
+                "properties": {
+                    "images": {
+                        "type": "array",
+                        "items": {"type": "string", "format": "binary"},
+                    }
+                },
             }
         },
         responses={
-            201: ImagesSerializer,
+            201: {
+                "description": "Per-file results: {name, file} for stored images, "
+                "{name, error} for rejected ones"
+            },
             400: {"description": "Зображення не знайдено"},
-            400: {"description": "Поганий запит - ValidationError"},
             500: {"description": "Помилка сервера"},
         },
     )
     def create(self, request):
         """
-        Creates a new image entry or entries in the AboutModel by uploading images. Uploaded images are
-        automatically converted to webP format. Supports bulk upload.
+        Uploads images to the AboutModel. All files sent as "images" are converted in parallel,
+        stored with one bulk insert and attached to the page with one query.
 
         Args:
             request: HttpRequest object containing the images to upload in the FILES attribute.
 
         Returns:
-            Response: An HttpResponse indicating the outcome of the create operation, including the data
-            of the created image entry on success or an error message on failure.
+            Response: A list with one entry per uploaded file: the stored file data, or the error
+            that file was rejected with. 201 if at least one file was stored, 400 otherwise.
         """
         try:
-            images = request.FILES.get("images")
+            images = request.FILES.getlist("images")
             about = AboutModel.objects.filter(id=2).first()
 
-            if images is None:
+            if not images:
                 return Response(
                     {"description": "Зображення не знайдено "},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
+            if len(images) > MAX_IMAGES_PER_UPLOAD:
+                return Response(
+                    {"description": f"Не більше {MAX_IMAGES_PER_UPLOAD} зображень за раз"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
-            webp_image_name, webp_image_id, image_url = converter_to_webP(images)
-            file_model = FileModel.objects.create(
-                id=webp_image_id,
-                name=webp_image_name,
-                url=image_url,
-                category="image",
-            )
-            about.images.add(file_model)
-            serializer = FileSerializer(file_model, many=False)
-
+            # Reused files stay locked until the page references them
+            with transaction.atomic():
+                uploaded = submit_images(images)
+                stored = [file_model for file_model, _ in uploaded if file_model]
+                if stored:
+                    about.images.add(*stored)
+
+            results = []
+            for image, (file_model, error) in zip(images, uploaded):
+                if file_model:
+                    file_data = FileSerializer(file_model, context={"request": request}).data
+                    results.append({"name": image.name, "file": file_data})
+                else:
+                    results.append({"name": image.name, "error": error_description(error)})
             return Response(
-                serializer.data,
-                status=status.HTTP_201_CREATED,
+                results,
+                status=status.HTTP_201_CREATED if stored else status.HTTP_400_BAD_REQUEST,
             )
         except ValidationError as e:
             return Response(
@@ -165,8 +195,9 @@ class AboutImages(mixins.ListModelMixin, mixins.CreateModelMixin, GenericViewSet
         try:
             about = AboutModel.objects.filter(id=2).first()
             file = FileModel.objects.get(pk=pk)
-            file.delete()
-            about.images.remove(pk)
+            with transaction.atomic():
+                about.images.remove(pk)
+                release_file(file)
             return Response(
                 {"description": "Зображення видалено"}, status=status.HTTP_200_OK
             )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from backblaze.models import FileModel
+from backblaze.signals import files_updated
+from backblaze.utils.b2_utils import stored_metadata
+
+
+class Command(BaseCommand):
+    help = "Records byte size, MIME type and placeholder of images converted before they were stored"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Files loaded per query"
+        )
+
+    def handle(self, *args, **options):
+        files = (
+            FileModel.objects.filter(status=FileModel.READY, byte_size__isnull=True)
+            .exclude(file_id="")
+            .only("id", "name", "file_id")
+        )
+        updated = failed = 0
+        for file in files.iterator(chunk_size=options["batch_size"]):
+            try:
+                fields = stored_metadata(file)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{file.pk}: {e}")
+                continue
+            FileModel.objects.filter(pk=file.pk).update(**fields)
+            files_updated.send(sender=FileModel, pks=[file.pk])
+            updated += 1
+        self.stdout.write(f"Updated {updated} files, {failed} failed")
@@ -0,0 +1,35 @@
+import json
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from backblaze.utils.benchmark import SIZES, environment, generate_corpus, run_benchmark
+
+
+class Command(BaseCommand):
+    help = "Benchmarks image conversion on a generated corpus and prints JSON results"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default=",".join(str(size) for size in SIZES),
+            help="Comma-separated long sides of the generated images",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=1, help="Runs per input; timings are medians"
+        )
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        corpus = generate_corpus(sizes=sizes)
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "environment": environment(),
+            "results": run_benchmark(corpus, repeat=options["repeat"]),
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+            self.stderr.write(f"Benchmarked {len(corpus)} inputs into {options['output']}")
+        else:
+            self.stdout.write(output)
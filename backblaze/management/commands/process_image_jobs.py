@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from backblaze.utils.image_jobs import process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Converts queued image uploads to webp and uploads them to storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=10, help="Jobs claimed per round"
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the queue once and exit"
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            claimed = process_pending_jobs(limit=options["batch_size"])
+            processed += claimed
+            if claimed:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["sleep"])
+        self.stdout.write(f"Processed {processed} image jobs")
@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from backblaze.utils.deletions import DELETE_CONCURRENCY, process_deletions
+from backblaze.utils.direct_upload import expire_direct_uploads
+
+
+class Command(BaseCommand):
+    help = "Deletes queued objects from image storage and forgets expired direct uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Deletions claimed per round"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=DELETE_CONCURRENCY,
+            help="Parallel delete requests",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Drain the queue once and exit"
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            claimed = process_deletions(
+                limit=options["batch_size"], concurrency=options["concurrency"]
+            )
+            processed += claimed
+            if claimed:
+                continue
+            # Between rounds, so expired uploads' keys are revoked while idle
+            while expire_direct_uploads(limit=options["batch_size"]):
+                pass
+            if options["once"]:
+                break
+            time.sleep(options["sleep"])
+        self.stdout.write(f"Processed {processed} storage deletions")
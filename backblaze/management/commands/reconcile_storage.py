@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from backblaze.utils.reconcile import (
+    DELETE_CONCURRENCY,
+    MIN_ORPHAN_AGE,
+    PAGE_SIZE,
+    reconcile,
+)
+
+
+class Command(BaseCommand):
+    help = "Finds stored images that no file record refers to and optionally deletes them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete", action="store_true", help="Delete orphans instead of only listing them"
+        )
+        parser.add_argument(
+            "--page-size", type=int, default=PAGE_SIZE, help="Objects listed per request"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=DELETE_CONCURRENCY,
+            help="Parallel delete requests",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=float,
+            default=MIN_ORPHAN_AGE / 3600,
+            help="Hours an object must exist before it counts as orphaned",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File to save progress to; an existing one is resumed",
+        )
+
+    def handle(self, *args, **options):
+        state = reconcile(
+            delete=options["delete"],
+            page_size=options["page_size"],
+            concurrency=options["concurrency"],
+            min_age=options["min_age"] * 3600,
+            checkpoint=options["checkpoint"],
+            on_orphan=lambda stored: self.stdout.write(
+                f"orphan {stored.id_} {stored.file_name}"
+            ),
+        )
+        self.stdout.write(
+            f"Scanned {state['scanned']} objects, found {state['orphans']} orphans, "
+            f"deleted {state['deleted']}"
+        )
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.8 on 2026-10-18 07:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_file_ids(apps, schema_editor):
+    # Files uploaded so far use the bucket file id as primary key
+    FileModel = apps.get_model('backblaze', 'FileModel')
+    FileModel.objects.update(file_id=models.F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0004_alter_filemodel_url'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='filemodel',
+            options={'verbose_name': 'File', 'verbose_name_plural': 'Files'},
+        ),
+        migrations.AddField(
+            model_name='filemodel',
+            name='file_id',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.RunPython(copy_file_ids, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='filemodel',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], default='ready', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='filemodel',
+            name='url',
+            field=models.URLField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('original_name', models.CharField(max_length=200)),
+                ('source', models.BinaryField()),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('processing', 'processing'), ('failed', 'failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='backblaze.filemodel')),
+            ],
+            options={
+                'verbose_name': 'Image job',
+                'verbose_name_plural': 'Image jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='backblaze_i_status_20bae1_idx')],
+            },
+        ),
+    ]
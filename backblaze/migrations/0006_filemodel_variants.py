@@ -0,0 +1,28 @@
+# Generated by Django 4.2.8 on 2026-10-18 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0005_filemodel_status_imagejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filemodel',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='filemodel',
+            name='variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='filemodel',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
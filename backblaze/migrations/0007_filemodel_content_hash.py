@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0006_filemodel_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filemodel',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.8 on 2026-10-18 07:41
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0007_filemodel_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageDeletion',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('file_id', models.CharField(max_length=200)),
+                ('file_name', models.CharField(blank=True, max_length=200)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Storage deletion',
+                'verbose_name_plural': 'Storage deletions',
+                'ordering': ['next_attempt_at'],
+                'indexes': [models.Index(fields=['attempts', 'next_attempt_at'], name='backblaze_s_attempt_c6b8c0_idx')],
+            },
+        ),
+    ]
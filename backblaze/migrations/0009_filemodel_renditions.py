@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 07:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0008_storagedeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filemodel',
+            name='renditions',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
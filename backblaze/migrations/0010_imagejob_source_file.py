@@ -0,0 +1,28 @@
+# Generated by Django 4.2.8 on 2026-10-18 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0009_filemodel_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagejob',
+            name='source_file_id',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='imagejob',
+            name='source_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='imagejob',
+            name='source',
+            field=models.BinaryField(blank=True),
+        ),
+    ]
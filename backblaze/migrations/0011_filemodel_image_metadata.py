@@ -0,0 +1,36 @@
+# Generated by Django 4.2.8 on 2026-10-18 08:00
+
+from django.db import migrations, models
+
+
+def set_mime_types(apps, schema_editor):
+    # Stored images are webp, except SVGs kept as vectors
+    FileModel = apps.get_model('backblaze', 'FileModel')
+    FileModel.objects.filter(name__endswith='.webp').update(mime_type='image/webp')
+    FileModel.objects.filter(name__endswith='.svg').update(mime_type='image/svg+xml')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0010_imagejob_source_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filemodel',
+            name='byte_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='filemodel',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='filemodel',
+            name='placeholder',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(set_mime_types, migrations.RunPython.noop),
+    ]
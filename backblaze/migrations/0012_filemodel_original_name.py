@@ -0,0 +1,25 @@
+# Generated by Django 4.2.8 on 2026-10-18 08:02
+
+from django.db import migrations, models
+
+
+def copy_names(apps, schema_editor):
+    # Until now objects were named after the upload, with the extension replaced
+    FileModel = apps.get_model('backblaze', 'FileModel')
+    FileModel.objects.update(original_name=models.F('name'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0011_filemodel_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filemodel',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.RunPython(copy_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.8 on 2026-10-18 08:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def record_variants(apps, schema_editor):
+    FileModel = apps.get_model('backblaze', 'FileModel')
+    StoredVariant = apps.get_model('backblaze', 'StoredVariant')
+    files = FileModel.objects.exclude(file_id='').only('id', 'variants', 'renditions')
+    for file in files.iterator(chunk_size=1000):
+        StoredVariant.objects.bulk_create(
+            StoredVariant(file_id=file.pk, object_id=variant['file_id'])
+            for variant in file.variants + file.renditions
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0012_filemodel_original_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredVariant',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('object_id', models.CharField(db_index=True, max_length=200)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stored_variants', to='backblaze.filemodel')),
+            ],
+            options={
+                'verbose_name': 'Stored variant',
+                'verbose_name_plural': 'Stored variants',
+            },
+        ),
+        migrations.RunPython(record_variants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0013_storedvariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filemodel',
+            name='encode_passes',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.8 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0014_filemodel_encode_passes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectUpload',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('key_id', models.CharField(blank=True, max_length=100)),
+                ('received', models.BooleanField(default=False)),
+                ('file_id', models.CharField(blank=True, max_length=200, null=True, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Direct upload',
+                'verbose_name_plural': 'Direct uploads',
+            },
+        ),
+    ]
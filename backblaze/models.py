@@ -1,14 +1,202 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
 
 class FileModel(models.Model):
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
     id = models.CharField(max_length=200, primary_key=True)
+    # Object name in storage, derived from the stored bytes once converted
     name = models.CharField(max_length=200, blank=False)
-    url = models.URLField(max_length=200, blank=False)
+    # File name the image was uploaded with
+    original_name = models.CharField(max_length=200, blank=True)
+    url = models.URLField(max_length=200, blank=True)
     category = models.CharField(max_length=20, blank=False)
+    # Id of the object in the bucket, empty until the upload has finished
+    file_id = models.CharField(max_length=200, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            (PENDING, "pending"),
+            (READY, "ready"),
+            (FAILED, "failed"),
+        ],
+        default=READY,
+    )
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    # Size and type of the main image
+    byte_size = models.PositiveIntegerField(null=True, blank=True)
+    mime_type = models.CharField(max_length=50, blank=True)
+    # Full encodes compress_image needed to fit the main image into its size
+    # budget; empty for SVGs and images converted before it was recorded
+    encode_passes = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Tiny blurred preview as a data: URI, empty for SVGs
+    placeholder = models.TextField(blank=True)
+    # Smaller renditions: [{"width", "height", "bytes", "name", "file_id", "url"}, ...]
+    variants = models.JSONField(default=list, blank=True)
+    # Copies in other formats, main image included:
+    # [{"format": "avif", "width", "height", "bytes", "name", "file_id", "url"}, ...]
+    renditions = models.JSONField(default=list, blank=True)
+
+    # sha256 of the uploaded source bytes, used to reuse identical uploads
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+
+    def reference_count(self):
+        """
+        Number of rows (dog cards, news, partners, about page) using this file.
+        """
+        count = 0
+        for relation in self._meta.related_objects:
+            if relation.related_model in (ImageJob, StoredVariant):
+                continue
+            count += relation.related_model._default_manager.filter(
+                **{relation.field.name: self}
+            ).count()
+        return count
+
+    def record_variants(self):
+        """
+        Indexes the bucket objects of the variants and renditions so
+        reconcile_storage can look them up by id. Call it whenever the JSON
+        columns are written.
+        """
+        StoredVariant.objects.filter(file=self).delete()
+        StoredVariant.objects.bulk_create(
+            StoredVariant(file=self, object_id=variant["file_id"])
+            for variant in self.variants + self.renditions
+        )
+
+    def formats(self):
+        """Formats the image is stored in, webp first."""
+        return ["webp"] + sorted({rendition["format"] for rendition in self.renditions})
+
+    def sources(self, fmt="webp"):
+        """
+        Stored sizes of the image in `fmt` as dicts with url, width and
+        height, narrowest first. The main image is the last one.
+        """
+        if fmt != "webp":
+            return [
+                {key: rendition[key] for key in ("url", "width", "height")}
+                for rendition in self.renditions
+                if rendition["format"] == fmt
+            ]
+        sources = [
+            {key: variant[key] for key in ("url", "width", "height")}
+            for variant in self.variants
+        ]
+        if self.url:
+            sources.append({"url": self.url, "width": self.width, "height": self.height})
+        return sources
+
+    def srcset(self, fmt="webp"):
+        return ", ".join(
+            f"{source['url']} {source['width']}w"
+            for source in self.sources(fmt)
+            if source["width"]
+        )
 
     class Meta:
         verbose_name = "File"
         verbose_name_plural = "Files"
+
+
+class ImageJob(models.Model):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    FAILED = "failed"
+
+    id = models.AutoField(primary_key=True)
+    file = models.ForeignKey(FileModel, on_delete=models.CASCADE, related_name="jobs")
+    original_name = models.CharField(max_length=200)
+    # Uploaded bytes, or empty when the client uploaded them straight to storage
+    source = models.BinaryField(blank=True)
+    # Object holding the source for direct uploads, deleted once converted
+    source_file_id = models.CharField(max_length=200, blank=True)
+    source_name = models.CharField(max_length=200, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            (PENDING, "pending"),
+            (PROCESSING, "processing"),
+            (FAILED, "failed"),
+        ],
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+        verbose_name = "Image job"
+        verbose_name_plural = "Image jobs"
+
+
+class StoredVariant(models.Model):
+    """
+    Bucket object holding a variant or rendition of a FileModel, mirrored
+    from its JSON columns so object ids can be looked up by index.
+    """
+
+    id = models.AutoField(primary_key=True)
+    file = models.ForeignKey(
+        FileModel, on_delete=models.CASCADE, related_name="stored_variants"
+    )
+    object_id = models.CharField(max_length=200, db_index=True)
+
+    class Meta:
+        verbose_name = "Stored variant"
+        verbose_name_plural = "Stored variants"
+
+
+class StorageDeletion(models.Model):
+    """
+    Bucket object waiting to be deleted. Rows are written in the same
+    transaction that removes the FileModel and drained by the
+    process_storage_deletions worker.
+    """
+
+    id = models.AutoField(primary_key=True)
+    file_id = models.CharField(max_length=200)
+    file_name = models.CharField(max_length=200, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Claimed rows are pushed into the future, so a crashed worker's rows come back
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["next_attempt_at"]
+        indexes = [models.Index(fields=["attempts", "next_attempt_at"])]
+        verbose_name = "Storage deletion"
+        verbose_name_plural = "Storage deletions"
+
+
+class DirectUpload(models.Model):
+    """
+    An authorized direct upload (see backblaze.utils.direct_upload), kept
+    until its token expires. Records whether the local upload target already
+    received it and which object it was finalized with, so neither happens
+    twice, and the storage key to revoke.
+    """
+
+    id = models.AutoField(primary_key=True)
+    # Object name the token authorizes
+    name = models.CharField(max_length=200, unique=True)
+    # Credential issued for the upload (a B2 application key id), if any
+    key_id = models.CharField(max_length=100, blank=True)
+    received = models.BooleanField(default=False)
+    file_id = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Direct upload"
+        verbose_name_plural = "Direct uploads"
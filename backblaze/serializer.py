@@ -1,8 +1,64 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ModelSerializer, SerializerMethodField
 from backblaze.models import FileModel
 
 
 class FileSerializer(ModelSerializer):
+    """
+    Serializes an image. url, variants, srcset, byte_size and mime_type
+    describe the webp copy, which every browser decodes. `sources` holds the
+    srcset of each stored format, best first, for the <source> elements of a
+    <picture>; the browser picks the first type it supports. placeholder is
+    a tiny data: URI preview to show while it loads.
+    """
+
+    variants = SerializerMethodField()
+    srcset = SerializerMethodField()
+    sources = SerializerMethodField()
+
     class Meta:
         model = FileModel
-        fields = ('id', 'name', 'url', 'category')
+        fields = ('id', 'name', 'original_name', 'url', 'category', 'status',
+                  'width', 'height', 'byte_size', 'mime_type', 'placeholder',
+                  'variants', 'srcset', 'sources')
+
+    def get_variants(self, obj):
+        # Every size but the main image, which is the last source
+        return obj.sources()[:-1]
+
+    def get_srcset(self, obj):
+        return obj.srcset()
+
+    def get_sources(self, obj):
+        formats = obj.formats()[1:]
+        if obj.mime_type in (None, '', 'image/webp'):
+            # Vectors have no webp copy; they are served as they are
+            formats.append('webp')
+        sources = {}
+        for fmt in formats:
+            if fmt == 'webp':
+                url, byte_size = obj.url, obj.byte_size
+            else:
+                # The other-format copy of the main image is the widest one
+                main = max(
+                    (rendition for rendition in obj.renditions if rendition['format'] == fmt),
+                    key=lambda rendition: rendition['width'],
+                )
+                url, byte_size = main['url'], main.get('bytes')
+            sources[fmt] = {
+                'type': f'image/{fmt}',
+                'srcset': obj.srcset(fmt),
+                'url': url,
+                'byte_size': byte_size,
+            }
+        return sources
+
+
+class FileStatusSerializer(FileSerializer):
+    error = SerializerMethodField()
+
+    class Meta(FileSerializer.Meta):
+        fields = FileSerializer.Meta.fields + ('encode_passes', 'error')
+
+    def get_error(self, obj):
+        errors = [job.error for job in obj.jobs.all() if job.error]
+        return errors[-1] if errors else None
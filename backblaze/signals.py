@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent with `pks` when files are changed through QuerySet.update(), which
+# sends no post_save: when an image job finishes or fails, or when stored
+# metadata is backfilled
+files_updated = Signal()
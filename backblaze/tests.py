@@ -1,9 +1,63 @@
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from base64 import b64decode
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from django.test import TestCase
-from .models import FileModel
+from rest_framework.exceptions import ValidationError
+from rest_framework.throttling import ScopedRateThrottle
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
+from .models import DirectUpload, FileModel, ImageJob, StorageDeletion, StoredVariant
 from django.contrib.auth.models import User
+from backblaze.utils import b2_utils
+from main_page.models import Partners
+from b2sdk.v1.exception import InvalidAuthToken
+from backblaze.utils.storage import B2Storage, LocalStorage, get_storage
+from backblaze.utils.image_jobs import (
+    submit_image,
+    submit_images,
+    process_image_job,
+    process_pending_jobs,
+    MAX_ATTEMPTS,
+)
+from backblaze.utils import deletions, direct_upload
+from backblaze.utils.deletions import process_deletions
+from backblaze.utils.reconcile import reconcile
+from backblaze.utils.svg import sanitize_svg, svg_size
+from backblaze.utils.validation import image_validation
+from backblaze.utils.encoding_pool import EncodingPool
+from backblaze.utils.benchmark import generate_corpus, run_benchmark
+from backblaze.serializer import FileSerializer
+from rest_framework.test import APIRequestFactory
+
+IN_MEMORY_STORAGE = "backblaze.utils.storage.InMemoryStorage"
+
+
+def make_upload(name="dog.png", size=(320, 240), fmt="PNG"):
+    byte_arr = BytesIO()
+    Image.new("RGB", size, (120, 80, 40)).save(byte_arr, format=fmt)
+    return SimpleUploadedFile(name, byte_arr.getvalue())
+
+
+def stored_size(data):
+    with Image.open(BytesIO(bytes(data))) as image:
+        return image.size
 
 
 class FileManagementTests(TestCase):
@@ -39,3 +93,1116 @@ class FileManagementTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     # Additional tests for handling non-existent files, deletion process failure
+
+
+@override_settings(IMAGE_JOBS_ASYNC=True, IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+class ImageJobTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+
+    def test_submit_returns_pending_file(self):
+        file = submit_image(make_upload())
+        self.assertEqual(file.status, FileModel.PENDING)
+        self.assertEqual(file.file_id, "")
+        self.assertEqual(ImageJob.objects.filter(file=file).count(), 1)
+        self.assertEqual(self.storage.files, {})
+
+    def test_worker_converts_and_uploads(self):
+        file = submit_image(make_upload())
+        self.assertEqual(process_pending_jobs(), 1)
+        file.refresh_from_db()
+        self.assertEqual(file.status, FileModel.READY)
+        self.assertEqual(file.original_name, "dog.png")
+        self.assertEqual(file.name, b2_utils.object_name(self.storage.files[file.file_id][1], ".webp"))
+        self.assertIn(file.file_id, self.storage.files)
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_failing_job_is_retried_then_marked_failed(self):
+        file = submit_image(make_upload())
+        with mock.patch.object(self.storage, "upload", side_effect=OSError("down")):
+            for _ in range(MAX_ATTEMPTS):
+                self.assertEqual(process_pending_jobs(), 1)
+        self.assertEqual(process_pending_jobs(), 0)
+        file.refresh_from_db()
+        self.assertEqual(file.status, FileModel.FAILED)
+        self.assertEqual(ImageJob.objects.get(file=file).status, ImageJob.FAILED)
+
+    def test_deleted_file_upload_is_discarded(self):
+        file = submit_image(make_upload())
+        jobs = list(ImageJob.objects.select_related("file"))
+        FileModel.objects.filter(pk=file.pk).delete()
+        process_image_job(jobs[0])
+        process_deletions()
+        self.assertEqual(self.storage.files, {})
+
+    @override_settings(IMAGE_JOBS_ASYNC=False)
+    def test_inline_mode_returns_ready_file(self):
+        file = submit_image(make_upload())
+        self.assertEqual(file.status, FileModel.READY)
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_status_endpoint(self):
+        user = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        client = APIClient()
+        client.force_authenticate(user=user)
+        file = submit_image(make_upload())
+        response = client.get(reverse("file_status", args=[file.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], FileModel.PENDING)
+        response = client.get(reverse("file_status", args=["missing"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+def make_noise(size=(256, 256)):
+    # Random pixels barely compress, so the size budget forces a search
+    return Image.frombytes("RGB", size, random.Random(0).randbytes(size[0] * size[1] * 3))
+
+
+class CompressImageTests(TestCase):
+    def count_encodes(self):
+        encodes = []
+        encode_webp = b2_utils.encode_webp
+
+        def counting(image, quality):
+            encodes.append(quality)
+            return encode_webp(image, quality)
+
+        patcher = mock.patch.dict(b2_utils.ENCODERS, {"webp": counting})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return encodes
+
+    def test_image_that_fits_takes_one_pass(self):
+        byte_arr, passes = b2_utils.compress_image(Image.new("RGB", (200, 200), (10, 20, 30)))
+        self.assertEqual(passes, 1)
+        self.assertEqual(byte_arr.tell(), 0)
+        self.assertLessEqual(len(byte_arr.getbuffer()), b2_utils.TARGET_SIZE)
+
+    def test_result_fits_the_target(self):
+        encodes = self.count_encodes()
+        byte_arr, passes = b2_utils.compress_image(make_noise(), target_size=40000)
+        self.assertLessEqual(len(byte_arr.getbuffer()), 40000)
+        self.assertEqual(passes, len(encodes))
+        self.assertLessEqual(passes, b2_utils.MAX_ENCODE_PASSES)
+
+    def test_bisection_keeps_the_best_quality_that_fits(self):
+        encodes = self.count_encodes()
+        image = make_noise()
+        target = len(b2_utils.encode_webp(image, 40).getbuffer())
+        byte_arr, _ = b2_utils.compress_image(image, target_size=target, max_passes=20)
+        # Quality 40 fits exactly; the bracket closes within the tolerance of it
+        self.assertEqual(stored_size(byte_arr.getvalue()), image.size)
+        self.assertGreaterEqual(max(q for q in encodes if q <= 40), 40 - b2_utils.QUALITY_TOLERANCE)
+        self.assertLessEqual(len(byte_arr.getbuffer()), target)
+
+    def test_passes_are_capped(self):
+        for max_passes in (2, 3, 4):
+            encodes = self.count_encodes()
+            _, passes = b2_utils.compress_image(make_noise(), target_size=5000, max_passes=max_passes)
+            self.assertEqual(passes, len(encodes))
+            self.assertLessEqual(passes, max_passes)
+
+    @override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE, IMAGE_POOL_SIZE=0)
+    def test_pass_count_is_stored(self):
+        fields = b2_utils.converter_to_webP(make_upload(size=(640, 480)))
+        self.assertEqual(fields["encode_passes"], 1)
+        with override_settings(IMAGE_JOBS_ASYNC=False):
+            file = submit_image(make_upload(size=(640, 480)))
+        self.assertEqual(FileModel.objects.get(pk=file.pk).encode_passes, 1)
+
+
+@override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+class ResponsiveVariantTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+
+    def test_variants_are_uploaded_for_narrower_widths(self):
+        fields = b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        self.assertEqual([v["width"] for v in fields["variants"]], [320, 640])
+        self.assertEqual(fields["variants"][0]["height"], 240)
+        self.assertEqual(fields["width"], 1000)
+        self.assertEqual(len(self.storage.files), 3)
+
+        file = FileModel(id="1", category="image", **fields)
+        self.assertTrue(file.srcset().endswith(f"{fields['url']} 1000w"))
+        b2_utils.delete_stored_file(file)
+        process_deletions()
+        self.assertEqual(self.storage.files, {})
+
+    def test_downscaled_variant_reports_its_encoded_size(self):
+        # Noise does not fit the size budget at 1280px, so it is encoded smaller
+        rendition = b2_utils.encode_variant(make_noise((1280, 960)))
+        size = stored_size(rendition["data"].getvalue())
+        self.assertLess(size[0], 1280)
+        self.assertEqual((rendition["width"], rendition["height"]), size)
+        self.assertEqual(rendition["data"].tell(), 0)
+
+    def test_failed_variant_upload_cleans_up(self):
+        upload = self.storage.upload
+
+        def flaky_upload(data, file_name):
+            if stored_size(data)[0] == 320:
+                raise OSError("down")
+            return upload(data, file_name)
+
+        with mock.patch.object(self.storage, "upload", side_effect=flaky_upload):
+            with self.assertRaises(ValidationError):
+                b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        process_deletions()
+        self.assertEqual(self.storage.files, {})
+
+
+@override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+class ObjectNameTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+
+    def test_names_come_from_the_stored_bytes(self):
+        fields = b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        for stored in [fields] + fields["variants"]:
+            data = self.storage.files[stored["file_id"]][1]
+            self.assertEqual(stored["name"], b2_utils.object_name(data, ".webp"))
+            self.assertNotIn("dog", stored["name"])
+
+    def test_same_file_name_does_not_collide(self):
+        first = b2_utils.converter_to_webP(make_upload("photo.png", (400, 300)))
+        second = b2_utils.converter_to_webP(make_upload("photo.png", (300, 400)))
+        self.assertNotEqual(first["name"], second["name"])
+        self.assertNotEqual(first["url"], second["url"])
+
+    def test_b2_objects_are_served_as_immutable(self):
+        storage = B2Storage()
+        bucket = mock.Mock()
+        bucket.upload.return_value = mock.Mock(id_="1", file_name="a.webp")
+        with mock.patch(
+            "backblaze.utils.storage.initialize_b2api", return_value=(bucket, "b")
+        ):
+            storage.upload(b"data", "a.webp")
+        self.assertIn("immutable", bucket.upload.call_args.kwargs["cache_control"])
+
+
+@override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+class ImageMetadataTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+
+    def test_conversion_records_size_type_and_placeholder(self):
+        fields = b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        data = self.storage.files[fields["file_id"]][1]
+        self.assertEqual(fields["byte_size"], len(data))
+        self.assertEqual(fields["mime_type"], "image/webp")
+        self.assertEqual(fields["variants"][0]["bytes"],
+                         len(self.storage.files[fields["variants"][0]["file_id"]][1]))
+
+        prefix = "data:image/webp;base64,"
+        self.assertTrue(fields["placeholder"].startswith(prefix))
+        self.assertLess(len(fields["placeholder"]), 400)
+        placeholder = Image.open(BytesIO(b64decode(fields["placeholder"][len(prefix):])))
+        self.assertEqual(placeholder.size, (16, 12))
+
+    def test_serializer_exposes_metadata(self):
+        fields = b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        data = FileSerializer(FileModel(id="1", category="image", **fields)).data
+        for key in ("width", "height", "byte_size", "mime_type", "placeholder"):
+            self.assertEqual(data[key], fields[key])
+
+    def test_svg_metadata(self):
+        svg = b'<svg xmlns="http://www.w3.org/2000/svg" width="40" height="20"/>'
+        fields = b2_utils.store_svg(SimpleUploadedFile("logo.svg", svg))
+        self.assertEqual(fields["mime_type"], "image/svg+xml")
+        self.assertEqual(fields["byte_size"], len(self.storage.files[fields["file_id"]][1]))
+
+    def test_backfill_command(self):
+        fields = b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        for key in ("byte_size", "mime_type", "placeholder"):
+            fields.pop(key)
+        file = FileModel.objects.create(id="1", category="image", **fields)
+        call_command("backfill_image_metadata", stdout=StringIO())
+        file.refresh_from_db()
+        self.assertEqual(file.byte_size, len(self.storage.files[file.file_id][1]))
+        self.assertEqual(file.mime_type, "image/webp")
+        self.assertTrue(file.placeholder.startswith("data:image/webp;base64,"))
+
+
+@override_settings(IMAGE_JOBS_ASYNC=False, IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+class DeduplicationTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+
+    def test_identical_upload_reuses_file(self):
+        first = submit_image(make_upload())
+        objects = len(self.storage.files)
+        with mock.patch("backblaze.utils.image_jobs.converter_to_webP") as converter:
+            second = submit_image(make_upload(name="copy.png"))
+        converter.assert_not_called()
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(len(self.storage.files), objects)
+        self.assertEqual(FileModel.objects.count(), 1)
+
+    def test_reused_file_is_locked(self):
+        first = submit_image(make_upload())
+        with mock.patch(
+            "django.db.models.query.QuerySet.select_for_update",
+            autospec=True,
+            side_effect=lambda queryset, **kwargs: queryset,
+        ) as select_for_update:
+            self.assertEqual(submit_image(make_upload(name="copy.png")).pk, first.pk)
+            self.assertEqual(submit_images([make_upload(name="other.png")])[0][0].pk, first.pk)
+        self.assertEqual(select_for_update.call_count, 2)
+        self.assertTrue(
+            all(call.args[0].model is FileModel for call in select_for_update.call_args_list)
+        )
+
+    def test_shared_file_is_deleted_with_last_reference(self):
+        file = submit_image(make_upload())
+        first = Partners.objects.create(name="a", website="https://a.com", logo=file)
+        second = Partners.objects.create(name="b", website="https://b.com", logo=file)
+        self.assertEqual(file.reference_count(), 2)
+
+        first.delete()
+        self.assertFalse(b2_utils.release_file(file))
+        self.assertIn(file.file_id, self.storage.files)
+
+        second.delete()
+        self.assertTrue(b2_utils.release_file(file))
+        self.assertFalse(FileModel.objects.filter(pk=file.pk).exists())
+        process_deletions()
+        self.assertEqual(self.storage.files, {})
+
+
+@override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+class StorageDeletionTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+
+    def make_file(self):
+        stored = self.storage.upload(b"webp", "dog.webp")
+        return FileModel.objects.create(
+            id="1", name=stored.file_name, file_id=stored.id_, category="image")
+
+    def test_release_queues_deletion_without_calling_storage(self):
+        file = self.make_file()
+        with mock.patch.object(self.storage, "delete") as delete:
+            self.assertTrue(b2_utils.release_file(file))
+        delete.assert_not_called()
+        deletion = StorageDeletion.objects.get()
+        self.assertEqual((deletion.file_id, deletion.file_name), (file.file_id, "dog.webp"))
+
+    def test_rolled_back_release_queues_nothing(self):
+        file = self.make_file()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                b2_utils.release_file(file)
+                raise RuntimeError
+        self.assertTrue(FileModel.objects.filter(pk=file.pk).exists())
+        self.assertFalse(StorageDeletion.objects.exists())
+
+    def test_worker_deletes_by_stored_name(self):
+        b2_utils.release_file(self.make_file())
+        with mock.patch.object(self.storage, "info", side_effect=AssertionError):
+            self.assertEqual(process_deletions(), 1)
+        self.assertEqual(self.storage.files, {})
+        self.assertFalse(StorageDeletion.objects.exists())
+
+    def test_failed_deletion_is_retried_with_backoff(self):
+        b2_utils.release_file(self.make_file())
+        with mock.patch.object(self.storage, "delete", side_effect=OSError("down")):
+            process_deletions()
+        deletion = StorageDeletion.objects.get()
+        self.assertEqual(deletion.attempts, 1)
+        self.assertEqual(deletion.error, "down")
+        # Not due yet
+        self.assertEqual(process_deletions(), 0)
+
+        StorageDeletion.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_deletions(), 1)
+        self.assertFalse(StorageDeletion.objects.exists())
+        self.assertEqual(self.storage.files, {})
+
+    def test_deletion_gives_up_after_max_attempts(self):
+        b2_utils.release_file(self.make_file())
+        StorageDeletion.objects.update(attempts=deletions.MAX_ATTEMPTS)
+        self.assertEqual(process_deletions(), 0)
+        self.assertEqual(StorageDeletion.objects.count(), 1)
+
+
+class B2StorageTests(TestCase):
+    def test_client_is_authorized_lazily_once(self):
+        storage = B2Storage()
+        bucket = mock.Mock()
+        with mock.patch(
+            "backblaze.utils.storage.initialize_b2api", return_value=(bucket, "b")
+        ) as initialize:
+            self.assertIs(storage.get_bucket(), bucket)
+            self.assertIs(storage.get_bucket(), bucket)
+        initialize.assert_called_once()
+
+    def test_rejected_token_reauthorizes_and_retries(self):
+        storage = B2Storage()
+        expired, fresh = mock.Mock(), mock.Mock()
+        expired.upload.side_effect = InvalidAuthToken("expired", "bad_auth_token")
+        fresh.upload.return_value = mock.Mock(id_="1", file_name="dog.webp")
+        with mock.patch(
+            "backblaze.utils.storage.initialize_b2api",
+            side_effect=[(expired, "b"), (fresh, "b")],
+        ):
+            stored = storage.upload(memoryview(b"data"), "dog.webp")
+        self.assertEqual((stored.id_, stored.file_name), ("1", "dog.webp"))
+        upload_source, file_name = fresh.upload.call_args.args
+        self.assertEqual(file_name, "dog.webp")
+        self.assertEqual(upload_source.open().read(), b"data")
+
+    def test_listing_skips_non_upload_versions(self):
+        storage = B2Storage()
+        bucket = mock.Mock(id_="bucket")
+        bucket.api.session.list_file_versions.return_value = {
+            "files": [
+                {"fileId": "1", "fileName": "a.webp", "action": "upload", "uploadTimestamp": 5000},
+                {"fileId": "2", "fileName": "b.webp", "action": "hide", "uploadTimestamp": 6000},
+            ],
+            "nextFileName": "c.webp",
+            "nextFileId": "3",
+        }
+        with mock.patch(
+            "backblaze.utils.storage.initialize_b2api", return_value=(bucket, "b")
+        ):
+            files, cursor = storage.list(cursor=["a.webp", "1"], limit=2)
+        bucket.api.session.list_file_versions.assert_called_once_with("bucket", "a.webp", "1", 2)
+        self.assertEqual([(f.id_, f.file_name, f.uploaded_at) for f in files], [("1", "a.webp", 5)])
+        self.assertEqual(cursor, ["c.webp", "3"])
+
+
+class LocalStorageTests(TestCase):
+    def test_upload_info_delete_roundtrip(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, MEDIA_URL="/media/"):
+                storage = LocalStorage()
+                stored = storage.upload(memoryview(b"webp"), "dog.webp")
+                path = os.path.join(media_root, "images", stored.id_)
+                with open(path, "rb") as file:
+                    self.assertEqual(file.read(), b"webp")
+                self.assertEqual(storage.info(stored.id_).file_name, stored.file_name)
+                self.assertEqual(
+                    storage.url(stored.file_name), f"/media/images/{stored.file_name}"
+                )
+                storage.delete(stored.id_, stored.file_name)
+                self.assertFalse(os.path.exists(path))
+
+    def test_listing_pages_through_all_files(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                storage = LocalStorage()
+                ids = {storage.upload(b"webp", f"dog{i}.webp").id_ for i in range(5)}
+                listed, cursor = [], None
+                while True:
+                    files, cursor = storage.list(cursor=cursor, limit=2)
+                    listed.extend(stored.id_ for stored in files)
+                    if cursor is None:
+                        break
+                self.assertEqual(sorted(listed), sorted(ids))
+
+
+@override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+        self.kept = self.storage.upload(b"webp", "kept.webp")
+        self.variant = self.storage.upload(b"webp", "kept-320w.webp")
+        FileModel.objects.create(
+            id="1", name="kept.webp", file_id=self.kept.id_, category="image",
+            variants=[{"file_id": self.variant.id_, "name": "kept-320w.webp"}],
+        ).record_variants()
+        self.orphans = {self.storage.upload(b"webp", f"orphan{i}.webp").id_ for i in range(3)}
+
+    def test_reports_unreferenced_objects(self):
+        found = []
+        state = reconcile(min_age=0, page_size=2, on_orphan=lambda stored: found.append(stored.id_))
+        self.assertEqual(set(found), self.orphans)
+        self.assertEqual((state["scanned"], state["orphans"], state["deleted"]), (5, 3, 0))
+        self.assertEqual(len(self.storage.files), 5)
+
+    def test_deletes_only_orphans(self):
+        state = reconcile(delete=True, min_age=0)
+        self.assertEqual(state["deleted"], 3)
+        self.assertEqual(set(self.storage.files), {self.kept.id_, self.variant.id_})
+
+    def test_recent_objects_are_not_orphans(self):
+        self.assertEqual(reconcile(min_age=3600)["orphans"], 0)
+
+    @override_settings(IMAGE_JOBS_ASYNC=False, IMAGE_POOL_SIZE=0)
+    def test_converted_variants_are_kept(self):
+        submit_image(make_upload(size=(1200, 900)))
+        submit_images([make_upload("other.png", size=(800, 600))])
+        self.assertGreater(StoredVariant.objects.count(), 2)
+        self.assertEqual(reconcile(min_age=0)["orphans"], 3)
+
+    def test_page_lookups_do_not_read_variant_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            reconcile(min_age=0, page_size=2)
+        self.assertFalse(any('"variants"' in query["sql"] for query in queries))
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        list_page = self.storage.list
+        calls = []
+
+        def flaky_list(cursor=None, limit=1000):
+            calls.append(cursor)
+            if len(calls) == 2:
+                raise OSError("connection reset")
+            return list_page(cursor=cursor, limit=limit)
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "reconcile.json")
+            with mock.patch.object(self.storage, "list", side_effect=flaky_list):
+                with self.assertRaises(OSError):
+                    reconcile(delete=True, min_age=0, page_size=2, checkpoint=checkpoint)
+                state = reconcile(delete=True, min_age=0, page_size=2, checkpoint=checkpoint)
+            self.assertFalse(os.path.exists(checkpoint))
+        # The resumed run started from the saved cursor, not from the beginning
+        self.assertEqual(calls[2], calls[1])
+        self.assertEqual((state["scanned"], state["deleted"]), (5, 3))
+        self.assertEqual(set(self.storage.files), {self.kept.id_, self.variant.id_})
+
+
+@override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE, IMAGE_POOL_SIZE=0)
+class UploadMemoryTests(TestCase):
+    """
+    The pipeline should pass one buffer from decode to upload. Pillow's own
+    pixel copy during encoding (about 2x the raw pixels) is the only large
+    allocation allowed. Encoding runs inline so tracemalloc can see it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.size = (1600, 1200)
+        noise = Image.frombytes("RGB", cls.size, os.urandom(1600 * 1200 * 3))
+        byte_arr = BytesIO()
+        noise.save(byte_arr, format="JPEG", quality=90)
+        cls.source = byte_arr.getvalue()
+
+    def setUp(self):
+        get_storage().clear()
+
+    def measure_peak(self, function, *args):
+        tracemalloc.start()
+        try:
+            function(*args)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_read_file_does_not_copy_the_upload(self):
+        upload = SimpleUploadedFile("dog.jpg", self.source)
+        peak = self.measure_peak(b2_utils.read_file, upload)
+        self.assertLess(peak, len(self.source) // 4)
+
+    def test_upload_does_not_copy_the_encoded_buffer(self):
+        byte_arr = BytesIO(os.urandom(1500000))
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                IMAGE_STORAGE_BACKEND="backblaze.utils.storage.LocalStorage",
+            ):
+                peak = self.measure_peak(
+                    b2_utils.upload_to_backblaze, byte_arr
+                )
+        self.assertLess(peak, 1500000 // 4)
+
+    def test_conversion_peak_is_bounded_by_the_encoder(self):
+        # Warm up lazy imports and plugin registration so only the pipeline is measured
+        b2_utils.converter_to_webP(SimpleUploadedFile("dog.jpg", self.source))
+        upload = SimpleUploadedFile("dog.jpg", self.source)
+        peak = self.measure_peak(b2_utils.converter_to_webP, upload)
+        raw_pixels = self.size[0] * self.size[1] * 3
+        self.assertLess(peak, 2.5 * raw_pixels)
+
+
+class ReducedDecodeTests(TestCase):
+    def make_jpeg(self, size=(2000, 1500)):
+        return make_upload(name="dog.jpg", size=size, fmt="JPEG")
+
+    @override_settings(IMAGE_MAX_DIMENSION=500)
+    def test_large_jpeg_is_decoded_in_draft_mode(self):
+        with mock.patch.object(
+            JpegImageFile, "draft", autospec=True, side_effect=JpegImageFile.draft
+        ) as draft:
+            image = b2_utils.read_file(self.make_jpeg())
+        draft.assert_called_once()
+        self.assertEqual(image.size, (500, 375))
+        self.assertEqual(image.mode, "RGB")
+
+    @override_settings(IMAGE_MAX_DIMENSION=500)
+    def test_small_image_is_left_alone(self):
+        image = b2_utils.read_file(self.make_jpeg(size=(400, 300)))
+        self.assertEqual(image.size, (400, 300))
+
+    @override_settings(IMAGE_MAX_PIXELS=1000000)
+    def test_pixel_ceiling_rejects_before_decoding(self):
+        upload = self.make_jpeg()
+        with mock.patch.object(Image.Image, "load") as load:
+            with self.assertRaises(ValidationError):
+                b2_utils.read_file(upload)
+        load.assert_not_called()
+
+
+
+class ImageValidationTests(TestCase):
+    def test_matching_uploads_pass_and_stay_rewound(self):
+        for name, fmt in (("dog.png", "PNG"), ("dog.jpg", "JPEG"), ("dog.webp", "WEBP")):
+            upload = make_upload(name=name, fmt=fmt)
+            image_validation(upload)
+            self.assertEqual(upload.tell(), 0)
+
+    def test_content_must_match_extension(self):
+        for upload in (
+            make_upload(name="dog.jpg", fmt="PNG"),
+            SimpleUploadedFile("dog.png", b"MZ\x90\x00 not an image"),
+            SimpleUploadedFile("dog.ios", b"<svg xmlns='http://www.w3.org/2000/svg'/>"),
+        ):
+            with self.assertRaises(ValidationError):
+                image_validation(upload)
+
+    def test_truncated_header_is_rejected(self):
+        data = make_upload().read()[:20]
+        with self.assertRaises(ValidationError):
+            image_validation(SimpleUploadedFile("dog.png", data))
+
+    @override_settings(IMAGE_MAX_PIXELS=10000)
+    def test_too_many_pixels_rejected_from_header(self):
+        upload = make_upload(size=(200, 200))
+        with mock.patch.object(Image.Image, "load") as load:
+            with self.assertRaises(ValidationError):
+                image_validation(upload)
+        load.assert_not_called()
+
+    @override_settings(IMAGE_MAX_SIDE=1000)
+    def test_long_side_rejected_from_header(self):
+        with self.assertRaises(ValidationError):
+            image_validation(make_upload(size=(1200, 10)))
+
+    def test_decompression_bomb_rejected(self):
+        upload = make_upload(size=(100, 100))
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            with self.assertRaises(ValidationError):
+                image_validation(upload)
+
+    @override_settings(IMAGE_SVG_PASSTHROUGH=False, IMAGE_MAX_SIDE=1000)
+    def test_rasterized_svg_size_is_checked(self):
+        svg = b'<svg xmlns="http://www.w3.org/2000/svg" width="5000" height="10"/>'
+        with self.assertRaises(ValidationError):
+            image_validation(SimpleUploadedFile("logo.svg", svg))
+
+
+UNSAFE_SVG = b"""<?xml version="1.0"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+     width="120px" height="60" inkscape:version="1.0" onload="alert(1)">
+  <!-- comment -->
+  <script>alert(1)</script>
+  <style>@import url(https://evil.example/a.css);</style>
+  <foreignObject><body xmlns="http://www.w3.org/1999/xhtml">x</body></foreignObject>
+  <defs><linearGradient id="g"><stop offset="0"/></linearGradient></defs>
+  <rect width="10" height="10" fill="url(#g)" onclick="steal()"/>
+  <image xlink:href="https://evil.example/track.png" width="1" height="1"/>
+  <a href="javascript:alert(1)"><circle r="4" style="fill:url(https://evil.example/x)"/></a>
+  <use href="#g"/>
+</svg>"""
+
+
+@override_settings(IMAGE_JOBS_ASYNC=False, IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+class SvgTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+
+    def test_sanitize_strips_scripts_and_external_references(self):
+        clean = sanitize_svg(UNSAFE_SVG).decode()
+        for unsafe in ("script", "alert", "onload", "onclick", "evil.example",
+                       "foreignObject", "inkscape", "<!--", "javascript"):
+            self.assertNotIn(unsafe, clean)
+        self.assertIn('fill="url(#g)"', clean)
+        self.assertIn('<use href="#g"/>', clean)
+        self.assertNotIn("\n", clean)
+        self.assertEqual(svg_size(sanitize_svg(UNSAFE_SVG)), (120, 60))
+
+    def test_obfuscated_and_animated_payloads_are_removed(self):
+        payloads = [
+            '<a href="#x"><set attributeName="href" to="java&#9;script:alert(1)"/></a>',
+            '<a href="#x"><animate attributeName="href" values="java&#10;script:alert(1)"/></a>',
+            '<animateMotion path="M0 0"><mpath href="#x"/></animateMotion>',
+            '<a href="java&#9;script:alert(1)"><rect width="1" height="1"/></a>',
+            '<a xlink:href=" &#x200B;javascript:alert(1)"><rect width="1" height="1"/></a>',
+            '<style>@\\69mport "https://evil.example/a.css";</style>',
+            '<style>@im\\port "https://evil.example/a.css";</style>',
+            '<rect style="fill:u\\rl(https://evil.example/x)" width="1" height="1"/>',
+            '<rect style="fill:url( \'https://evil.example/x\' )" width="1" height="1"/>',
+            '<rect fill="url(&#9;https://evil.example/x)" width="1" height="1"/>',
+            '<rect data-x="1" formaction="javascript:alert(1)" width="1" height="1"/>',
+            '<image href="https://evil.example/track.png" width="1" height="1"/>',
+        ]
+        for payload in payloads:
+            data = (
+                '<svg xmlns="http://www.w3.org/2000/svg" '
+                f'xmlns:xlink="http://www.w3.org/1999/xlink">{payload}</svg>'
+            ).encode()
+            clean = sanitize_svg(data).decode()
+            for unsafe in ("script", "evil.example", "<set", "<animate", "mport",
+                           "formaction", "data-x", "<image"):
+                self.assertNotIn(unsafe, clean, payload)
+
+    def test_presentational_markup_is_kept(self):
+        data = (
+            b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10">'
+            b'<style>.a{fill:#f00}</style>'
+            b'<defs><radialGradient id="r"><stop offset="1" stop-color="#000"/></radialGradient>'
+            b'<filter id="f"><feGaussianBlur stdDeviation="1"/></filter></defs>'
+            b'<g class="a" transform="scale(2)"><path d="M0 0h5" stroke="url(#r)" filter="url(#f)"/>'
+            b'<text x="1" y="9" font-family="Arial">Dog</text></g></svg>'
+        )
+        self.assertEqual(sanitize_svg(data), data)
+
+    def test_rejects_entities_and_non_svg_documents(self):
+        billion_laughs = (
+            b'<?xml version="1.0"?><!DOCTYPE svg [<!ENTITY a "aaaa">]>'
+            b'<svg xmlns="http://www.w3.org/2000/svg">&a;</svg>'
+        )
+        for data in (billion_laughs, b"<html/>", b"not xml"):
+            with self.assertRaises(ValidationError):
+                sanitize_svg(data)
+
+    def test_svg_upload_is_stored_as_vector(self):
+        upload = SimpleUploadedFile("logo.svg", UNSAFE_SVG)
+        with mock.patch.object(b2_utils, "svg2png", side_effect=AssertionError):
+            file = submit_image(upload)
+        self.assertEqual(file.status, FileModel.READY)
+        self.assertTrue(file.name.endswith(".svg"))
+        self.assertEqual((file.width, file.height, file.variants), (120, 60, []))
+        _, data = self.storage.files[file.file_id]
+        self.assertEqual(data, sanitize_svg(UNSAFE_SVG))
+
+    @override_settings(IMAGE_SVG_PASSTHROUGH=False)
+    def test_rasterizing_without_cairo_is_a_validation_error(self):
+        with mock.patch.object(b2_utils, "svg2png", None):
+            with self.assertRaises(ValidationError):
+                submit_image(SimpleUploadedFile("logo.svg", UNSAFE_SVG))
+        self.assertFalse(FileModel.objects.exists())
+
+
+@override_settings(IMAGE_POOL_SIZE=1)
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class EncodingPoolTests(TestCase):
+    def setUp(self):
+        self.pool = EncodingPool()
+        self.addCleanup(self.pool.shutdown)
+
+    def test_job_runs_in_another_process(self):
+        self.assertNotEqual(self.pool.run(os.getpid), os.getpid())
+        stats = self.pool.stats()
+        self.assertEqual((stats["completed"], stats["in_flight"], stats["queued"]), (1, 0, 0))
+
+    def test_timeout_raises_and_pool_recovers(self):
+        with self.assertRaises(ValidationError):
+            self.pool.run(time.sleep, 5, timeout=0.2)
+        self.assertEqual(self.pool.stats()["timeouts"], 1)
+        # The busy process was abandoned, new jobs get a fresh one
+        self.assertEqual(self.pool.run(pow, 2, 10, timeout=5), 1024)
+
+    @override_settings(IMAGE_POOL_SIZE=2)
+    def test_timeout_keeps_other_jobs_and_stops_the_stuck_one(self):
+        outcomes = {}
+
+        def call(name, seconds, timeout):
+            try:
+                outcomes[name] = self.pool.run(time.sleep, seconds, timeout=timeout)
+            except Exception as e:
+                outcomes[name] = e
+
+        # The stuck job runs, another caller's job runs next to it and a third
+        # waits in the queue when the stuck one times out
+        threads = [
+            threading.Thread(target=call, args=("stuck", 30, 1)),
+            threading.Thread(target=call, args=("running", 1.5, 10)),
+            threading.Thread(target=call, args=("queued", 0.1, 10)),
+        ]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.3)
+        pids = self.pool.get_executor().pids()
+        for thread in threads:
+            thread.join()
+
+        self.assertIsInstance(outcomes["stuck"], ValidationError)
+        self.assertEqual((outcomes["running"], outcomes["queued"]), (None, None))
+        self.assertEqual(len(pids), 2)
+        deadline = time.monotonic() + 5
+        while any(map(is_running, pids)) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(any(map(is_running, pids)))
+
+    @override_settings(IMAGE_POOL_SIZE=0)
+    def test_size_zero_runs_inline(self):
+        self.assertEqual(self.pool.run(os.getpid), os.getpid())
+
+    @override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+    def test_conversion_uses_the_pool(self):
+        get_storage().clear()
+        with mock.patch.object(b2_utils, "pool", self.pool):
+            fields = b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        self.assertEqual(self.pool.stats()["completed"], 1)
+        self.assertEqual((fields["width"], fields["height"]), (1000, 750))
+        self.assertEqual([variant["width"] for variant in fields["variants"]], [320, 640])
+
+
+class BenchmarkTests(TestCase):
+    def test_corpus_is_deterministic(self):
+        first = generate_corpus(sizes=(64,))
+        self.assertEqual(first, generate_corpus(sizes=(64,)))
+        self.assertEqual({case["format"] for case in first}, {"JPEG", "PNG", "SVG"})
+
+    def test_reports_metrics_per_input(self):
+        corpus = generate_corpus(sizes=(64,))
+        cases = [corpus[0], corpus[-1]]
+        results = run_benchmark(cases, repeat=2)
+        self.assertEqual([result["name"] for result in results], [case["name"] for case in cases])
+        raster, vector = results
+        self.assertNotIn("error", raster)
+        self.assertEqual(raster["pipeline"], "webp")
+        self.assertGreaterEqual(raster["encode_passes"], 1)
+        for key in ("convert_seconds", "peak_traced_bytes", "output_bytes", "compression_ratio"):
+            self.assertGreater(raster[key], 0)
+        self.assertEqual(vector["pipeline"], "svg")
+        self.assertNotIn("encode_passes", vector)
+
+
+@override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE, IMAGE_POOL_SIZE=0)
+class BulkSubmitTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+
+    def make_uploads(self):
+        return [
+            make_upload("a.png", size=(300, 200)),
+            make_upload("b.txt"),
+            make_upload("c.png", size=(200, 300)),
+            make_upload("a-again.png", size=(300, 200)),
+        ]
+
+    def count_file_inserts(self, queries):
+        return sum(
+            query["sql"].startswith('INSERT INTO "backblaze_filemodel"')
+            for query in queries
+        )
+
+    @override_settings(IMAGE_JOBS_ASYNC=False)
+    def test_converts_and_inserts_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = submit_images(self.make_uploads())
+        self.assertEqual(self.count_file_inserts(queries.captured_queries), 1)
+        (a, a_error), (b, b_error), (c, c_error), (again, again_error) = results
+        self.assertIsNone(a_error)
+        self.assertIsNone(b)
+        self.assertIsInstance(b_error, ValidationError)
+        self.assertEqual((c.width, c.height, c.status), (200, 300, FileModel.READY))
+        self.assertEqual(again.pk, a.pk)
+        self.assertEqual(FileModel.objects.count(), 2)
+        self.assertEqual(len(self.storage.files), 2)
+
+    @override_settings(IMAGE_JOBS_ASYNC=True)
+    def test_async_queues_one_job_per_new_file(self):
+        existing = submit_image(make_upload("c.png", size=(200, 300)))
+        with CaptureQueriesContext(connection) as queries:
+            results = submit_images(self.make_uploads())
+        self.assertEqual(self.count_file_inserts(queries.captured_queries), 1)
+        self.assertEqual(results[2][0].pk, existing.pk)
+        self.assertEqual(results[0][0].status, FileModel.PENDING)
+        self.assertEqual(ImageJob.objects.count(), 2)
+
+    @override_settings(IMAGE_JOBS_ASYNC=False)
+    def test_failed_conversion_is_reported_per_file(self):
+        real_upload = self.storage.upload
+
+        def failing_upload(data, file_name):
+            # c.png is the only portrait upload
+            if stored_size(data) == (200, 300):
+                raise OSError("down")
+            return real_upload(data, file_name)
+
+        with mock.patch.object(self.storage, "upload", side_effect=failing_upload):
+            results = submit_images(self.make_uploads())
+        self.assertIsNotNone(results[0][0])
+        self.assertIsNone(results[2][0])
+        self.assertIn("down", str(results[2][1]))
+        self.assertEqual(FileModel.objects.count(), 1)
+
+
+@override_settings(IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE, IMAGE_POOL_SIZE=0)
+class AvifTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+
+    def fake_avif(self):
+        # Pillow here has no AVIF encoder; webp bytes stand in for it
+        return mock.patch.multiple(
+            b2_utils,
+            avif_enabled=mock.Mock(return_value=True),
+            ENCODERS={"webp": b2_utils.encode_webp, "avif": b2_utils.encode_webp},
+        )
+
+    def make_file(self):
+        with self.fake_avif():
+            fields = b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        return FileModel(id="1", category="image", status=FileModel.READY, **fields)
+
+    def serialize(self, file):
+        request = APIRequestFactory().get("/")
+        return FileSerializer(file, context={"request": request}).data
+
+    def test_avif_copies_are_stored_for_every_size(self):
+        file = self.make_file()
+        self.assertEqual([r["width"] for r in file.renditions], [320, 640, 1000])
+        self.assertTrue(all(r["name"].endswith(".avif") for r in file.renditions))
+        self.assertEqual(len(self.storage.files), 6)
+        b2_utils.delete_stored_file(file)
+        process_deletions()
+        self.assertEqual(self.storage.files, {})
+
+    @override_settings(IMAGE_AVIF=False)
+    def test_avif_can_be_disabled(self):
+        fields = b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        self.assertEqual(fields["renditions"], [])
+
+    def test_serializer_lists_sources_per_format(self):
+        file = self.make_file()
+        data = self.serialize(file)
+        self.assertEqual(list(data["sources"]), ["avif", "webp"])
+        avif = data["sources"]["avif"]
+        self.assertEqual(avif["type"], "image/avif")
+        self.assertTrue(avif["url"].endswith(".avif"))
+        self.assertEqual(avif["srcset"].count(".avif"), 3)
+        self.assertIn(".avif 1000w", avif["srcset"])
+        webp = data["sources"]["webp"]
+        self.assertEqual((webp["type"], webp["url"]), ("image/webp", file.url))
+        self.assertEqual(webp["srcset"], data["srcset"])
+        # The plain fields describe the webp copy
+        self.assertEqual(data["url"], file.url)
+        self.assertEqual([v["width"] for v in data["variants"]], [320, 640])
+        self.assertNotIn(".avif", data["srcset"])
+
+    def test_files_without_avif_list_only_webp(self):
+        fields = b2_utils.converter_to_webP(make_upload(size=(1000, 750)))
+        file = FileModel(id="1", category="image", **fields)
+        self.assertEqual(list(self.serialize(file)["sources"]), ["webp"])
+
+
+@override_settings(IMAGE_JOBS_ASYNC=True, IMAGE_STORAGE_BACKEND=IN_MEMORY_STORAGE)
+class DirectUploadTests(TestCase):
+    def setUp(self):
+        self.storage = get_storage()
+        self.storage.clear()
+        # Throttle counts
+        cache.clear()
+        user = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client = APIClient()
+        self.client.force_authenticate(user=user)
+
+    def authorize(self, name="dog.png"):
+        response = self.client.post(reverse("direct_upload"), {"name": name}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def upload(self, authorization, data):
+        # The stand-in target needs no session, only the token in its URL
+        return APIClient().generic(
+            authorization["upload"]["method"],
+            authorization["upload"]["url"],
+            data,
+            content_type="application/octet-stream",
+        )
+
+    def finalize(self, token, file_id):
+        return self.client.post(
+            reverse("direct_upload_finalize"),
+            {"token": token, "file_id": file_id},
+            format="json",
+        )
+
+    def test_upload_finalize_and_convert(self):
+        authorization = self.authorize()
+        response = self.upload(authorization, make_upload().read())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.finalize(authorization["token"], response.data["fileId"])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["status"], FileModel.PENDING)
+
+        self.assertEqual(process_pending_jobs(), 1)
+        process_deletions()
+        file = FileModel.objects.get(pk=response.data["id"])
+        self.assertEqual(file.status, FileModel.READY)
+        self.assertTrue(file.content_hash)
+        # Only the converted image is left, the raw upload is gone
+        self.assertEqual(
+            {name for name, _ in self.storage.files.values()},
+            {file.name},
+        )
+
+    @override_settings(IMAGE_JOBS_ASYNC=False)
+    def test_inline_mode_converts_on_finalize(self):
+        authorization = self.authorize()
+        stored = self.upload(authorization, make_upload().read()).data
+        response = self.finalize(authorization["token"], stored["fileId"])
+        self.assertEqual(response.data["status"], FileModel.READY)
+
+    def test_finalize_rejects_other_objects_and_replays(self):
+        authorization = self.authorize()
+        other = self.storage.upload(b"data", "dog.webp")
+        response = self.finalize(authorization["token"], other.id_)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.finalize("forged", other.id_)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        stored = self.upload(authorization, make_upload().read()).data
+        self.assertEqual(self.finalize(authorization["token"], stored["fileId"]).status_code, 201)
+        self.assertEqual(self.finalize(authorization["token"], stored["fileId"]).status_code, 400)
+
+    @override_settings(IMAGE_DIRECT_UPLOAD_MAX_AGE=60)
+    def test_expired_token_is_rejected(self):
+        authorization = self.authorize()
+        later = time.time() + 61
+        with mock.patch("django.core.signing.time.time", return_value=later):
+            response = self.upload(authorization, make_upload().read())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_upload_fails_and_is_cleaned_up(self):
+        authorization = self.authorize()
+        stored = self.upload(authorization, b"not an image").data
+        file_id = self.finalize(authorization["token"], stored["fileId"]).data["id"]
+        for _ in range(MAX_ATTEMPTS):
+            process_pending_jobs()
+        process_deletions()
+        self.assertEqual(FileModel.objects.get(pk=file_id).status, FileModel.FAILED)
+        self.assertEqual(self.storage.files, {})
+
+    def test_unknown_extension_is_not_authorized(self):
+        response = self.client.post(reverse("direct_upload"), {"name": "a.exe"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_target_accepts_a_token_once(self):
+        authorization = self.authorize()
+        self.assertEqual(self.upload(authorization, make_upload().read()).status_code, 200)
+        response = self.upload(authorization, make_upload().read())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(self.storage.files), 1)
+
+    @override_settings(IMAGE_DIRECT_UPLOAD_MAX_BYTES=1000)
+    def test_rejected_upload_does_not_use_the_token(self):
+        authorization = self.authorize()
+        response = self.upload(authorization, b"x" * 1001)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.upload(authorization, b"x" * 1000).status_code, 200)
+
+    @override_settings(IMAGE_JOBS_ASYNC=False)
+    def test_finalize_is_claimed_before_converting(self):
+        authorization = self.authorize()
+        stored = self.upload(authorization, make_upload().read()).data
+        replays = []
+        submit = direct_upload.submit_stored_upload
+
+        def replay_then_submit(*args):
+            # A second finalize while the first one converts
+            replays.append(self.finalize(authorization["token"], stored["fileId"]).status_code)
+            return submit(*args)
+
+        with mock.patch.object(direct_upload, "submit_stored_upload", replay_then_submit):
+            response = self.finalize(authorization["token"], stored["fileId"])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replays, [status.HTTP_400_BAD_REQUEST])
+        self.assertEqual(FileModel.objects.count(), 1)
+
+    def test_upload_keys_are_revoked_on_finalize_and_expiry(self):
+        finalized = self.authorize()
+        # Never finalized
+        self.authorize()
+        DirectUpload.objects.update(key_id="key")
+        stored = self.upload(finalized, make_upload().read()).data
+        with mock.patch.object(self.storage, "revoke_upload_key") as revoke:
+            self.finalize(finalized["token"], stored["fileId"])
+            revoke.assert_called_once_with("key")
+            self.assertEqual(DirectUpload.objects.get(name=finalized["file_name"]).key_id, "")
+
+            revoke.reset_mock()
+            self.assertEqual(direct_upload.expire_direct_uploads(), 0)
+            later = timezone.now() + timedelta(seconds=settings.IMAGE_DIRECT_UPLOAD_MAX_AGE + 1)
+            with mock.patch("django.utils.timezone.now", return_value=later):
+                self.assertEqual(direct_upload.expire_direct_uploads(), 2)
+        revoke.assert_called_once_with("key")
+        self.assertFalse(DirectUpload.objects.exists())
+
+    def test_upload_target_is_throttled(self):
+        with mock.patch.object(
+            ScopedRateThrottle, "THROTTLE_RATES", {"direct_upload": "2/minute"}
+        ):
+            responses = [self.upload(self.authorize(), b"data") for _ in range(3)]
+        self.assertEqual(responses[-1].status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(IMAGE_DIRECT_UPLOAD_MAX_AGE=600)
+    def test_b2_authorization_uses_a_restricted_key(self):
+        storage = B2Storage()
+        bucket = mock.Mock(id_="bucket")
+        bucket.api.create_key.return_value = {
+            "applicationKeyId": "upload-key",
+            "applicationKey": "upload-secret",
+        }
+        upload_api = mock.Mock()
+        upload_api.session.get_upload_url.return_value = {
+            "uploadUrl": "https://pod.example/upload",
+            "authorizationToken": "secret",
+        }
+        with mock.patch(
+            "backblaze.utils.storage.initialize_b2api", return_value=(bucket, "b")
+        ), mock.patch("backblaze.utils.storage.B2Api", return_value=upload_api):
+            target, key_id = storage.upload_authorization("incoming/abc/a b.png", "token")
+        self.assertEqual(key_id, "upload-key")
+        key = bucket.api.create_key.call_args.kwargs
+        self.assertEqual(key["capabilities"], ["writeFiles"])
+        self.assertEqual(key["bucket_id"], "bucket")
+        self.assertEqual(key["name_prefix"], "incoming/abc/")
+        self.assertEqual(key["valid_duration_seconds"], 600)
+        upload_api.authorize_account.assert_called_once_with(
+            "production", "upload-key", "upload-secret")
+        bucket.api.session.get_upload_url.assert_not_called()
+        self.assertEqual(target["url"], "https://pod.example/upload")
+        self.assertEqual(target["headers"]["Authorization"], "secret")
+        self.assertEqual(target["headers"]["X-Bz-File-Name"], "incoming/abc/a%20b.png")
+
+    def test_b2_key_is_deleted_when_authorization_fails(self):
+        storage = B2Storage()
+        bucket = mock.Mock(id_="bucket")
+        bucket.api.create_key.return_value = {
+            "applicationKeyId": "upload-key",
+            "applicationKey": "upload-secret",
+        }
+        upload_api = mock.Mock()
+        upload_api.session.get_upload_url.side_effect = OSError("down")
+        with mock.patch(
+            "backblaze.utils.storage.initialize_b2api", return_value=(bucket, "b")
+        ), mock.patch("backblaze.utils.storage.B2Api", return_value=upload_api):
+            with self.assertRaises(OSError):
+                storage.upload_authorization("incoming/abc/a.png", "token")
+        bucket.api.delete_key.assert_called_once_with("upload-key")
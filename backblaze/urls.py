@@ -0,0 +1,35 @@
+from django.urls import path
+from backblaze.views import (
+    DirectUploadTargetView,
+    DirectUploadView,
+    EncodingPoolStatsView,
+    FileStatusView,
+)
+
+urlpatterns = [
+    path(
+        "files/<str:pk>/status",
+        FileStatusView.as_view({"get": "retrieve"}),
+        name="file_status",
+    ),
+    path(
+        "files/encoding-pool",
+        EncodingPoolStatsView.as_view({"get": "list"}),
+        name="encoding_pool_stats",
+    ),
+    path(
+        "files/direct-upload",
+        DirectUploadView.as_view({"post": "create"}),
+        name="direct_upload",
+    ),
+    path(
+        "files/direct-upload/finalize",
+        DirectUploadView.as_view({"post": "finalize"}),
+        name="direct_upload_finalize",
+    ),
+    path(
+        "files/direct-upload/<str:token>",
+        DirectUploadTargetView.as_view({"put": "upload", "post": "upload"}),
+        name="direct_upload_target",
+    ),
+]
@@ -1,86 +1,321 @@
-from b2sdk.v1 import B2Api, InMemoryAccountInfo
 from PIL import Image
-import os
-from cairosvg import svg2png
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import File
+from django.db import transaction
+import hashlib
+import logging
+import math
+from base64 import b64encode
 from io import BytesIO
 from rest_framework.exceptions import ValidationError
-from backblaze.utils.validation import image_validation
+from backblaze.utils.svg import sanitize_svg, svg_size
+from backblaze.utils.validation import check_dimensions, image_validation
+from backblaze.utils.deletions import schedule_deletions
+from backblaze.utils.encoding_pool import pool
+from backblaze.utils.storage import get_storage
+
+try:
+    # Registers the AVIF plugin on Pillow versions without built-in AVIF support
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+try:
+    from cairosvg import svg2png
+except (ImportError, OSError):
+    # cairosvg is only needed to rasterize SVGs, and fails to import without libcairo
+    svg2png = None
+
+logger = logging.getLogger(__name__)
+
 # Constants for default values
 DEFAULT_QUALITY = 80
-DEFAULT_LOSSY_QUALITY = 50
-QUALITY_STEP = 5
-LOSSY_QUALITY_STEP = 6
+MIN_QUALITY = 10
+# Stop the quality search once the bracket is narrower than this
+QUALITY_TOLERANCE = 5
+# Hard upper bound on full WebP encodes per image
+MAX_ENCODE_PASSES = 6
+# Safety margin applied to the predicted downscale factor
+SCALE_MARGIN = 0.9
+WEBP_METHOD = 4
+# libavif encoder speed, 0 (slowest, smallest) to 10
+AVIF_SPEED = 6
 TARGET_SIZE = 200000
 MIN_DIMENSION = 100
-
-# Initialize B2 API
-
-
-def initialize_b2api():
-    required_env_varibles = ['APPLICATION_KEY_ID', 'APPLICATION_KEY',
-                             'BUCKET_NAME_IMG']
-    for var in required_env_varibles:
-        if not os.environ.get(var):
-            raise ValueError(f'{var} is not set')
-    try:
-        info = InMemoryAccountInfo()
-        b2_api = B2Api(info)
-        application_key_id = os.environ.get('APPLICATION_KEY_ID')
-        application_key = os.environ.get('APPLICATION_KEY')
-        b2_api.authorize_account(
-            "production", application_key_id, application_key)
-        bucket_name = os.environ.get('BUCKET_NAME_IMG')
-        bucket = b2_api.get_bucket_by_name(bucket_name=bucket_name)
-        return bucket, bucket_name
-    except Exception as e:
-        raise ValidationError({"description":f"Помилка ініціалізація B2 API: {e}"})
+# Widths of the responsive renditions generated next to the main image
+VARIANT_WIDTHS = (320, 640, 1280)
+UPLOAD_CONCURRENCY = 4
+# Hex digits of the sha256 used in object names (128 bits)
+OBJECT_NAME_HASH_LENGTH = 32
+# Longest side and webp quality of the inline placeholder; clients blur it
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 30
 
 
-bucket, bucket_name = initialize_b2api()
+def content_hash(file_obj):
+    file_obj.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(65536), b''):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
 
 
 def read_file(file_obj):
+    """
+    Decodes the upload to an RGB image no larger than IMAGE_MAX_DIMENSION.
+    JPEGs are decoded at a reduced DCT scale (draft mode) close to that size,
+    so large photos never exist in memory at full resolution.
+    """
     file_obj.seek(0)
-    bytes_read = file_obj.read()
     if file_obj.name.endswith('.svg'):
+        if svg2png is None:
+            raise ValidationError(
+                detail={'description': 'Перетворення SVG недоступне'})
         # conver to png
-        png_data = svg2png(bytestring=bytes_read)
+        png_data = svg2png(bytestring=sanitize_svg(file_obj.read()))
         # convert to webp
-        image = Image.open(BytesIO(png_data)).convert('RGB')
+        image = Image.open(BytesIO(png_data))
     else:
-        image = Image.open(BytesIO(bytes_read)).convert('RGB')
+        # Decode straight from the upload's file handle, without reading it into memory first
+        image = Image.open(file_obj)
+    # Image.open only parsed the header, nothing has been decoded yet
+    check_dimensions(*image.size)
+
+    max_dimension = settings.IMAGE_MAX_DIMENSION
+    scale = max_dimension / max(image.size)
+    if scale < 1:
+        if image.format == 'JPEG':
+            image.draft('RGB', (math.ceil(image.width * scale),
+                                math.ceil(image.height * scale)))
+        image.thumbnail((max_dimension, max_dimension))
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    image.load()
     return image
 
 # Convert to webp
 
 
-def upload_to_backblaze(byte_arr, file_obj):
-    if byte_arr.tell() > 2097152:
-        raise ValidationError(
-            detail={'description': 'Розмір зображення не повинен перевищувати 2MB'})
-    webp_file_name = os.path.splitext(file_obj.name)[0] + '.webp'
-    file_info = bucket.upload_bytes(
-        byte_arr.getvalue(), file_name=webp_file_name)
+def object_name(data, extension):
+    """
+    Content-addressed object name: the same bytes always get the same name and
+    a name never gets different bytes, so URLs can be cached forever.
+    """
+    return hashlib.sha256(data).hexdigest()[:OBJECT_NAME_HASH_LENGTH] + extension
+
+
+def upload_to_backblaze(byte_arr, extension='.webp'):
+    # Upload a view of the encoder's buffer instead of a copy of it
+    with byte_arr.getbuffer() as data:
+        if data.nbytes > 2097152:
+            raise ValidationError(
+                detail={'description': 'Розмір зображення не повинен перевищувати 2MB'})
+        webp_file_name = object_name(data, extension)
+        storage = get_storage()
+        file_info = storage.upload(data, webp_file_name)
     webp_image_name = file_info.file_name
-    end_path = os.environ.get('END_BACKET_PATH')
     webp_image_id = file_info.id_
-    image_url = f'https://{bucket_name}.{end_path}/{webp_image_name}'
+    image_url = storage.url(webp_image_name)
 
     return webp_image_name, webp_image_id, image_url
 
 
+# Responsive variants
+
+
+def make_variants(image, max_width, widths=VARIANT_WIDTHS):
+    """
+    Downscales the decoded image to every width in `widths` narrower than
+    max_width. Each rendition is resized from the previous, larger one, so the
+    full-resolution image is only resampled once.
+    """
+    variants = []
+    source = image
+    for width in sorted(widths, reverse=True):
+        if width >= max_width:
+            continue
+        height = max(1, round(image.height * width / image.width))
+        source = source.resize((width, height), Image.LANCZOS)
+        variants.append(source)
+    return variants[::-1]
+
+
+def encode_variant(variant, fmt='webp'):
+    byte_arr, _ = compress_image(variant, fmt=fmt)
+    # compress_image may have downscaled the variant to fit; describe what was encoded
+    width, height = Image.open(byte_arr).size
+    byte_arr.seek(0)
+    return {'data': byte_arr, 'width': width, 'height': height}
+
+
+def upload_rendition(rendition, extension='.webp'):
+    name, file_id, url = upload_to_backblaze(rendition['data'], extension=extension)
+    return {'width': rendition['width'], 'height': rendition['height'],
+            'bytes': len(rendition['data'].getbuffer()),
+            'name': name, 'file_id': file_id, 'url': url}
+
+
+def make_placeholder(image):
+    """
+    A PLACEHOLDER_SIZE pixel webp of the image as a data URI, small enough to
+    inline in API responses and show while the real image loads.
+    """
+    thumbnail = image.copy()
+    thumbnail.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    byte_arr = BytesIO()
+    thumbnail.save(byte_arr, format='webp', quality=PLACEHOLDER_QUALITY)
+    return 'data:image/webp;base64,' + b64encode(byte_arr.getvalue()).decode('ascii')
+
+
+def avif_enabled():
+    # Image.SAVE is filled lazily; init() registers every available plugin
+    Image.init()
+    return settings.IMAGE_AVIF and 'AVIF' in Image.SAVE
+
+
 # Convert to webp
 
+
+def encode_renditions(file_obj):
+    """
+    Decodes an upload and encodes the main webp and its responsive variants,
+    plus AVIF copies of all of them when AVIF is enabled. Runs in the encoding
+    pool, so it returns only picklable values:
+    {'main': BytesIO, 'width', 'height', 'passes', 'placeholder',
+     'variants': [{'data', 'width', 'height'}], 'avif': [{'data', 'width', 'height'}]}.
+    """
+    image = read_file(file_obj)
+    byte_arr, passes = compress_image(image)
+    width, height = Image.open(byte_arr).size
+    byte_arr.seek(0)
+    scaled = make_variants(image, width)
+    # The narrowest variant is the cheapest source for the thumbnail
+    placeholder = make_placeholder(scaled[0] if scaled else image)
+    if image.size != (width, height):
+        # compress_image downscaled to fit; encode the AVIF copy at the same size
+        image = image.resize((width, height), Image.LANCZOS)
+    # Pillow releases the GIL while encoding, so variants encode in parallel
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as executor:
+        variants = list(executor.map(encode_variant, scaled))
+        avif = []
+        if avif_enabled():
+            avif = list(executor.map(encode_variant, scaled + [image],
+                                     ['avif'] * (len(scaled) + 1)))
+    return {'main': byte_arr, 'width': width, 'height': height,
+            'passes': passes, 'placeholder': placeholder,
+            'variants': variants, 'avif': avif}
+
+
+def encode_source(source, name):
+    """encode_renditions for the raw bytes sent to a pool process."""
+    return encode_renditions(File(BytesIO(source), name=name))
+
+
 def converter_to_webP(file_obj):
+    """
+    Converts an uploaded image to webp (and AVIF), uploads it together with its
+    responsive variants and returns the FileModel field values describing the result.
+    Decoding and encoding run in the encoding pool; this only waits for them.
+    """
     try:
         image_validation(file_obj)
-        image = read_file(file_obj)
-        byte_arr = compress_image(image)
-        return upload_to_backblaze(byte_arr, file_obj)
+        if pool.size:
+            file_obj.seek(0)
+            renditions = pool.run(encode_source, file_obj.read(), file_obj.name)
+        else:
+            renditions = encode_renditions(file_obj)
+        byte_arr = renditions['main']
+        width = renditions['width']
+        logger.info(
+            "Compressed %s to %d bytes in %d encode passes",
+            file_obj.name,
+            len(byte_arr.getbuffer()),
+            renditions['passes'],
+        )
+
+        with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as executor:
+            main = executor.submit(upload_to_backblaze, byte_arr)
+            variants = [executor.submit(upload_rendition, rendition)
+                        for rendition in renditions['variants']]
+            avif = [executor.submit(upload_rendition, rendition, '.avif')
+                    for rendition in renditions['avif']]
+        others = variants + avif
+        uploaded = [future.result() for future in others if not future.exception()]
+        if main.exception() or len(uploaded) != len(others):
+            # Do not leave half of the renditions behind in the bucket
+            if not main.exception():
+                name, file_id, _ = main.result()
+                uploaded.append({'name': name, 'file_id': file_id})
+            schedule_deletions(
+                (variant['file_id'], variant['name']) for variant in uploaded)
+            raise main.exception() or next(
+                future.exception() for future in others if future.exception())
+
+        webp_image_name, webp_image_id, image_url = main.result()
+        return {
+            'name': webp_image_name,
+            'file_id': webp_image_id,
+            'url': image_url,
+            'width': width,
+            'height': renditions['height'],
+            'byte_size': len(byte_arr.getbuffer()),
+            'mime_type': 'image/webp',
+            'placeholder': renditions['placeholder'],
+            'encode_passes': renditions['passes'],
+            'variants': [future.result() for future in variants],
+            'renditions': [dict(future.result(), format='avif') for future in avif],
+        }
     except Exception as e:
         raise ValidationError(detail={"description": f"Помилка перетвореня у webp: {e}"})
 
 
+def stores_as_vector(file_obj):
+    return file_obj.name.endswith('.svg') and settings.IMAGE_SVG_PASSTHROUGH
+
+
+def store_svg(file_obj):
+    """
+    Stores a sanitized, minified copy of an SVG upload instead of rasterizing
+    it. Returns the same FileModel field values as converter_to_webP.
+    """
+    try:
+        image_validation(file_obj)
+        file_obj.seek(0)
+        data = sanitize_svg(file_obj.read())
+        width, height = svg_size(data)
+        name, file_id, url = upload_to_backblaze(BytesIO(data), extension='.svg')
+        return {
+            'name': name,
+            'file_id': file_id,
+            'url': url,
+            'width': width,
+            'height': height,
+            'byte_size': len(data),
+            'mime_type': 'image/svg+xml',
+            'variants': [],
+        }
+    except Exception as e:
+        raise ValidationError(detail={"description": f"Помилка збереження SVG: {e}"})
+
+
+def stored_metadata(file_model):
+    """
+    Downloads the main image of a file converted before its size and
+    placeholder were recorded and returns those FileModel field values.
+    """
+    data = get_storage().download(file_model.file_id)
+    if file_model.name.endswith('.svg'):
+        return {'byte_size': len(data), 'mime_type': 'image/svg+xml'}
+    with Image.open(BytesIO(data)) as image:
+        return {
+            'byte_size': len(data),
+            'mime_type': Image.MIME.get(image.format, ''),
+            'placeholder': make_placeholder(image),
+        }
+
+
 def resize_image(image, refactor_size, min_dimension=MIN_DIMENSION):
     if image.width > min_dimension and image.height > min_dimension:
         new_width = int(image.width * refactor_size)
@@ -91,40 +326,108 @@ def resize_image(image, refactor_size, min_dimension=MIN_DIMENSION):
 # Compress image
 
 
-def compress_image(image, quality=DEFAULT_QUALITY, lossy_quality=DEFAULT_LOSSY_QUALITY,
-                   step_quality=QUALITY_STEP, step_lossy_quality=LOSSY_QUALITY_STEP,
-                   target_size=TARGET_SIZE, refactor_size=0.8):
+def encode_webp(image, quality):
+    byte_arr = BytesIO()
+    image.save(byte_arr, format="webp", quality=quality, method=WEBP_METHOD)
+    return byte_arr
+
+
+def encode_avif(image, quality):
+    byte_arr = BytesIO()
+    image.save(byte_arr, format="AVIF", quality=quality, speed=AVIF_SPEED)
+    return byte_arr
+
+
+ENCODERS = {'webp': encode_webp, 'avif': encode_avif}
+
+
+def compress_image(image, quality=DEFAULT_QUALITY, min_quality=MIN_QUALITY,
+                   target_size=TARGET_SIZE, max_passes=MAX_ENCODE_PASSES, fmt='webp'):
+    """
+    Encodes the image to WebP (or another format in ENCODERS) at the highest
+    quality that fits into target_size.
+
+    The image is first encoded at `quality`. If that is too large, it is encoded
+    at `min_quality`; while even that does not fit, the image is downscaled by a
+    factor predicted from the size overshoot (bytes grow roughly with pixel count).
+    The remaining budget is spent bisecting quality between the bounds.
+    At most `max_passes` encodes are performed.
+
+    Returns:
+        tuple: (BytesIO with the encoded image rewound to 0, number of encode passes)
+    """
     if not isinstance(image, Image.Image):
         raise ValidationError(detail={'description': 'Недійсний об’єкт зображення'})
-    byte_arr = BytesIO()
-    while byte_arr.tell() < target_size and quality >= 10:
-        
-        byte_arr.seek(0) # Reset the pointer to the beginning of the file
-        byte_arr.truncate(0) # Clear the file
-        image.save(byte_arr, format='webp', optimize=True,
-                   quality=quality, progressive=True, lossy=True, lossy_quality=lossy_quality)
-
-        if byte_arr.tell() <= target_size:
+
+    encode = ENCODERS[fmt]
+    byte_arr = encode(image, quality)
+    passes = 1
+    if byte_arr.tell() <= target_size:
+        byte_arr.seek(0)
+        return byte_arr, passes
+    del byte_arr  # do not hold the oversized encode during the next passes
+
+    # Find a scale at which the lowest acceptable quality fits
+    best = encode(image, min_quality)
+    passes += 1
+    while best.tell() > target_size and passes < max_passes:
+        refactor_size = math.sqrt(target_size / best.tell()) * SCALE_MARGIN
+        resized = resize_image(image, refactor_size)
+        if resized.size == image.size:
             break
+        image = resized
+        best = encode(image, min_quality)
+        passes += 1
 
-        image = resize_image(image, refactor_size)
-        quality -= step_quality
-        lossy_quality -= step_lossy_quality
-        refactor_size *= 0.8
-    byte_arr.seek(0)
-    return byte_arr
+    # Bisect for the highest quality that still fits
+    if best.tell() <= target_size:
+        low, high = min_quality, quality
+        while high - low > QUALITY_TOLERANCE and passes < max_passes:
+            middle = (low + high) // 2
+            candidate = encode(image, middle)
+            passes += 1
+            if candidate.tell() <= target_size:
+                low, best = middle, candidate
+            else:
+                high = middle
+
+    best.seek(0)
+    return best, passes
 
 
 # Delete file from backblaze
 
 
-def delete_file_from_backblaze(id):
-    if not id:
-        raise ValidationError(detail={'description': 'Потрібен ідентифікатор файлу'})
-    try:
-        file_info = bucket.get_file_info_by_id(file_id=id)
-        delted_file = bucket.delete_file_version(
-            file_id=file_info.id_, file_name=file_info.file_name)
-        return delted_file
-    except Exception as e:
-        raise ValidationError(detail={"description":f"Помилка при видалені: {e}"})
+def delete_stored_file(file_model):
+    """
+    Queues the bucket objects of file_model for deletion by the
+    process_storage_deletions worker.
+    """
+    # Pending or failed uploads have nothing in the bucket yet
+    if file_model is None or not file_model.file_id:
+        return None
+    objects = [(variant['file_id'], variant['name'])
+               for variant in file_model.variants + file_model.renditions]
+    objects.append((file_model.file_id, file_model.name))
+    schedule_deletions(objects)
+
+
+def release_file(file_model):
+    """
+    Deletes file_model once no row references it any more and queues its bucket
+    objects for deletion in the same transaction. Call it after the owner has
+    been deleted or pointed at another file, inside the same transaction.
+    The row lock also waits for a submit_image that is reusing the file, so
+    its new reference is counted.
+    Returns True if the file was deleted.
+    """
+    if file_model is None:
+        return False
+    with transaction.atomic():
+        # Serialize with other releases of the same shared file
+        locked = type(file_model).objects.select_for_update().filter(pk=file_model.pk)
+        if not locked.exists() or file_model.reference_count():
+            return False
+        locked.delete()
+        delete_stored_file(file_model)
+    return True
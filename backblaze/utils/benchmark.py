@@ -0,0 +1,215 @@
+"""
+Benchmark of the image conversion pipeline over a generated corpus.
+
+Every input is converted in a fresh process forked from the caller, so
+results do not depend on what ran before. Storage is in memory and encoding
+runs inline: nothing touches the network. Used by `manage.py benchmark_images`.
+"""
+from io import BytesIO
+from itertools import product
+from statistics import median
+from time import perf_counter
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import tracemalloc
+import PIL
+from PIL import Image
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from backblaze.utils import b2_utils
+from backblaze.utils.storage import get_storage
+
+FORMATS = ('JPEG', 'PNG')
+# Long side in pixels
+SIZES = (640, 1920, 4000)
+ASPECT_RATIOS = ('4:3', '16:9', '9:16')
+# 0 is a smooth gradient, 1 is pure noise
+NOISE_LEVELS = (0.0, 0.3, 1.0)
+SVG_SHAPES = (10, 100, 1000)
+SEED = 2024
+
+BENCHMARK_SETTINGS = {
+    'IMAGE_STORAGE_BACKEND': 'backblaze.utils.storage.InMemoryStorage',
+    'IMAGE_POOL_SIZE': 0,
+}
+
+
+def image_size(long_side, aspect_ratio):
+    width, height = (int(part) for part in aspect_ratio.split(':'))
+    if width >= height:
+        return long_side, round(long_side * height / width)
+    return round(long_side * width / height), long_side
+
+
+def make_raster(size, noise, rng, fmt):
+    width, height = size
+    gradient = Image.linear_gradient('L').resize(size)
+    image = Image.merge('RGB', (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT),
+                                gradient.transpose(Image.FLIP_TOP_BOTTOM)))
+    if noise:
+        static = Image.frombytes('RGB', size, rng.randbytes(width * height * 3))
+        image = Image.blend(image, static, noise)
+    byte_arr = BytesIO()
+    options = {'quality': 90} if fmt == 'JPEG' else {}
+    image.save(byte_arr, format=fmt, **options)
+    return byte_arr.getvalue()
+
+
+def make_svg(shapes, rng):
+    circles = ''.join(
+        f'<circle cx="{rng.randint(0, 400)}" cy="{rng.randint(0, 200)}" '
+        f'r="{rng.randint(2, 40)}" fill="#{rng.randrange(0x1000000):06x}"/>'
+        for _ in range(shapes)
+    )
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="400" height="200" '
+        f'viewBox="0 0 400 200">{circles}</svg>'
+    ).encode()
+
+
+def generate_corpus(sizes=SIZES, seed=SEED):
+    """
+    Returns the benchmark inputs as dicts with name, format, size, noise and
+    data. The same arguments always produce the same bytes.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for fmt, long_side, aspect_ratio, noise in product(
+            FORMATS, sizes, ASPECT_RATIOS, NOISE_LEVELS):
+        size = image_size(long_side, aspect_ratio)
+        extension = 'jpg' if fmt == 'JPEG' else 'png'
+        corpus.append({
+            'name': f'{fmt.lower()}-{size[0]}x{size[1]}-noise{noise}.{extension}',
+            'format': fmt,
+            'width': size[0],
+            'height': size[1],
+            'noise': noise,
+            'data': make_raster(size, noise, rng, fmt),
+        })
+    for shapes in SVG_SHAPES:
+        corpus.append({
+            'name': f'svg-{shapes}-shapes.svg',
+            'format': 'SVG',
+            'width': 400,
+            'height': 200,
+            'noise': None,
+            'data': make_svg(shapes, rng),
+        })
+    return corpus
+
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+def timed(function, *args):
+    start = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start
+
+
+def measure_conversion(case):
+    """
+    Runs the upload pipeline once on `case` and reports time, memory and
+    output size. Peak RSS is only available on Linux.
+    """
+    storage = get_storage()
+    storage.clear()
+    upload = SimpleUploadedFile(case['name'], case['data'])
+    vector = b2_utils.stores_as_vector(upload)
+    convert = b2_utils.store_svg if vector else b2_utils.converter_to_webP
+
+    start_rss = current_rss()
+    tracemalloc.start()
+    try:
+        fields, seconds = timed(convert, upload)
+        traced_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # ru_maxrss is in kilobytes on Linux; a forked child starts its own high-water mark
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    output_bytes = sum(len(data) for _, data in storage.files.values())
+    return {
+        'pipeline': 'svg' if vector else 'webp',
+        'convert_seconds': seconds,
+        'peak_rss_bytes': peak_rss - start_rss if start_rss is not None else None,
+        'peak_traced_bytes': traced_peak,
+        'output_width': fields['width'],
+        'output_height': fields['height'],
+        'variants': len(fields['variants']),
+        'output_bytes': output_bytes,
+    }
+
+
+def measure_stages(case):
+    """Times decode, compress_image and resize_image separately."""
+    upload = SimpleUploadedFile(case['name'], case['data'])
+    image, decode_seconds = timed(b2_utils.read_file, upload)
+    (byte_arr, passes), compress_seconds = timed(b2_utils.compress_image, image)
+    _, resize_seconds = timed(b2_utils.resize_image, image, 0.5)
+    return {
+        'decode_seconds': decode_seconds,
+        'compress_seconds': compress_seconds,
+        'encode_passes': passes,
+        'main_bytes': len(byte_arr.getbuffer()),
+        'resize_seconds': resize_seconds,
+    }
+
+
+def run_case(case):
+    result = {key: value for key, value in case.items() if key != 'data'}
+    result['input_bytes'] = len(case['data'])
+    try:
+        result.update(measure_conversion(case))
+        if result['pipeline'] == 'webp':
+            result.update(measure_stages(case))
+        result['compression_ratio'] = result['input_bytes'] / result['output_bytes']
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def run_benchmark(corpus, repeat=1):
+    """
+    Benchmarks every corpus entry `repeat` times, each run in a new process,
+    and returns one result per entry. Timings are medians over the runs,
+    memory figures are the maximum.
+    """
+    results = []
+    with override_settings(**BENCHMARK_SETTINGS):
+        # Load Pillow's plugins once so forked runs do not pay for it
+        b2_utils.compress_image(Image.new('RGB', (8, 8)))
+        # Forked, not spawned, so children inherit the configured Django settings
+        context = multiprocessing.get_context('fork')
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for case in corpus:
+                runs = [pool.apply(run_case, (case,)) for _ in range(repeat)]
+                result = runs[0]
+                for key in result:
+                    values = [run.get(key) for run in runs]
+                    if key.endswith('_seconds'):
+                        result[key] = median(values)
+                    elif key.startswith('peak_') and None not in values:
+                        result[key] = max(values)
+                results.append(result)
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'svg_passthrough': settings.IMAGE_SVG_PASSTHROUGH,
+        'max_dimension': settings.IMAGE_MAX_DIMENSION,
+        'target_size': b2_utils.TARGET_SIZE,
+    }
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+import logging
+from backblaze.models import StorageDeletion
+from backblaze.utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+# How long a claimed row stays hidden from other workers
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# Delay before the first retry, doubled on every further failure
+RETRY_DELAY = timedelta(minutes=1)
+DELETE_CONCURRENCY = 4
+
+
+def schedule_deletions(objects):
+    """
+    Queues (file_id, file_name) pairs for deletion from storage. Call it inside
+    the transaction that removes the rows pointing at the objects.
+    """
+    StorageDeletion.objects.bulk_create(
+        StorageDeletion(file_id=file_id, file_name=file_name or "")
+        for file_id, file_name in objects
+        if file_id
+    )
+
+
+def claim_deletions(limit):
+    """
+    Returns up to `limit` due deletions and hides them from other workers
+    for CLAIM_TIMEOUT. Rows locked by another worker are skipped.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        deletions = list(
+            StorageDeletion.objects.select_for_update(skip_locked=True)
+            .filter(attempts__lt=MAX_ATTEMPTS, next_attempt_at__lte=now)[:limit]
+        )
+        StorageDeletion.objects.filter(pk__in=[row.pk for row in deletions]).update(
+            attempts=F("attempts") + 1,
+            next_attempt_at=now + CLAIM_TIMEOUT,
+        )
+    return deletions
+
+
+def delete_object(deletion):
+    storage = get_storage()
+    file_name = deletion.file_name
+    if not file_name:
+        # Rows queued without a name need the lookup the stored name avoids
+        file_name = storage.info(deletion.file_id).file_name
+    storage.delete(deletion.file_id, file_name)
+
+
+def process_deletions(limit=100, concurrency=DELETE_CONCURRENCY):
+    """
+    Claims one batch of deletions and runs them in parallel. Done rows are
+    removed, failed ones are retried with exponential backoff until
+    MAX_ATTEMPTS. Returns the number of rows claimed.
+    """
+    deletions = claim_deletions(limit)
+    if not deletions:
+        return 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(delete_object, row) for row in deletions]
+
+    done = []
+    for row, future in zip(deletions, futures):
+        error = future.exception()
+        if error is None:
+            done.append(row.pk)
+            continue
+        attempts = row.attempts + 1
+        logger.warning(
+            "Deleting %s failed (attempt %d): %s", row.file_id, attempts, error
+        )
+        StorageDeletion.objects.filter(pk=row.pk).update(
+            error=str(error),
+            next_attempt_at=timezone.now() + RETRY_DELAY * 2 ** (attempts - 1),
+        )
+    StorageDeletion.objects.filter(pk__in=done).delete()
+    return len(deletions)
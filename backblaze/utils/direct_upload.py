@@ -0,0 +1,161 @@
+"""
+Uploads that go from the browser straight to storage.
+
+The admin frontend asks for an authorization, sends the raw image to the URL
+it names and then finalizes the upload with the token and the id storage
+returned. Finalizing registers a pending FileModel; the image is converted
+like any other upload. Tokens are signed and expire after
+IMAGE_DIRECT_UPLOAD_MAX_AGE seconds; each one names a single object under a
+prefix of its own. Every authorization is recorded as a DirectUpload row,
+which makes receiving and finalizing single-use across processes, until
+expire_direct_uploads removes it.
+"""
+import logging
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, ValidationError
+from backblaze.models import DirectUpload
+from backblaze.utils.deletions import schedule_deletions
+from backblaze.utils.image_jobs import submit_stored_upload
+from backblaze.utils.storage import StorageBackend, get_storage
+from backblaze.utils.validation import EXTENSION_FORMATS
+
+TOKEN_SALT = 'backblaze.direct-upload'
+# Prefix of the objects clients upload; reconcile_storage removes abandoned ones
+INCOMING_PREFIX = 'incoming/'
+
+logger = logging.getLogger(__name__)
+
+
+def authorize_upload(original_name):
+    """
+    Returns the token and the upload target (url, method, headers) for one
+    image called original_name.
+    """
+    extension = next(
+        (extension for extension in EXTENSION_FORMATS if original_name.endswith(extension)),
+        None,
+    )
+    if extension is None:
+        raise ValidationError(detail={'description': 'Недійсний формат'})
+    file_name = f'{INCOMING_PREFIX}{uuid4().hex}/source{extension}'
+    token = signing.dumps({'name': file_name, 'original': original_name}, salt=TOKEN_SALT)
+    target, key_id = get_storage().upload_authorization(file_name, token)
+    DirectUpload.objects.create(name=file_name, key_id=key_id)
+    return {
+        'token': token,
+        'file_name': file_name,
+        'expires_in': settings.IMAGE_DIRECT_UPLOAD_MAX_AGE,
+        'upload': target,
+    }
+
+
+def load_token(token):
+    """Returns the payload of a valid, unexpired token."""
+    try:
+        return signing.loads(
+            token, salt=TOKEN_SALT, max_age=settings.IMAGE_DIRECT_UPLOAD_MAX_AGE)
+    except signing.BadSignature:
+        raise ValidationError(
+            detail={'description': 'Дозвіл на завантаження недійсний або прострочений'})
+
+
+def matches(stored, file_name):
+    # LocalStorage keeps objects under its own id prefix
+    return stored.file_name == file_name or stored.file_name.endswith(f'/{file_name}')
+
+
+def finalize_upload(token, file_id):
+    """
+    Checks that file_id is the object authorized by token and registers it
+    for conversion. Returns the pending FileModel.
+    """
+    payload = load_token(token)
+    storage = get_storage()
+    try:
+        stored = storage.info(file_id)
+    except Exception:
+        raise ValidationError(detail={'description': 'Файл не знайдено у сховищі'})
+    if not matches(stored, payload['name']):
+        raise ValidationError(detail={'description': 'Файл не відповідає дозволу'})
+    # Claimed before converting, in one statement, so concurrent or later
+    # finalizes of the same token or object are rejected
+    try:
+        with transaction.atomic():
+            claimed = DirectUpload.objects.filter(
+                name=payload['name'], file_id__isnull=True
+            ).update(file_id=stored.id_)
+    except IntegrityError:
+        claimed = 0
+    if not claimed:
+        raise ValidationError(detail={'description': 'Завантаження вже завершено'})
+    revoke_key(payload['name'])
+    if stored.size is not None and stored.size > settings.IMAGE_DIRECT_UPLOAD_MAX_BYTES:
+        schedule_deletions([(stored.id_, stored.file_name)])
+        raise ValidationError(detail={'description': 'Файл занадто великий'})
+    return submit_stored_upload(stored, payload['original'])
+
+
+def receive_upload(token, stream):
+    """
+    Local stand-in for the bucket's upload endpoint: stores what the client
+    sent for token and returns the id and name, as B2 would. Each token is
+    accepted once.
+    """
+    storage = get_storage()
+    if type(storage).upload_authorization is not StorageBackend.upload_authorization:
+        # The backend hands out its own upload targets
+        raise NotFound(detail={'description': 'Не знайдено'})
+    payload = load_token(token)
+    limit = settings.IMAGE_DIRECT_UPLOAD_MAX_BYTES
+    data = stream.read(limit + 1)
+    if len(data) > limit:
+        raise ValidationError(detail={'description': 'Файл занадто великий'})
+    received = DirectUpload.objects.filter(
+        name=payload['name'], received=False
+    ).update(received=True)
+    if not received:
+        raise ValidationError(detail={'description': 'Файл уже завантажено'})
+    stored = storage.upload(data, payload['name'])
+    return {'fileId': stored.id_, 'fileName': stored.file_name}
+
+
+def revoke_key(name):
+    """
+    Revokes the storage key issued for the upload of name, if any. Failures
+    are left to expire_direct_uploads.
+    """
+    upload = DirectUpload.objects.filter(name=name).exclude(key_id='').first()
+    if upload is None:
+        return
+    try:
+        get_storage().revoke_upload_key(upload.key_id)
+    except Exception as e:
+        logger.warning('Could not revoke upload key %s: %s', upload.key_id, e)
+        return
+    DirectUpload.objects.filter(pk=upload.pk).update(key_id='')
+
+
+def expire_direct_uploads(limit=100):
+    """
+    Revokes the keys of up to `limit` uploads whose tokens have expired and
+    forgets them. Returns the number of uploads removed.
+    """
+    expired_before = timezone.now() - timedelta(seconds=settings.IMAGE_DIRECT_UPLOAD_MAX_AGE)
+    uploads = list(DirectUpload.objects.filter(created_at__lt=expired_before)[:limit])
+    storage = get_storage()
+    removed = []
+    for upload in uploads:
+        if upload.key_id:
+            try:
+                storage.revoke_upload_key(upload.key_id)
+            except Exception as e:
+                # The key expired on its own; deleting it only frees its slot
+                logger.warning('Could not revoke upload key %s: %s', upload.key_id, e)
+        removed.append(upload.pk)
+    DirectUpload.objects.filter(pk__in=removed).delete()
+    return len(removed)
@@ -0,0 +1,185 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, wait
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+import atexit
+import django
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Pool processes are started by a clean server process rather than forked
+# from a gunicorn worker, whose other threads may hold locks at fork time
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def start_process(started):
+    # Runs first in every pool process
+    started.put(os.getpid())
+    django.setup()
+
+
+class EncodingExecutor(ProcessPoolExecutor):
+    """
+    A ProcessPoolExecutor that knows the pids of its processes, so that a job
+    which overran its timeout can be stopped by terminating them.
+    """
+
+    def __init__(self, max_workers):
+        context = multiprocessing.get_context(START_METHOD)
+        self._started = context.SimpleQueue()
+        self._worker_pids = set()
+        self._pids_lock = threading.Lock()
+        super().__init__(max_workers=max_workers, mp_context=context,
+                         initializer=start_process, initargs=(self._started,))
+
+    def pids(self):
+        """Pids of the processes started so far."""
+        with self._pids_lock:
+            while not self._started.empty():
+                self._worker_pids.add(self._started.get())
+            return set(self._worker_pids)
+
+    def terminate(self):
+        """Stops every process, running jobs included, and cancels queued jobs."""
+        for pid in self.pids():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self.shutdown(wait=False, cancel_futures=True)
+
+
+class EncodingPool:
+    """
+    Process pool for CPU-bound image work, one per gunicorn worker. Callers
+    block only on the future, so the worker's other threads (gunicorn runs
+    gthread workers) and the GIL stay free while an image is being encoded.
+    The pool is created on first use and recreated after a fork. With
+    IMAGE_POOL_SIZE = 0 jobs run inline.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        # Unfinished futures of the current executor
+        self._pending = set()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    @property
+    def size(self):
+        return settings.IMAGE_POOL_SIZE
+
+    def _current_executor(self):
+        # Called with the lock held
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = EncodingExecutor(max_workers=self.size)
+            self._pid = os.getpid()
+            self._pending = set()
+        return self._executor
+
+    def get_executor(self):
+        with self._lock:
+            return self._current_executor()
+
+    def submit(self, func, *args):
+        """Submits func(*args) and returns (executor, future)."""
+        with self._lock:
+            executor = self._current_executor()
+            future = executor.submit(func, *args)
+            pending = self._pending
+            pending.add(future)
+        future.add_done_callback(lambda done: self._forget(pending, done))
+        return executor, future
+
+    def _forget(self, pending, future):
+        with self._lock:
+            pending.discard(future)
+
+    def retire(self, executor, stuck):
+        """
+        Hands new jobs to a fresh pool after `stuck` overran its timeout.
+        Other callers' jobs already in the old pool keep running there; once
+        they are done, or have overrun their own timeouts, the old processes
+        are terminated, which stops the stuck job.
+        """
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            others = self._pending - {stuck}
+            self._pending = set()
+
+        def stop():
+            wait(others, timeout=settings.IMAGE_POOL_TIMEOUT)
+            executor.terminate()
+
+        threading.Thread(target=stop, daemon=True).start()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _count(self, in_flight=0, completed=0, failed=0, timeouts=0):
+        with self._lock:
+            self.in_flight += in_flight
+            self.completed += completed
+            self.failed += failed
+            self.timeouts += timeouts
+
+    def run(self, func, *args, timeout=None):
+        """
+        Runs func(*args) in the pool and returns its result. func and its
+        arguments must be picklable. Raises ValidationError if the job does
+        not finish within `timeout` seconds (IMAGE_POOL_TIMEOUT by default).
+        """
+        if not self.size:
+            return func(*args)
+        timeout = settings.IMAGE_POOL_TIMEOUT if timeout is None else timeout
+        executor, future = self.submit(func, *args)
+        self._count(in_flight=1)
+        logger.debug("Encoding pool queue depth: %d", self.queue_depth())
+        try:
+            result = future.result(timeout=timeout)
+        except TimeoutError:
+            self._count(timeouts=1)
+            if not future.cancel():
+                self.retire(executor, future)
+            raise ValidationError(
+                detail={'description': 'Час обробки зображення вичерпано'})
+        except Exception:
+            self._count(failed=1)
+            raise
+        finally:
+            self._count(in_flight=-1)
+        self._count(completed=1)
+        return result
+
+    def queue_depth(self):
+        """Jobs waiting for a free process."""
+        return max(0, self.in_flight - self.size)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'size': self.size,
+                'in_flight': self.in_flight,
+                'queued': max(0, self.in_flight - self.size),
+                'completed': self.completed,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+            }
+
+
+pool = EncodingPool()
+atexit.register(pool.shutdown)
@@ -0,0 +1,317 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.core.files.base import File
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from backblaze.models import FileModel, ImageJob, StoredVariant
+from backblaze.signals import files_updated
+from backblaze.utils.b2_utils import (
+    content_hash,
+    converter_to_webP,
+    delete_stored_file,
+    store_svg,
+    stores_as_vector,
+)
+from backblaze.utils.deletions import schedule_deletions
+from backblaze.utils.storage import BufferReader, get_storage
+from backblaze.utils.validation import image_validation
+from rest_framework.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+# Jobs left in "processing" longer than this are assumed to belong to a dead worker
+STALE_JOB_TIMEOUT = timedelta(minutes=10)
+# Uploads of one bulk request converted at the same time
+BULK_CONCURRENCY = 4
+
+
+def submit_image(file_obj, category="image"):
+    """
+    Registers an uploaded image and schedules its conversion.
+
+    If a file with the same content hash already exists (and did not fail), it
+    is returned as is and nothing is converted or uploaded. Its row stays
+    locked until the caller's transaction ends, so call this inside the
+    transaction.atomic() that attaches the file: a concurrent release_file of
+    the same row then waits and sees the new reference. Otherwise a pending
+    FileModel is returned straight away. With IMAGE_JOBS_ASYNC the
+    source bytes are stored in an ImageJob for the `process_image_jobs` worker,
+    otherwise the conversion runs inline and the file is returned ready.
+    """
+    image_validation(file_obj)
+    source_hash = content_hash(file_obj)
+    with transaction.atomic():
+        existing = (
+            FileModel.objects.select_for_update()
+            .filter(content_hash=source_hash, category=category)
+            .exclude(status=FileModel.FAILED)
+            .first()
+        )
+    if existing is not None:
+        return existing
+
+    file_model = FileModel.objects.create(
+        id=uuid4().hex,
+        name=file_obj.name,
+        original_name=file_obj.name,
+        category=category,
+        status=FileModel.PENDING,
+        content_hash=source_hash,
+    )
+    if settings.IMAGE_JOBS_ASYNC:
+        file_obj.seek(0)
+        ImageJob.objects.create(
+            file=file_model, original_name=file_obj.name, source=file_obj.read()
+        )
+        return file_model
+
+    try:
+        process_upload(file_model, file_obj)
+    except Exception:
+        file_model.delete()
+        raise
+    return file_model
+
+
+def submit_images(files, category="image", concurrency=BULK_CONCURRENCY):
+    """
+    Bulk version of submit_image. Returns one (FileModel, error) pair per
+    upload, in order; exactly one of the two is None.
+
+    Duplicates are resolved with one query and stay locked like in
+    submit_image, so call it inside the transaction that attaches the files.
+    New files are inserted with a
+    single bulk_create: pending, with their ImageJobs, under IMAGE_JOBS_ASYNC,
+    otherwise ready, after converting up to `concurrency` uploads at a time.
+    """
+    results = [None] * len(files)
+    hashes = {}
+    for index, file_obj in enumerate(files):
+        try:
+            image_validation(file_obj)
+            hashes[index] = content_hash(file_obj)
+        except ValidationError as e:
+            results[index] = (None, e)
+
+    with transaction.atomic():
+        existing = {
+            file.content_hash: file
+            for file in FileModel.objects.select_for_update()
+            .filter(content_hash__in=set(hashes.values()), category=category)
+            .exclude(status=FileModel.FAILED)
+        }
+    # One new file per distinct content, even if it was uploaded twice
+    uploads = {}
+    for index, source_hash in hashes.items():
+        if source_hash not in existing and source_hash not in uploads:
+            uploads[source_hash] = files[index]
+    new_files = {
+        source_hash: FileModel(
+            id=uuid4().hex,
+            name=file_obj.name,
+            original_name=file_obj.name,
+            category=category,
+            status=FileModel.PENDING,
+            content_hash=source_hash,
+        )
+        for source_hash, file_obj in uploads.items()
+    }
+
+    errors = {}
+    if settings.IMAGE_JOBS_ASYNC:
+        jobs = []
+        for source_hash, file_obj in uploads.items():
+            file_obj.seek(0)
+            jobs.append(ImageJob(
+                file=new_files[source_hash],
+                original_name=file_obj.name,
+                source=file_obj.read(),
+            ))
+        with transaction.atomic():
+            FileModel.objects.bulk_create(new_files.values())
+            ImageJob.objects.bulk_create(jobs)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                source_hash: executor.submit(convert_in_thread, file_obj)
+                for source_hash, file_obj in uploads.items()
+            }
+        for source_hash, future in futures.items():
+            if future.exception():
+                errors[source_hash] = future.exception()
+                del new_files[source_hash]
+                continue
+            for field, value in future.result().items():
+                setattr(new_files[source_hash], field, value)
+            new_files[source_hash].status = FileModel.READY
+        try:
+            with transaction.atomic():
+                FileModel.objects.bulk_create(new_files.values())
+                StoredVariant.objects.bulk_create(
+                    StoredVariant(file=file_model, object_id=variant["file_id"])
+                    for file_model in new_files.values()
+                    for variant in file_model.variants + file_model.renditions
+                )
+        except Exception:
+            for file_model in new_files.values():
+                delete_stored_file(file_model)
+            raise
+
+    for index, source_hash in hashes.items():
+        if source_hash in errors:
+            results[index] = (None, errors[source_hash])
+        else:
+            results[index] = (existing.get(source_hash) or new_files[source_hash], None)
+    return results
+
+
+def submit_stored_upload(stored, original_name, category="image"):
+    """
+    Registers an image the client uploaded straight to storage (see
+    backblaze.utils.direct_upload) and schedules its conversion. The object is
+    only downloaded and validated by whoever converts it: the
+    `process_image_jobs` worker under IMAGE_JOBS_ASYNC, this call otherwise.
+    """
+    file_model = FileModel.objects.create(
+        id=uuid4().hex,
+        name=original_name,
+        original_name=original_name,
+        category=category,
+        status=FileModel.PENDING,
+    )
+    if settings.IMAGE_JOBS_ASYNC:
+        ImageJob.objects.create(
+            file=file_model,
+            original_name=original_name,
+            source_file_id=stored.id_,
+            source_name=stored.file_name,
+        )
+        return file_model
+
+    try:
+        process_stored_upload(file_model, stored.id_, stored.file_name, original_name)
+    except Exception:
+        with transaction.atomic():
+            file_model.delete()
+            schedule_deletions([(stored.id_, stored.file_name)])
+        raise
+    return file_model
+
+
+def process_stored_upload(file_model, file_id, file_name, original_name):
+    """
+    Downloads a directly uploaded source, validates and converts it, then
+    queues the source object for deletion.
+    """
+    source = File(BufferReader(get_storage().download(file_id)), name=original_name)
+    image_validation(source)
+    FileModel.objects.filter(pk=file_model.pk).update(content_hash=content_hash(source))
+    process_upload(file_model, source)
+    schedule_deletions([(file_id, file_name)])
+
+
+def convert_upload(file_obj):
+    """
+    Converts file_obj to webp, or sanitizes it if it is an SVG stored as a
+    vector, uploads it and returns the FileModel field values.
+    """
+    convert = store_svg if stores_as_vector(file_obj) else converter_to_webP
+    return convert(file_obj)
+
+
+def convert_in_thread(file_obj):
+    try:
+        return convert_upload(file_obj)
+    finally:
+        # The executor's threads open their own connections; do not leak them
+        connections.close_all()
+
+
+def process_upload(file_model, file_obj):
+    """
+    Converts file_obj to webp (SVGs are stored as sanitized vectors), uploads
+    it and marks file_model as ready.
+    """
+    fields = convert_upload(file_obj)
+    fields["status"] = FileModel.READY
+    with transaction.atomic():
+        updated = FileModel.objects.filter(pk=file_model.pk).update(**fields)
+        if updated:
+            for field, value in fields.items():
+                setattr(file_model, field, value)
+            file_model.record_variants()
+            files_updated.send(sender=FileModel, pks=[file_model.pk])
+    if not updated:
+        # The owner was deleted while we were converting
+        delete_stored_file(FileModel(**fields))
+        return None
+    return file_model
+
+
+def claim_jobs(limit):
+    """
+    Atomically moves up to `limit` pending jobs to "processing" and returns them.
+    Rows locked by another worker are skipped.
+    """
+    stale_before = timezone.now() - STALE_JOB_TIMEOUT
+    ImageJob.objects.filter(
+        status=ImageJob.PROCESSING, updated_at__lt=stale_before
+    ).update(status=ImageJob.PENDING)
+
+    with transaction.atomic():
+        jobs = list(
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ImageJob.PENDING)
+            .select_related("file")[:limit]
+        )
+        ImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=ImageJob.PROCESSING,
+            attempts=F("attempts") + 1,
+            updated_at=timezone.now(),
+        )
+    return jobs
+
+
+def process_image_job(job):
+    """
+    Runs one claimed job. Successful jobs are removed, failed ones are retried
+    until MAX_ATTEMPTS, after which the file is marked as failed.
+    """
+    attempts = job.attempts + 1
+    try:
+        if job.source_file_id:
+            process_stored_upload(
+                job.file, job.source_file_id, job.source_name, job.original_name
+            )
+        else:
+            # Read the stored source in place rather than copying it into a new buffer
+            source = File(BufferReader(job.source), name=job.original_name)
+            process_upload(job.file, source)
+    except Exception as e:
+        logger.warning("Image job %s failed (attempt %d): %s", job.pk, attempts, e)
+        status = ImageJob.PENDING if attempts < MAX_ATTEMPTS else ImageJob.FAILED
+        with transaction.atomic():
+            ImageJob.objects.filter(pk=job.pk).update(status=status, error=str(e))
+            if status == ImageJob.FAILED:
+                FileModel.objects.filter(pk=job.file_id).update(status=FileModel.FAILED)
+                files_updated.send(sender=FileModel, pks=[job.file_id])
+                if job.source_file_id:
+                    schedule_deletions([(job.source_file_id, job.source_name)])
+        return False
+    job.delete()
+    return True
+
+
+def process_pending_jobs(limit=10):
+    """
+    Claims and processes one batch of jobs. Returns the number of jobs claimed.
+    """
+    jobs = claim_jobs(limit)
+    for job in jobs:
+        process_image_job(job)
+    return len(jobs)
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import time
+from backblaze.models import FileModel, ImageJob, StorageDeletion, StoredVariant
+from backblaze.utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+DELETE_CONCURRENCY = 4
+# Objects younger than this may belong to an upload whose row is not written yet
+MIN_ORPHAN_AGE = 24 * 60 * 60
+
+
+def find_orphans(files, uploaded_before):
+    """
+    Returns the objects in `files` that no FileModel points at, as its main
+    image or through StoredVariant, ignoring ones uploaded after
+    `uploaded_before`, ones already queued for deletion and direct uploads
+    still waiting to be converted. Only the page's ids are looked up, so
+    memory does not grow with the bucket.
+    """
+    candidates = {
+        stored.id_: stored
+        for stored in files
+        if stored.uploaded_at is None or stored.uploaded_at < uploaded_before
+    }
+    known = set(
+        FileModel.objects.filter(file_id__in=candidates).values_list("file_id", flat=True)
+    )
+    known.update(
+        StoredVariant.objects.filter(object_id__in=candidates).values_list(
+            "object_id", flat=True
+        )
+    )
+    known.update(
+        ImageJob.objects.filter(source_file_id__in=candidates).values_list(
+            "source_file_id", flat=True
+        )
+    )
+    known.update(
+        StorageDeletion.objects.filter(file_id__in=candidates).values_list(
+            "file_id", flat=True
+        )
+    )
+    return [stored for file_id, stored in candidates.items() if file_id not in known]
+
+
+def delete_orphans(orphans, concurrency=DELETE_CONCURRENCY):
+    """
+    Deletes orphans with at most `concurrency` requests in flight. Returns the
+    number deleted; failures are logged and left for the next run.
+    """
+    storage = get_storage()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(storage.delete, stored.id_, stored.file_name)
+            for stored in orphans
+        ]
+    deleted = 0
+    for stored, future in zip(orphans, futures):
+        if future.exception():
+            logger.warning("Deleting orphan %s failed: %s", stored.id_, future.exception())
+        else:
+            deleted += 1
+    return deleted
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as file:
+            return json.load(file)
+    return {
+        "cursor": None,
+        "started_at": time.time(),
+        "scanned": 0,
+        "orphans": 0,
+        "deleted": 0,
+    }
+
+
+def save_checkpoint(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(state, file)
+    os.replace(tmp_path, path)
+
+
+def reconcile(
+    delete=False,
+    page_size=PAGE_SIZE,
+    concurrency=DELETE_CONCURRENCY,
+    min_age=MIN_ORPHAN_AGE,
+    checkpoint=None,
+    on_orphan=None,
+):
+    """
+    Pages through the storage listing and reports (or deletes) objects no
+    FileModel refers to. With `checkpoint` set, progress is saved after every
+    page and a later run with the same path resumes where this one stopped.
+    Returns the final counters.
+    """
+    storage = get_storage()
+    state = load_checkpoint(checkpoint)
+    uploaded_before = state["started_at"] - min_age
+
+    while True:
+        files, next_cursor = storage.list(cursor=state["cursor"], limit=page_size)
+        orphans = find_orphans(files, uploaded_before)
+        for stored in orphans:
+            if on_orphan:
+                on_orphan(stored)
+        if delete and orphans:
+            state["deleted"] += delete_orphans(orphans, concurrency)
+        state["scanned"] += len(files)
+        state["orphans"] += len(orphans)
+        state["cursor"] = next_cursor
+        if next_cursor is None:
+            break
+        if checkpoint:
+            save_checkpoint(checkpoint, state)
+
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return state
@@ -0,0 +1,431 @@
+from b2sdk.v1 import B2Api, DownloadDestBytes, InMemoryAccountInfo, UploadSourceStream
+from b2sdk.v1.exception import FileNotPresent, InvalidAuthToken, Unauthorized
+from django.conf import settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from pathlib import Path
+from urllib.parse import quote
+from uuid import uuid4
+import bisect
+import hashlib
+import io
+import os
+import threading
+import time
+from rest_framework.exceptions import ValidationError
+
+# B2 auth tokens live 24 hours; rebuild the client a little earlier
+B2_AUTH_MAX_AGE = 23 * 60 * 60
+# Sent by B2 with every object. Object names are content hashes or random, so
+# the bytes behind a URL never change.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class StoredFile:
+    """
+    Id and name of an object in a storage backend. Mirrors the two b2sdk
+    FileVersion attributes the rest of the code relies on. Listings also
+    fill in uploaded_at (unix time) and info() fills in size (bytes).
+    """
+
+    def __init__(self, id_, file_name, uploaded_at=None, size=None):
+        self.id_ = id_
+        self.file_name = file_name
+        self.uploaded_at = uploaded_at
+        self.size = size
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Seekable read-only stream over a bytes-like object. Reads copy only the
+    requested chunk, never the whole buffer.
+    """
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._view[self._position:self._position + len(buffer)]
+        size = len(chunk)
+        buffer[:size] = chunk
+        self._position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+class StorageBackend:
+    """
+    Interface of the image storage backends. The backend is chosen with the
+    IMAGE_STORAGE_BACKEND setting and obtained through get_storage().
+    """
+
+    def upload(self, data, file_name):
+        """Stores data (bytes-like) under file_name and returns a StoredFile."""
+        raise NotImplementedError
+
+    def info(self, file_id):
+        """Returns the StoredFile for file_id."""
+        raise NotImplementedError
+
+    def download(self, file_id):
+        """Returns the contents of the object as bytes."""
+        raise NotImplementedError
+
+    def delete(self, file_id, file_name):
+        """Deletes the object. Deleting a missing object is not an error."""
+        raise NotImplementedError
+
+    def url(self, file_name):
+        """Public URL of the object stored under file_name."""
+        raise NotImplementedError
+
+    def list(self, cursor=None, limit=1000):
+        """
+        Returns one page of stored objects as (files, next_cursor). Pass
+        next_cursor back to get the following page; it is None after the last
+        page. Cursors are JSON-serializable so a listing can be resumed later.
+        """
+        raise NotImplementedError
+
+    def upload_authorization(self, file_name, token):
+        """
+        Where and how a client uploads an object named file_name itself, as
+        (target, key_id). target is a dict with url, method and headers.
+        key_id names a credential issued for this upload, to be passed to
+        revoke_upload_key once it is no longer needed, or is empty.
+        file_name lies under a prefix of its own, which the authorization may
+        be limited to. `token` is the signed direct upload token (see
+        backblaze.utils.direct_upload). Backends without a way to authorize
+        uploads from outside use the local stand-in target, a view that
+        accepts the bytes and answers like B2 does.
+        """
+        target = {
+            'url': reverse('direct_upload_target', args=[token]),
+            'method': 'PUT',
+            'headers': {},
+        }
+        return target, ''
+
+    def revoke_upload_key(self, key_id):
+        """Revokes a credential returned by upload_authorization."""
+
+
+# Backblaze B2
+
+
+def initialize_b2api():
+    required_env_varibles = ['APPLICATION_KEY_ID', 'APPLICATION_KEY',
+                             'BUCKET_NAME_IMG']
+    for var in required_env_varibles:
+        if not os.environ.get(var):
+            raise ValueError(f'{var} is not set')
+    try:
+        info = InMemoryAccountInfo()
+        b2_api = B2Api(info)
+        application_key_id = os.environ.get('APPLICATION_KEY_ID')
+        application_key = os.environ.get('APPLICATION_KEY')
+        b2_api.authorize_account(
+            "production", application_key_id, application_key)
+        bucket_name = os.environ.get('BUCKET_NAME_IMG')
+        bucket = b2_api.get_bucket_by_name(bucket_name=bucket_name)
+        return bucket, bucket_name
+    except Exception as e:
+        raise ValidationError({"description":f"Помилка ініціалізація B2 API: {e}"})
+
+
+class B2Storage(StorageBackend):
+    """
+    Backblaze B2 bucket. The client is created on first use instead of at
+    import time, so migrate, collectstatic and worker boot need no network.
+    It is rebuilt after a fork and before the auth token expires.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bucket = None
+        self._pid = None
+        self._authorized_at = 0.0
+
+    def _is_stale(self):
+        return (self._bucket is None
+                or self._pid != os.getpid()
+                or time.monotonic() - self._authorized_at > B2_AUTH_MAX_AGE)
+
+    def get_bucket(self):
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self._bucket, _ = initialize_b2api()
+                    self._pid = os.getpid()
+                    self._authorized_at = time.monotonic()
+        return self._bucket
+
+    def reset(self):
+        with self._lock:
+            self._bucket = None
+
+    def call(self, method, *args, **kwargs):
+        """
+        Calls a bucket method, re-authorizing and retrying once if B2 rejects the token.
+        """
+        try:
+            return getattr(self.get_bucket(), method)(*args, **kwargs)
+        except (InvalidAuthToken, Unauthorized):
+            self.reset()
+            return getattr(self.get_bucket(), method)(*args, **kwargs)
+
+    def upload(self, data, file_name):
+        # upload_bytes would wrap data in a BytesIO, which copies a memoryview
+        data = memoryview(data)
+        upload_source = UploadSourceStream(
+            lambda: BufferReader(data),
+            stream_length=data.nbytes,
+            stream_sha1=hashlib.sha1(data).hexdigest(),
+        )
+        file_info = self.call(
+            'upload', upload_source, file_name, cache_control=IMMUTABLE_CACHE_CONTROL)
+        return StoredFile(file_info.id_, file_info.file_name)
+
+    def info(self, file_id):
+        file_info = self.call('get_file_info_by_id', file_id=file_id)
+        return StoredFile(file_info.id_, file_info.file_name, size=file_info.size)
+
+    def download(self, file_id):
+        download_dest = DownloadDestBytes()
+        self.call('download_file_by_id', file_id, download_dest)
+        return download_dest.get_bytes_written()
+
+    def delete(self, file_id, file_name):
+        try:
+            return self.call('delete_file_version', file_id=file_id, file_name=file_name)
+        except FileNotPresent:
+            return None
+
+    def url(self, file_name):
+        bucket_name = os.environ.get('BUCKET_NAME_IMG')
+        end_path = os.environ.get('END_BACKET_PATH')
+        return f'https://{bucket_name}.{end_path}/{file_name}'
+
+    def _create_upload_key(self, name_prefix):
+        bucket = self.get_bucket()
+        return bucket.api.create_key(
+            capabilities=['writeFiles'],
+            key_name=f'direct-upload-{uuid4().hex}',
+            valid_duration_seconds=settings.IMAGE_DIRECT_UPLOAD_MAX_AGE,
+            bucket_id=bucket.id_,
+            name_prefix=name_prefix,
+        )
+
+    def upload_authorization(self, file_name, token):
+        # The client gets an upload URL of a key that may only write names
+        # under the upload's own prefix and expires with the direct upload
+        # token, never one of the bucket-wide key. The key is deleted once the
+        # upload is finalized or expires (see backblaze.utils.direct_upload).
+        name_prefix = file_name[:file_name.rindex('/') + 1]
+        try:
+            key = self._create_upload_key(name_prefix)
+        except (InvalidAuthToken, Unauthorized):
+            self.reset()
+            key = self._create_upload_key(name_prefix)
+        try:
+            upload_api = B2Api(InMemoryAccountInfo())
+            upload_api.authorize_account(
+                'production', key['applicationKeyId'], key['applicationKey'])
+            response = upload_api.session.get_upload_url(self.get_bucket().id_)
+        except Exception:
+            self.revoke_upload_key(key['applicationKeyId'])
+            raise
+        target = {
+            'url': response['uploadUrl'],
+            'method': 'POST',
+            'headers': {
+                'Authorization': response['authorizationToken'],
+                'X-Bz-File-Name': quote(file_name),
+                'Content-Type': 'b2/x-auto',
+                # The client adds X-Bz-Content-Sha1 with the hex SHA1 of the body
+            },
+        }
+        return target, key['applicationKeyId']
+
+    def _delete_key(self, key_id):
+        return self.get_bucket().api.delete_key(key_id)
+
+    def revoke_upload_key(self, key_id):
+        try:
+            self._delete_key(key_id)
+        except (InvalidAuthToken, Unauthorized):
+            self.reset()
+            self._delete_key(key_id)
+
+    def _list_file_versions(self, start_name, start_id, limit):
+        bucket = self.get_bucket()
+        return bucket.api.session.list_file_versions(
+            bucket.id_, start_name, start_id, limit)
+
+    def list(self, cursor=None, limit=1000):
+        # Versions, not names: every version is a separate object a row may point at
+        start_name, start_id = cursor or (None, None)
+        try:
+            response = self._list_file_versions(start_name, start_id, limit)
+        except (InvalidAuthToken, Unauthorized):
+            self.reset()
+            response = self._list_file_versions(start_name, start_id, limit)
+        files = [
+            StoredFile(entry['fileId'], entry['fileName'],
+                       entry['uploadTimestamp'] / 1000)
+            for entry in response['files']
+            # Skip hide markers and unfinished large files
+            if entry['action'] == 'upload'
+        ]
+        next_cursor = None
+        if response['nextFileName'] is not None:
+            next_cursor = [response['nextFileName'], response['nextFileId']]
+        return files, next_cursor
+
+
+# Local filesystem
+
+
+class LocalStorage(StorageBackend):
+    """
+    Writes files under MEDIA_ROOT/images, which nginx serves at MEDIA_URL.
+    The file id is the path relative to that directory.
+    """
+
+    directory = 'images'
+
+    @property
+    def root(self):
+        return Path(settings.MEDIA_ROOT) / self.directory
+
+    def upload(self, data, file_name):
+        file_id = f'{uuid4().hex}/{file_name}'
+        path = self.root / file_id
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        return StoredFile(file_id, file_id)
+
+    def info(self, file_id):
+        path = self.root / file_id
+        if not path.is_file():
+            raise FileNotFoundError(file_id)
+        return StoredFile(file_id, file_id, size=path.stat().st_size)
+
+    def download(self, file_id):
+        return (self.root / file_id).read_bytes()
+
+    def delete(self, file_id, file_name):
+        path = self.root / file_id
+        path.unlink(missing_ok=True)
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass
+
+    def url(self, file_name):
+        return f'{settings.MEDIA_URL}{self.directory}/{file_name}'
+
+    def list(self, cursor=None, limit=1000):
+        if not self.root.is_dir():
+            return [], None
+        paths = sorted(
+            path for path in self.root.rglob('*')
+            if path.is_file() and path.suffix != '.tmp'
+        )
+        names = [path.relative_to(self.root).as_posix() for path in paths]
+        start = bisect.bisect_right(names, cursor) if cursor else 0
+        page = [
+            StoredFile(name, name, path.stat().st_mtime)
+            for name, path in zip(names[start:start + limit], paths[start:start + limit])
+        ]
+        next_cursor = page[-1].id_ if start + limit < len(names) else None
+        return page, next_cursor
+
+
+# In memory
+
+
+class InMemoryStorage(StorageBackend):
+    """
+    Keeps files in a dict. For tests, benchmarks and offline runs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = {}
+        self.uploaded_at = {}
+
+    def upload(self, data, file_name):
+        file_id = uuid4().hex
+        with self._lock:
+            self.files[file_id] = (file_name, bytes(data))
+            self.uploaded_at[file_id] = time.time()
+        return StoredFile(file_id, file_name)
+
+    def info(self, file_id):
+        file_name, data = self.files[file_id]
+        return StoredFile(file_id, file_name, size=len(data))
+
+    def download(self, file_id):
+        return self.files[file_id][1]
+
+    def delete(self, file_id, file_name):
+        with self._lock:
+            self.files.pop(file_id, None)
+            self.uploaded_at.pop(file_id, None)
+
+    def url(self, file_name):
+        return f'https://memory.invalid/{file_name}'
+
+    def list(self, cursor=None, limit=1000):
+        with self._lock:
+            ids = sorted(file_id for file_id in self.files if not cursor or file_id > cursor)
+            page = [
+                StoredFile(file_id, self.files[file_id][0], self.uploaded_at[file_id])
+                for file_id in ids[:limit]
+            ]
+        next_cursor = page[-1].id_ if len(ids) > limit else None
+        return page, next_cursor
+
+    def clear(self):
+        with self._lock:
+            self.files.clear()
+            self.uploaded_at.clear()
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage():
+    """
+    Returns the process-wide instance of the backend named by IMAGE_STORAGE_BACKEND.
+    """
+    path = settings.IMAGE_STORAGE_BACKEND
+    storage = _storages.get(path)
+    if storage is None:
+        with _storages_lock:
+            storage = _storages.get(path)
+            if storage is None:
+                storage = _storages[path] = import_string(path)()
+    return storage
@@ -0,0 +1,178 @@
+import re
+import unicodedata
+from xml.etree import ElementTree
+from defusedxml import DefusedXmlException
+from defusedxml.ElementTree import fromstring
+from rest_framework.exceptions import ValidationError
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+XLINK_NS = 'http://www.w3.org/1999/xlink'
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+
+ElementTree.register_namespace('', SVG_NS)
+ElementTree.register_namespace('xlink', XLINK_NS)
+
+# Presentational elements kept in sanitized documents; everything else
+# (scripts, foreign content, animation, which can rewrite href) is removed
+# with its children
+ALLOWED_TAGS = {
+    'svg', 'g', 'defs', 'symbol', 'use', 'title', 'desc', 'style', 'a',
+    'path', 'rect', 'circle', 'ellipse', 'line', 'polyline', 'polygon',
+    'text', 'tspan', 'textPath',
+    'linearGradient', 'radialGradient', 'stop', 'pattern', 'clipPath', 'mask',
+    'marker', 'filter', 'feBlend', 'feColorMatrix', 'feComponentTransfer',
+    'feComposite', 'feConvolveMatrix', 'feDiffuseLighting', 'feDisplacementMap',
+    'feDistantLight', 'feDropShadow', 'feFlood', 'feFuncA', 'feFuncB',
+    'feFuncG', 'feFuncR', 'feGaussianBlur', 'feMerge', 'feMergeNode',
+    'feMorphology', 'feOffset', 'fePointLight', 'feSpecularLighting',
+    'feSpotLight', 'feTile', 'feTurbulence',
+}
+# Attributes kept on those elements, in any of the allowed namespaces
+ALLOWED_ATTRIBUTES = {
+    # Core and geometry
+    'id', 'class', 'style', 'lang', 'space', 'href', 'version', 'viewBox',
+    'preserveAspectRatio', 'transform', 'width', 'height', 'x', 'y', 'x1',
+    'y1', 'x2', 'y2', 'cx', 'cy', 'r', 'rx', 'ry', 'fx', 'fy', 'fr', 'd',
+    'points', 'pathLength',
+    # Painting
+    'fill', 'fill-opacity', 'fill-rule', 'stroke', 'stroke-width',
+    'stroke-linecap', 'stroke-linejoin', 'stroke-miterlimit',
+    'stroke-dasharray', 'stroke-dashoffset', 'stroke-opacity', 'opacity',
+    'color', 'display', 'visibility', 'paint-order', 'vector-effect',
+    'shape-rendering', 'text-rendering', 'image-rendering', 'mix-blend-mode',
+    'isolation', 'color-interpolation', 'color-interpolation-filters',
+    'clip-path', 'clip-rule', 'mask', 'filter', 'marker-start', 'marker-mid',
+    'marker-end',
+    # Text
+    'font-family', 'font-size', 'font-weight', 'font-style', 'font-variant',
+    'text-anchor', 'dominant-baseline', 'alignment-baseline',
+    'baseline-shift', 'letter-spacing', 'word-spacing', 'text-decoration',
+    'dx', 'dy', 'rotate', 'textLength', 'lengthAdjust', 'startOffset',
+    'method', 'spacing', 'side',
+    # Paint servers, clips, masks and markers
+    'offset', 'stop-color', 'stop-opacity', 'gradientUnits',
+    'gradientTransform', 'spreadMethod', 'patternUnits',
+    'patternContentUnits', 'patternTransform', 'clipPathUnits', 'maskUnits',
+    'maskContentUnits', 'markerWidth', 'markerHeight', 'markerUnits', 'refX',
+    'refY', 'orient',
+    # Filter primitives
+    'filterUnits', 'primitiveUnits', 'in', 'in2', 'result', 'stdDeviation',
+    'mode', 'operator', 'k1', 'k2', 'k3', 'k4', 'values', 'type',
+    'tableValues', 'slope', 'intercept', 'amplitude', 'exponent',
+    'flood-color', 'flood-opacity', 'lighting-color', 'baseFrequency',
+    'numOctaves', 'seed', 'stitchTiles', 'scale', 'xChannelSelector',
+    'yChannelSelector', 'radius', 'order', 'kernelMatrix', 'divisor', 'bias',
+    'targetX', 'targetY', 'edgeMode', 'preserveAlpha', 'surfaceScale',
+    'diffuseConstant', 'specularConstant', 'specularExponent', 'azimuth',
+    'elevation', 'z', 'pointsAtX', 'pointsAtY', 'pointsAtZ',
+    'limitingConeAngle',
+}
+# CSS escapes: up to six hex digits and one optional space, or any character
+CSS_ESCAPE = re.compile(r'\\(?:([0-9a-fA-F]{1,6})\s?|(.))', re.DOTALL)
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+# url(...) pointing anywhere but a fragment of this document, in a
+# normalized value
+EXTERNAL_URL = re.compile(r'url\([\'"]?(?!#)')
+UNSAFE_TOKENS = ('javascript:', 'vbscript:', 'data:', '@import', 'expression(')
+LENGTH = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*(px)?\s*$')
+
+
+def split_tag(tag):
+    if tag.startswith('{'):
+        namespace, _, name = tag[1:].partition('}')
+        return namespace, name
+    return '', tag
+
+
+def unescape_css(value):
+    def replace(match):
+        code, char = match.groups()
+        if code is None:
+            return char
+        code = int(code, 16)
+        return chr(code) if 0 < code <= 0x10FFFF else '\ufffd'
+
+    return CSS_ESCAPE.sub(replace, value)
+
+
+def normalize(value):
+    """
+    value as a browser reads it, for matching: CSS comments and escapes
+    resolved, whitespace and control or format characters (which URL and
+    CSS parsers skip) removed, lowercased.
+    """
+    value = unescape_css(CSS_COMMENT.sub('', value))
+    return ''.join(
+        char for char in value
+        if not char.isspace() and unicodedata.category(char) not in ('Cc', 'Cf')
+    ).lower()
+
+
+def is_safe_value(value):
+    value = normalize(value)
+    return not any(token in value for token in UNSAFE_TOKENS) and not EXTERNAL_URL.search(value)
+
+
+def clean_attributes(element):
+    for attribute, value in list(element.attrib.items()):
+        namespace, name = split_tag(attribute)
+        if namespace not in ('', XLINK_NS, XML_NS) or name not in ALLOWED_ATTRIBUTES:
+            # Event handlers, editor attributes (inkscape:, sodipodi:, ...)
+            del element.attrib[attribute]
+        elif name == 'href' and not normalize(value).startswith('#'):
+            del element.attrib[attribute]
+        elif not is_safe_value(value):
+            del element.attrib[attribute]
+
+
+def sanitize_svg(data):
+    """
+    Returns a minified copy of the SVG document keeping only presentational
+    elements and attributes, without references to anything outside the
+    document. DTDs and entities are rejected while parsing.
+    """
+    try:
+        root = fromstring(data, forbid_dtd=True)
+    except (ElementTree.ParseError, DefusedXmlException, ValueError):
+        raise ValidationError(detail={'description': 'Недійсний SVG'})
+    if root.tag != f'{{{SVG_NS}}}svg':
+        raise ValidationError(detail={'description': 'Недійсний SVG'})
+
+    # iter() walks the tree without recursion, so deep nesting is fine
+    for element in list(root.iter()):
+        for child in list(element):
+            namespace, name = split_tag(child.tag)
+            if (namespace != SVG_NS or name not in ALLOWED_TAGS
+                    or (name == 'style' and not is_safe_value(child.text or ''))):
+                element.remove(child)
+        clean_attributes(element)
+        if element.text and not element.text.strip():
+            element.text = None
+        if element.tail and not element.tail.strip():
+            element.tail = None
+    data = ElementTree.tostring(root, encoding='utf-8', xml_declaration=False)
+    # ElementTree writes "<path />"; markup characters are escaped in values, so
+    # this only touches tag ends
+    return data.replace(b' />', b'/>')
+
+
+def svg_size(data):
+    """
+    Width and height of a sanitized SVG in pixels, from its width/height
+    attributes or its viewBox. Either is None when it cannot be determined.
+    """
+    root = fromstring(data, forbid_dtd=True)
+    sizes = []
+    view_box = root.get('viewBox', '').replace(',', ' ').split()
+    for index, attribute in ((2, 'width'), (3, 'height')):
+        match = LENGTH.match(root.get(attribute, ''))
+        if match:
+            sizes.append(round(float(match.group(1))))
+        elif len(view_box) == 4:
+            try:
+                sizes.append(round(float(view_box[index])))
+            except ValueError:
+                sizes.append(None)
+        else:
+            sizes.append(None)
+    return tuple(sizes)
@@ -1,13 +1,86 @@
+from PIL import Image
+from django.conf import settings
 from rest_framework.exceptions import ValidationError
+from backblaze.utils.svg import sanitize_svg, svg_size
+
+# Format Pillow must detect for each accepted extension; None accepts any raster
+EXTENSION_FORMATS = {
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.png': 'PNG',
+    '.webp': 'WEBP',
+    '.ios': None,
+    '.svg': 'SVG',
+}
+# Bytes needed to recognise any of the formats below
+SNIFF_SIZE = 16
+
+
+def sniff_format(header):
+    """Format named by the leading bytes of a file, or None."""
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    if header.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'<'):
+        return 'SVG'
+    return None
+
+
+def check_dimensions(width, height):
+    if (width * height > settings.IMAGE_MAX_PIXELS
+            or max(width, height) > settings.IMAGE_MAX_SIDE):
+        raise ValidationError(detail={
+            'description': f'Зображення занадто велике: {width}x{height}'})
 
 
 def image_validation(image_obj):
+    """
+    Rejects uploads that are not images of the type their name claims, or whose
+    header declares more pixels than IMAGE_MAX_PIXELS or a side longer than
+    IMAGE_MAX_SIDE. Only the magic bytes and the header are read; nothing is
+    decoded. Leaves the file rewound.
+    """
     if not image_obj:
         raise ValidationError(detail={'description': 'Зображення не знайдено'})
 
-    valid_extensions = ('.jpg', '.png', '.jpeg', '.ios', '.webp', '.svg')
-    if not image_obj.name.endswith(valid_extensions):
+    extension = next(
+        (extension for extension in EXTENSION_FORMATS if image_obj.name.endswith(extension)),
+        None,
+    )
+    if extension is None:
         raise ValidationError(detail={'description': 'Недійсний формат'})
 
+    image_obj.seek(0)
+    sniffed = sniff_format(image_obj.read(SNIFF_SIZE))
+    image_obj.seek(0)
+    expected = EXTENSION_FORMATS[extension]
+    if sniffed is None or sniffed != (expected or sniffed) or (
+            expected is None and sniffed == 'SVG'):
+        raise ValidationError(detail={'description': 'Вміст файлу не відповідає формату'})
 
+    if sniffed == 'SVG':
+        # Raises for anything that does not parse as an SVG document
+        data = sanitize_svg(image_obj.read())
+        image_obj.seek(0)
+        if not settings.IMAGE_SVG_PASSTHROUGH:
+            # Rasterizing allocates the declared size
+            width, height = svg_size(data)
+            check_dimensions(width or 0, height or 0)
+        return
 
+    try:
+        # Parses the header only; pixels are decoded on first access
+        with Image.open(image_obj) as image:
+            size, detected = image.size, image.format
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise ValidationError(detail={'description': 'Зображення занадто велике'})
+    except Exception:
+        raise ValidationError(detail={'description': 'Пошкоджене зображення'})
+    finally:
+        image_obj.seek(0)
+    if detected != sniffed:
+        raise ValidationError(detail={'description': 'Вміст файлу не відповідає формату'})
+    check_dimensions(*size)
@@ -0,0 +1,153 @@
+from rest_framework import status, mixins
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.viewsets import GenericViewSet
+from drf_spectacular.utils import extend_schema
+from api.models import IsApprovedUser
+from backblaze.models import FileModel
+from backblaze.serializer import FileStatusSerializer
+from backblaze.utils.direct_upload import authorize_upload, finalize_upload, receive_upload
+from backblaze.utils.encoding_pool import pool
+
+
+class FileStatusView(mixins.RetrieveModelMixin, GenericViewSet):
+    """
+    Lets the admin UI poll the conversion state of an uploaded file.
+    """
+
+    permission_classes = [IsAuthenticated, IsApprovedUser]
+    queryset = FileModel.objects.all().prefetch_related("jobs")
+    serializer_class = FileStatusSerializer
+
+    @extend_schema(
+        summary="Get file processing status",
+        description="Returns the file with its status: pending, ready or failed.",
+        responses={
+            200: FileStatusSerializer,
+            404: {"description": "Файл не знайдено"},
+        },
+    )
+    def retrieve(self, request, pk):
+        """
+        Returns the file identified by pk, including the last conversion error if any.
+        """
+        file = FileModel.objects.filter(pk=pk).prefetch_related("jobs").first()
+        if file is None:
+            return Response(
+                {"description": "Файл не знайдено"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(FileStatusSerializer(file).data, status=status.HTTP_200_OK)
+
+
+class EncodingPoolStatsView(GenericViewSet):
+    """
+    Exposes the encoding pool counters of the worker serving the request.
+    """
+
+    permission_classes = [IsAuthenticated, IsApprovedUser]
+
+    @extend_schema(
+        summary="Get image encoding pool metrics",
+        description="Pool size, jobs in flight, queue depth and job outcomes "
+        "for the gunicorn worker that answered.",
+        responses={200: {"description": "Метрики пулу"}},
+    )
+    def list(self, request):
+        return Response(pool.stats(), status=status.HTTP_200_OK)
+
+
+class DirectUploadView(GenericViewSet):
+    """
+    Lets the admin UI upload images straight to storage instead of through
+    gunicorn: authorize, send the bytes to the returned target, finalize.
+    """
+
+    permission_classes = [IsAuthenticated, IsApprovedUser]
+
+    @extend_schema(
+        summary="Authorize a direct image upload",
+        description="Returns a token and the URL, method and headers to upload the "
+        "raw image with. B2 targets also need an X-Bz-Content-Sha1 header with the "
+        "SHA1 of the body. The token must be finalized before it expires.",
+        request={
+            "application/json": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}},
+                "required": ["name"],
+            }
+        },
+        responses={
+            200: {"description": "Дозвіл на завантаження"},
+            400: {"description": "Недійсний формат"},
+        },
+    )
+    def create(self, request):
+        try:
+            authorization = authorize_upload(str(request.data.get("name", "")))
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        return Response(authorization, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        summary="Finalize a direct image upload",
+        description="Registers the uploaded object as a pending file and schedules "
+        "its conversion. Poll files/<id>/status for the result.",
+        request={
+            "application/json": {
+                "type": "object",
+                "properties": {
+                    "token": {"type": "string"},
+                    "file_id": {"type": "string"},
+                },
+                "required": ["token", "file_id"],
+            }
+        },
+        responses={
+            201: FileStatusSerializer,
+            400: {"description": "Дозвіл на завантаження недійсний або прострочений"},
+        },
+    )
+    def finalize(self, request):
+        try:
+            file = finalize_upload(
+                str(request.data.get("token", "")), str(request.data.get("file_id", ""))
+            )
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            FileStatusSerializer(file, context={"request": request}).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class DirectUploadTargetView(GenericViewSet):
+    """
+    Upload target used instead of the bucket by storage backends that cannot
+    authorize uploads themselves (local and in-memory storage). The signed
+    token in the URL is the authorization.
+    """
+
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "direct_upload"
+
+    @extend_schema(
+        summary="Receive a direct image upload (local storage only)",
+        description="Stores the raw request body under the name the token was "
+        "issued for and answers with fileId and fileName, like B2.",
+        request={"application/octet-stream": {"type": "string", "format": "binary"}},
+        responses={
+            200: {"description": "fileId та fileName"},
+            400: {"description": "Дозвіл на завантаження недійсний або прострочений"},
+            404: {"description": "Не знайдено"},
+        },
+    )
+    def upload(self, request, token):
+        try:
+            stored = receive_upload(token, request)
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        return Response(stored, status=status.HTTP_200_OK)
@@ -6,5 +6,5 @@ from .models import DogCardModel
 
 @admin.register(DogCardModel)
 class DogCardAdmin(TranslationAdmin):
-    list_display = ('name', 'ready_for_adoption', 'gender', 'age',
+    list_display = ('name', 'ready_for_adoption', 'gender', 'age_months',
                     'sterilization', 'vaccination_parasite_treatment', 'size', 'description')
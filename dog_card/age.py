@@ -0,0 +1,105 @@
+"""
+Dog ages are stored as whole months and turned into text per language.
+"""
+import re
+
+# Oldest age accepted from the admin
+MAX_AGE_MONTHS = 30 * 12
+# Inclusive bounds in months for each age category; None means no upper bound
+AGE_CATEGORIES = {
+    "щеня": (0, 11),
+    "puppy": (0, 11),
+    "молода собака": (12, 41),
+    "young dog": (12, 41),
+    "доросла собака": (42, None),
+    "adult dog": (42, None),
+}
+# Category names in each language, youngest first
+AGE_CATEGORY_NAMES = {
+    "uk": ("щеня", "молода собака", "доросла собака"),
+    "en": ("puppy", "young dog", "adult dog"),
+}
+
+NUMBER = r"(\d+(?:[.,]\d+)?)"
+YEARS = re.compile(NUMBER + r"\s*(?:рок|рік|роки|років|року|р\.?|years?|yrs?|y)\b", re.IGNORECASE)
+MONTHS = re.compile(NUMBER + r"\s*(?:місяц\w*|міс\.?|months?|mo)\b", re.IGNORECASE)
+WEEKS = re.compile(NUMBER + r"\s*(?:тижн\w*|тиждень|weeks?|wk)\b", re.IGNORECASE)
+BARE_NUMBER = re.compile(r"^\s*" + NUMBER + r"\s*$")
+
+
+def to_number(text):
+    return float(text.replace(",", "."))
+
+
+def parse_age(text):
+    """
+    Months described by an age typed in Ukrainian or English, for example
+    "2 роки", "1,5 року", "1 рік 3 місяці", "8 months" or "3 тижні".
+    A bare number counts as years. Returns None if nothing can be read.
+    """
+    text = str(text or "").replace("\u00a0", " ")
+    years = sum(to_number(match) for match in YEARS.findall(text))
+    months = sum(to_number(match) for match in MONTHS.findall(text))
+    weeks = sum(to_number(match) for match in WEEKS.findall(text))
+    if not (YEARS.search(text) or MONTHS.search(text) or WEEKS.search(text)):
+        match = BARE_NUMBER.match(text)
+        if not match:
+            return None
+        years = to_number(match.group(1))
+    return round(years * 12 + months + weeks * 7 / 30)
+
+
+def plural_uk(number, one, few, many):
+    if number % 10 == 1 and number % 100 != 11:
+        return one
+    if 2 <= number % 10 <= 4 and not 12 <= number % 100 <= 14:
+        return few
+    return many
+
+
+def format_age_uk(months):
+    if months < 12:
+        return f"{months} {plural_uk(months, 'місяць', 'місяці', 'місяців')}"
+    years, rest = divmod(months, 12)
+    if rest == 6:
+        # Fractions take the genitive singular: "1,5 року"
+        return f"{years},5 року"
+    text = f"{years} {plural_uk(years, 'рік', 'роки', 'років')}"
+    if rest:
+        text += f" {rest} {plural_uk(rest, 'місяць', 'місяці', 'місяців')}"
+    return text
+
+
+def format_age_en(months):
+    if months < 12:
+        return f"{months} month" + ("" if months == 1 else "s")
+    years, rest = divmod(months, 12)
+    if rest == 6:
+        return f"{years}.5 years"
+    text = f"{years} year" + ("" if years == 1 else "s")
+    if rest:
+        text += f" {rest} month" + ("" if rest == 1 else "s")
+    return text
+
+
+def format_age(months, language="uk"):
+    """Age text in `language` (uk or en), or None for an unknown age."""
+    if months is None:
+        return None
+    if language == "en":
+        return format_age_en(months)
+    return format_age_uk(months)
+
+
+def age_filter(category):
+    """
+    Lookup kwargs selecting the dogs in an age category, or None for an
+    unknown category.
+    """
+    bounds = AGE_CATEGORIES.get(category.strip().lower())
+    if bounds is None:
+        return None
+    lower, upper = bounds
+    if upper is None:
+        return {"age_months__gte": lower}
+    return {"age_months__range": (lower, upper)}
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DogCardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dog_card'
+
+    def ready(self):
+        import dog_card.signals  # noqa: F401
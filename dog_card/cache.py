@@ -0,0 +1,109 @@
+"""
+Read-through cache of rendered /catalog/ and /catalog/facets responses.
+
+Entries hold the JSON bytes of one response. They are keyed by the path,
+the normalized search, the page and the language, under a version number.
+Every committed write to a card, or to a file shown on one, bumps the
+version, so later reads miss and rebuild.
+Entries under old versions are never read again and expire after
+CATALOG_CACHE_TIMEOUT.
+
+The version lives in the `catalog` cache, which must be shared by every
+process that writes cards (gunicorn workers and the image job worker); see
+CACHES in the settings. Hits and misses are counted in memory per process,
+so reads never write to the cache.
+"""
+from hashlib import sha1
+import os
+import threading
+import time
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import get_language
+
+CACHE_ALIAS = "catalog"
+VERSION_KEY = "catalog:version"
+
+_lock = threading.Lock()
+_counts = {"hits": 0, "misses": 0}
+
+
+def catalog_cache():
+    return caches[CACHE_ALIAS]
+
+
+def current_version():
+    cache = catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start past any version entries may still be stored under
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    cache = catalog_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_catalog():
+    """Bumps the version once the current transaction commits."""
+    transaction.on_commit(bump_version)
+
+
+def count(key):
+    with _lock:
+        _counts[key] += 1
+
+
+def cache_key(request, search):
+    """
+    Key of the response to request for the normalized search tuple, in the
+    current version.
+    """
+    parts = (
+        request.path,
+        search,
+        request.GET.get("cursor", ""),
+        request.GET.get("page_size", ""),
+        get_language(),
+        request.get_host(),
+    )
+    digest = sha1(repr(parts).encode()).hexdigest()
+    return f"catalog:{current_version()}:{digest}"
+
+
+def get_response(key):
+    """(status, JSON bytes) stored under key, or None; counts the hit or miss."""
+    cached = catalog_cache().get(key)
+    count("misses" if cached is None else "hits")
+    return cached
+
+
+def set_response(key, status, content):
+    catalog_cache().set(key, (status, content))
+
+
+def clear():
+    """Drops every cached response and zeroes this process's counters."""
+    catalog_cache().clear()
+    with _lock:
+        for key in _counts:
+            _counts[key] = 0
+
+
+def stats():
+    """Counters of this process since it started."""
+    with _lock:
+        hits, misses = _counts["hits"], _counts["misses"]
+    return {
+        "pid": os.getpid(),
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else None,
+        "version": current_version(),
+    }
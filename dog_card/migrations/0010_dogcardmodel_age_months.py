@@ -0,0 +1,131 @@
+# Generated by Django 4.2.8 on 2026-10-18 08:04
+
+import logging
+import re
+from django.db import migrations, models
+import django.db.models.deletion
+
+logger = logging.getLogger(__name__)
+
+# Frozen copy of dog_card.age as it was when this migration was written
+
+NUMBER = r"(\d+(?:[.,]\d+)?)"
+YEARS = re.compile(NUMBER + r"\s*(?:рок|рік|роки|років|року|р\.?|years?|yrs?|y)\b", re.IGNORECASE)
+MONTHS = re.compile(NUMBER + r"\s*(?:місяц\w*|міс\.?|months?|mo)\b", re.IGNORECASE)
+WEEKS = re.compile(NUMBER + r"\s*(?:тижн\w*|тиждень|weeks?|wk)\b", re.IGNORECASE)
+BARE_NUMBER = re.compile(r"^\s*" + NUMBER + r"\s*$")
+
+
+def to_number(text):
+    return float(text.replace(",", "."))
+
+
+def parse_age(text):
+    text = str(text or "").replace("\u00a0", " ")
+    years = sum(to_number(match) for match in YEARS.findall(text))
+    months = sum(to_number(match) for match in MONTHS.findall(text))
+    weeks = sum(to_number(match) for match in WEEKS.findall(text))
+    if not (YEARS.search(text) or MONTHS.search(text) or WEEKS.search(text)):
+        match = BARE_NUMBER.match(text)
+        if not match:
+            return None
+        years = to_number(match.group(1))
+    return round(years * 12 + months + weeks * 7 / 30)
+
+
+def plural_uk(number, one, few, many):
+    if number % 10 == 1 and number % 100 != 11:
+        return one
+    if 2 <= number % 10 <= 4 and not 12 <= number % 100 <= 14:
+        return few
+    return many
+
+
+def format_age(months, language):
+    years, rest = divmod(months, 12)
+    if language == "en":
+        if months < 12:
+            return f"{months} month" + ("" if months == 1 else "s")
+        if rest == 6:
+            return f"{years}.5 years"
+        text = f"{years} year" + ("" if years == 1 else "s")
+        if rest:
+            text += f" {rest} month" + ("" if rest == 1 else "s")
+        return text
+    if months < 12:
+        return f"{months} {plural_uk(months, 'місяць', 'місяці', 'місяців')}"
+    if rest == 6:
+        return f"{years},5 року"
+    text = f"{years} {plural_uk(years, 'рік', 'роки', 'років')}"
+    if rest:
+        text += f" {rest} {plural_uk(rest, 'місяць', 'місяці', 'місяців')}"
+    return text
+
+
+def parse_ages(apps, schema_editor):
+    DogCardModel = apps.get_model('dog_card', 'DogCardModel')
+    unparsed = []
+    for dog in DogCardModel.objects.all():
+        dog.age_months = next(
+            (months for months in map(parse_age, (dog.age_uk, dog.age, dog.age_en))
+             if months is not None),
+            None,
+        )
+        if dog.age_months is None and (dog.age_uk or dog.age or dog.age_en):
+            unparsed.append(f'{dog.pk}: {dog.age_uk or dog.age or dog.age_en}')
+        dog.save(update_fields=['age_months'])
+    if unparsed:
+        # Left without an age; set it in the admin
+        logger.warning('Dog ages that could not be read: %s', '; '.join(unparsed))
+
+
+def format_ages(apps, schema_editor):
+    DogCardModel = apps.get_model('dog_card', 'DogCardModel')
+    for dog in DogCardModel.objects.exclude(age_months=None):
+        dog.age = dog.age_uk = format_age(dog.age_months, 'uk')
+        dog.age_en = format_age(dog.age_months, 'en')
+        dog.save(update_fields=['age', 'age_uk', 'age_en'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backblaze', '0012_filemodel_original_name'),
+        ('dog_card', '0009_alter_dogcardmodel_photo'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='dogcardmodel',
+            options={'ordering': ['id'], 'verbose_name': 'Картка собаки', 'verbose_name_plural': 'Картки собак'},
+        ),
+        migrations.AddField(
+            model_name='dogcardmodel',
+            name='age_months',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(parse_ages, format_ages),
+        # Lets the column be re-added to existing rows when migrating backwards
+        migrations.AlterField(
+            model_name='dogcardmodel',
+            name='age',
+            field=models.CharField(default='', max_length=20),
+        ),
+        migrations.RemoveField(
+            model_name='dogcardmodel',
+            name='age',
+        ),
+        migrations.RemoveField(
+            model_name='dogcardmodel',
+            name='age_en',
+        ),
+        migrations.RemoveField(
+            model_name='dogcardmodel',
+            name='age_uk',
+        ),
+        migrations.AlterField(
+            model_name='dogcardmodel',
+            name='photo',
+            field=models.ForeignKey(blank=True, limit_choices_to=models.Q(('category', 'image')), null=True, on_delete=django.db.models.deletion.CASCADE, to='backblaze.filemodel'),
+        ),
+    ]
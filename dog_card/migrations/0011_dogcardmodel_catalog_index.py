@@ -0,0 +1,42 @@
+# Generated by Django 4.2.8 on 2026-10-18 08:07
+
+from django.db import migrations, models
+
+GENDERS = {'хлопчик': 'boy', 'дівчинка': 'girl'}
+SIZES = {'маленький': 'small', 'середній': 'medium', 'великий': 'large'}
+
+
+def canonicalize_choices(apps, schema_editor):
+    # The catalog filters the Ukrainian columns by exact value; fix rows saved
+    # with the English value, different case or stray spaces
+    DogCardModel = apps.get_model('dog_card', 'DogCardModel')
+    for dog in DogCardModel.objects.all():
+        for field, choices in (('gender', GENDERS), ('size', SIZES)):
+            to_uk = {en: uk for uk, en in choices.items()}
+            to_uk.update({uk: uk for uk in choices})
+            values = [getattr(dog, name) for name in (f'{field}_uk', field, f'{field}_en')]
+            uk = next(
+                (to_uk[value.strip().lower()] for value in values
+                 if value and value.strip().lower() in to_uk),
+                None,
+            )
+            if uk is not None:
+                setattr(dog, field, uk)
+                setattr(dog, f'{field}_uk', uk)
+                setattr(dog, f'{field}_en', choices[uk])
+        dog.save(update_fields=['gender', 'gender_uk', 'gender_en', 'size', 'size_uk', 'size_en'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dog_card', '0010_dogcardmodel_age_months'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_choices, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='dogcardmodel',
+            index=models.Index(fields=['size_uk', 'gender_uk', 'age_months'], name='dog_card_catalog_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.8 on 2026-10-18 08:11
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_FIELDS = ("name_uk", "name_en", "description_uk", "description_en")
+
+
+def create_search_index(apps, schema_editor):
+    """
+    GIN index over the precomputed vectors on PostgreSQL, or an FTS5 table
+    mirroring the text columns on SQLite; filled for the existing cards.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            "UPDATE dog_card_dogcardmodel SET search_vector = "
+            "setweight(to_tsvector('simple', coalesce(name_uk, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(name_en, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(description_uk, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(description_en, '')), 'B')"
+        )
+        schema_editor.execute(
+            "CREATE INDEX dog_card_search_idx ON dog_card_dogcardmodel "
+            "USING gin (search_vector)"
+        )
+    elif vendor == "sqlite":
+        columns = ", ".join(SEARCH_FIELDS)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE dog_card_search USING fts5({columns}, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO dog_card_search (rowid, {columns}) SELECT id, "
+            + ", ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+            + " FROM dog_card_dogcardmodel"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS dog_card_search_idx")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS dog_card_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dog_card', '0011_dogcardmodel_catalog_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dogcardmodel',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
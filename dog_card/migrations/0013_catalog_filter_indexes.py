@@ -0,0 +1,21 @@
+# Generated by Django 4.2.8 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dog_card', '0012_dogcardmodel_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dogcardmodel',
+            index=models.Index(fields=['gender_uk'], name='dog_card_gender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dogcardmodel',
+            index=models.Index(fields=['ready_for_adoption'], name='dog_card_ready_idx'),
+        ),
+    ]
@@ -1,8 +1,25 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from backblaze.models import FileModel
+from dog_card.age import format_age
 
 # Create your models here.
 
+# Ukrainian value -> English value of the translated choice fields
+GENDERS = {"хлопчик": "boy", "дівчинка": "girl"}
+SIZES = {"маленький": "small", "середній": "medium", "великий": "large"}
+
+
+def canonical_choice(value, translations):
+    """
+    Ukrainian value of a translated choice given in either language, or None
+    if it is not one of `translations`.
+    """
+    value = str(value).strip().lower()
+    if value in translations:
+        return value
+    return {en: uk for uk, en in translations.items()}.get(value)
+
 
 class DogCardModel(models.Model):
     id = models.AutoField(primary_key=True)
@@ -17,7 +34,8 @@ class DogCardModel(models.Model):
             ("girl", "girl"),
         ],
     )
-    age = models.CharField(max_length=20)
+    # Whole months; the text shown to visitors is generated per language
+    age_months = models.PositiveSmallIntegerField(null=True, blank=True, db_index=True)
     sterilization = models.BooleanField(default=False)
     vaccination_parasite_treatment = models.BooleanField(default=False)
     size = models.CharField(
@@ -32,6 +50,9 @@ class DogCardModel(models.Model):
         ],
     )
     description = models.TextField()
+    # Names and descriptions for full-text search on PostgreSQL, kept current
+    # by dog_card.signals; see dog_card.search
+    search_vector = SearchVectorField(null=True, editable=False)
     photo = models.ForeignKey(
         FileModel,
         on_delete=models.CASCADE,
@@ -43,11 +64,24 @@ class DogCardModel(models.Model):
     def photo_url(self):
         return self.photo.url
 
+    def age_text(self, language="uk"):
+        return format_age(self.age_months, language)
+
     def __str__(self):
         return self.name
 
     class Meta:
         ordering = ["id"]
+        # Catalog filters, most selective first; age is the range filter.
+        # Filters that leave out the size use the single-column indexes,
+        # including the one on age_months
+        indexes = [
+            models.Index(
+                fields=["size_uk", "gender_uk", "age_months"], name="dog_card_catalog_idx"
+            ),
+            models.Index(fields=["gender_uk"], name="dog_card_gender_idx"),
+            models.Index(fields=["ready_for_adoption"], name="dog_card_ready_idx"),
+        ]
         verbose_name = "Картка собаки"
         verbose_name_plural = "Картки собак"
         
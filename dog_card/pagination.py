@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+# Ranked results are ordered by this pair; the id breaks ties between equal ranks
+RANKED_ORDERING = ("-rank", "id")
+
+
+class DogCardPagination(CursorPagination):
+    """
+    Keyset pagination over the card id: each page is one indexed range scan
+    (`id > last seen id ... LIMIT n`), however many cards came before it.
+    Clients follow the `next` and `previous` links. Text search results,
+    annotated with a `rank`, are paged best match first on the (rank, id)
+    pair instead, so cards with equal ranks are neither skipped nor repeated.
+    """
+
+    ordering = "id"
+    page_size_query_param = "page_size"
+
+    def get_page_size(self, request):
+        # Read per request so the settings can be overridden
+        self.max_page_size = settings.CATALOG_MAX_PAGE_SIZE
+        self.page_size = settings.CATALOG_PAGE_SIZE
+        return super().get_page_size(request)
+
+    def get_ordering(self, request, queryset, view):
+        if "rank" in queryset.query.annotations:
+            return RANKED_ORDERING
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if "rank" not in queryset.query.annotations:
+            return super().paginate_queryset(queryset, request, view)
+
+        # CursorPagination only compares the first ordering field, which
+        # for float ranks is not unique. Every (rank, id) position is, so
+        # ranked cursors never need an offset.
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = RANKED_ORDERING
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by("rank", "-id")
+        else:
+            queryset = queryset.order_by(*RANKED_ORDERING)
+        if current_position is not None:
+            rank, pk = self.parse_ranked_position(current_position)
+            if reverse:
+                queryset = queryset.filter(Q(rank__gt=rank) | Q(rank=rank, id__lt=pk))
+            else:
+                queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__gt=pk))
+
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            following_position = None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = True, current_position
+            self.has_previous = following_position is not None
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.next_position = following_position
+            self.has_previous = current_position is not None
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def parse_ranked_position(self, position):
+        try:
+            rank, pk = position.split(",")
+            return float(rank), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_position_from_instance(self, instance, ordering):
+        if ordering != RANKED_ORDERING:
+            return super()._get_position_from_instance(instance, ordering)
+        # repr() round-trips the float, so the next page starts exactly here
+        return f"{instance.rank!r},{instance.pk}"
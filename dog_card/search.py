@@ -0,0 +1,102 @@
+"""
+Full-text search over dog names and descriptions in both languages.
+
+On PostgreSQL every card keeps a precomputed `search_vector` covered by the
+GIN index dog_card_search_idx. Ukrainian text uses the `simple`
+configuration, because PostgreSQL has no Ukrainian stemmer; English text is
+stemmed. On SQLite the same four columns are mirrored into the FTS5 table
+dog_card_search. Both are refreshed whenever a card is saved. Names weigh
+more than descriptions when results are ranked. Other databases fall back
+to unranked substring matches.
+"""
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_FIELDS = ("name_uk", "name_en", "description_uk", "description_en")
+# FTS5 table mirroring SEARCH_FIELDS on SQLite, keyed by the card id
+FTS_TABLE = "dog_card_search"
+# Words of a query that are searched for; the rest are ignored
+MAX_TERMS = 8
+# bm25 weights of SEARCH_FIELDS on SQLite
+FTS_WEIGHTS = (10.0, 10.0, 1.0, 1.0)
+
+
+def search_vector():
+    return (
+        SearchVector("name_uk", config="simple", weight="A")
+        + SearchVector("name_en", config="english", weight="A")
+        + SearchVector("description_uk", config="simple", weight="B")
+        + SearchVector("description_en", config="english", weight="B")
+    )
+
+
+def search_terms(text):
+    """Words of a search query, lowercased."""
+    return re.findall(r"\w+", str(text).lower())[:MAX_TERMS]
+
+
+def update_search_index(dog):
+    """Refreshes the search data of one saved card."""
+    if connection.vendor == "postgresql":
+        type(dog).objects.filter(pk=dog.pk).update(search_vector=search_vector())
+    elif connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [dog.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(SEARCH_FIELDS)}) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [dog.pk] + [getattr(dog, field) or "" for field in SEARCH_FIELDS],
+            )
+
+
+def remove_from_search_index(pk):
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [pk])
+
+
+def search_cards(queryset, text):
+    """
+    Narrows queryset to the cards whose name or description, in either
+    language, contains every word of text (as a word prefix). The cards are
+    annotated with `rank`; higher ranks match better.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none()
+
+    if connection.vendor == "postgresql":
+        raw = " & ".join(f"{term}:*" for term in terms)
+        query = SearchQuery(raw, config="simple", search_type="raw") | SearchQuery(
+            raw, config="english", search_type="raw"
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F("search_vector"), query)
+        )
+
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+        table = queryset.model._meta.db_table
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        ).annotate(
+            # bm25 is lower for better matches
+            rank=RawSQL(
+                f"SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id",
+                [match],
+                output_field=FloatField(),
+            )
+        )
+
+    query = Q()
+    for term in terms:
+        query &= Q(
+            *[Q(**{f"{field}__icontains": term}) for field in SEARCH_FIELDS],
+            _connector=Q.OR,
+        )
+    return queryset.filter(query).annotate(rank=Value(0.0, output_field=FloatField()))
@@ -1,13 +1,43 @@
-from rest_framework.serializers import ModelSerializer
-from dog_card.models import DogCardModel
+from django.utils.translation import get_language
+from rest_framework.serializers import Field, ModelSerializer, ValidationError
+from dog_card.age import MAX_AGE_MONTHS, format_age, parse_age
+from dog_card.models import GENDERS, SIZES, DogCardModel, canonical_choice
 from backblaze.serializer import FileSerializer
-from backblaze.utils.b2_utils import delete_file_from_backblaze
+from django.db import transaction
+from backblaze.utils.b2_utils import release_file
 
 # Serializers define the API representation.
 
 
+class AgeField(Field):
+    """
+    Age stored in months, shown as text in `language` (the active language by
+    default). Accepts a whole number of months, or an age typed in either
+    language such as "2 роки" or "8 months".
+    """
+
+    def __init__(self, language=None, **kwargs):
+        self.language = language
+        kwargs.setdefault("source", "age_months")
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        language = self.language or (get_language() or "uk")[:2]
+        return format_age(value, language)
+
+    def to_internal_value(self, data):
+        if isinstance(data, int) or str(data).strip().isdigit():
+            months = int(data)
+        else:
+            months = parse_age(data)
+        if months is None or not 0 <= months <= MAX_AGE_MONTHS:
+            raise ValidationError("Не вдалося розпізнати вік")
+        return months
+
+
 class DogCardSerializer(ModelSerializer):
     photo = FileSerializer()
+    age = AgeField(read_only=True)
 
     class Meta:
         model = DogCardModel
@@ -17,6 +47,7 @@ class DogCardSerializer(ModelSerializer):
             "ready_for_adoption",
             "gender",
             "age",
+            "age_months",
             "sterilization",
             "vaccination_parasite_treatment",
             "size",
@@ -27,6 +58,8 @@ class DogCardSerializer(ModelSerializer):
 
 class DogCardTranslationSerializer(ModelSerializer):
     photo = FileSerializer(allow_null=True, required=False)
+    age = AgeField(language="uk")
+    age_en = AgeField(language="en", read_only=True)
 
     class Meta:
         model = DogCardModel
@@ -39,6 +72,7 @@ class DogCardTranslationSerializer(ModelSerializer):
             "gender_en",
             "age",
             "age_en",
+            "age_months",
             "sterilization",
             "vaccination_parasite_treatment",
             "size",
@@ -47,31 +81,52 @@ class DogCardTranslationSerializer(ModelSerializer):
             "description_en",
             "photo",
         )
+        read_only_fields = ("age_months",)
         extra_kwargs = {
             "sterilization": {"required": False},
             "vaccination_parasite_treatment": {"required": False},
         }
 
+    def validate(self, attrs):
+        """
+        Stores gender and size as the canonical Ukrainian value with its
+        English translation, whichever language they were sent in, so the
+        catalog can match them exactly.
+        """
+        for field, translations in (("gender", GENDERS), ("size", SIZES)):
+            value = attrs.pop(field, None)
+            attrs.pop(f"{field}_en", None)
+            if value is None:
+                continue
+            uk = canonical_choice(value, translations)
+            attrs[f"{field}_uk"] = uk
+            attrs[f"{field}_en"] = translations[uk]
+        return attrs
+
     def create(self, validated_data):
         photo_data = self.context["request"].FILES.get("photo", None)
-        if photo_data is not None:
-            photo_obj = self.context["view"].handle_photo(photo_data, None)
-            validated_data["photo"] = photo_obj
-            dog_card = DogCardModel.objects.create(**validated_data)
+        # A reused photo stays locked until the card references it
+        with transaction.atomic():
+            if photo_data is not None:
+                photo_obj = self.context["view"].handle_photo(photo_data, None)
+                validated_data["photo"] = photo_obj
+                dog_card = DogCardModel.objects.create(**validated_data)
         return dog_card
 
     def update(self, instance, validated_data):
         photo_data = self.context["request"].FILES.get("photo", None)
-        if photo_data is not None:
-            photo_obj = self.context["view"].handle_photo(photo_data, instance)
-            validated_data["photo"] = photo_obj
-        dog_card = super().update(instance, validated_data)
+        with transaction.atomic():
+            if photo_data is not None:
+                photo_obj = self.context["view"].handle_photo(photo_data, instance)
+                validated_data["photo"] = photo_obj
+            dog_card = super().update(instance, validated_data)
         return dog_card
 
     def destroy(self, instance, *args, **kwargs):
-        if self.photo:
-            delete_file_from_backblaze(self.photo_id)
-        super().delete(*args, **kwargs)
+        photo = self.photo
+        with transaction.atomic():
+            super().delete(*args, **kwargs)
+            release_file(photo)
 
 
 class DogForPick(ModelSerializer):
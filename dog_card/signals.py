@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from backblaze.models import FileModel
+from backblaze.signals import files_updated
+from dog_card.cache import invalidate_catalog
+from dog_card.models import DogCardModel
+from dog_card.search import SEARCH_FIELDS, remove_from_search_index, update_search_index
+
+
+@receiver(post_save, sender=DogCardModel)
+def refresh_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & {
+        "name",
+        "description",
+        *SEARCH_FIELDS,
+    }:
+        return
+    update_search_index(instance)
+
+
+@receiver(post_delete, sender=DogCardModel)
+def drop_from_search_index(sender, instance, **kwargs):
+    remove_from_search_index(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=DogCardModel)
+def invalidate_catalog_on_card_change(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=FileModel)
+def invalidate_catalog_on_photo_change(sender, instance, **kwargs):
+    # Deleting a photo deletes its cards, which invalidates through them
+    if DogCardModel.objects.filter(photo_id=instance.pk).exists():
+        invalidate_catalog()
+
+
+@receiver(files_updated, sender=FileModel)
+def invalidate_catalog_on_photo_update(sender, pks, **kwargs):
+    if DogCardModel.objects.filter(photo_id__in=pks).exists():
+        invalidate_catalog()
@@ -1,3 +1,500 @@
-from django.test import TestCase
+from io import BytesIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+from backblaze.models import FileModel
+from backblaze.utils.image_jobs import process_pending_jobs, submit_image
+from dog_card.age import format_age, parse_age
+from dog_card.cache import clear as clear_catalog_cache, current_version, stats
+from dog_card.models import DogCardModel
 
-# Create your tests here.
+
+def make_photo(color=(120, 80, 40)):
+    byte_arr = BytesIO()
+    Image.new("RGB", (64, 48), color).save(byte_arr, format="PNG")
+    return SimpleUploadedFile("dog.png", byte_arr.getvalue())
+
+
+def make_dog(name, age_months, **fields):
+    # Translated fields are set per column: `gender=` would write to the
+    # column of whichever language the last request activated
+    defaults = {"gender": "хлопчик", "size": "середній", "description": "Добрий"}
+    defaults.update(fields)
+    columns = {
+        (f"{field}_uk" if field in ("gender", "size", "description") else field): value
+        for field, value in defaults.items()
+    }
+    return DogCardModel.objects.create(
+        name_uk=name, name_en=name, age_months=age_months, **columns
+    )
+
+
+class CatalogTestCase(TestCase):
+    """
+    Starts every test with an empty catalog cache. Entries only roll back
+    with the test transaction when the cache is a database table.
+    """
+
+    def setUp(self):
+        clear_catalog_cache()
+
+
+class AgeTests(TestCase):
+    def test_parses_the_ways_ages_were_typed(self):
+        cases = {
+            "8 місяців": 8,
+            "1 місяць": 1,
+            "1 рік": 12,
+            "1,5 роки": 18,
+            "1,5 року": 18,
+            "2 роки": 24,
+            "10 років": 120,
+            "1 рік 3 місяці": 15,
+            "8 months": 8,
+            "2.5 years": 30,
+            "3 тижні": 1,
+        }
+        for text, months in cases.items():
+            self.assertEqual(parse_age(text), months, text)
+        self.assertIsNone(parse_age("не знаю"))
+        self.assertIsNone(parse_age(""))
+
+    def test_formats_in_both_languages(self):
+        cases = [
+            (1, "1 місяць", "1 month"),
+            (3, "3 місяці", "3 months"),
+            (11, "11 місяців", "11 months"),
+            (12, "1 рік", "1 year"),
+            (18, "1,5 року", "1.5 years"),
+            (27, "2 роки 3 місяці", "2 years 3 months"),
+            (60, "5 років", "5 years"),
+            (252, "21 рік", "21 years"),
+        ]
+        for months, uk, en in cases:
+            self.assertEqual(format_age(months, "uk"), uk)
+            self.assertEqual(format_age(months, "en"), en)
+            self.assertEqual(parse_age(uk), months)
+            self.assertEqual(parse_age(en), months)
+
+
+@override_settings(
+    IMAGE_JOBS_ASYNC=False,
+    IMAGE_POOL_SIZE=0,
+    IMAGE_STORAGE_BACKEND="backblaze.utils.storage.InMemoryStorage",
+)
+class AgeSearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        make_dog("Бім", 6)
+        make_dog("Рекс", 12)
+        make_dog("Сірко", 41)
+        make_dog("Лорд", 42)
+        make_dog("Джек", 150)
+
+    def search(self, age, language="uk"):
+        response = self.client.get(
+            reverse("search_dogs_cards"), {"age": age}, HTTP_ACCEPT_LANGUAGE=language
+        )
+        return response
+
+    def test_categories_are_month_ranges(self):
+        expected = {
+            "щеня": ["Бім"],
+            "puppy": ["Бім"],
+            "молода собака": ["Рекс", "Сірко"],
+            "young dog": ["Рекс", "Сірко"],
+            "доросла собака": ["Лорд", "Джек"],
+            "adult dog": ["Лорд", "Джек"],
+        }
+        for age, names in expected.items():
+            response = self.search(age)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, age)
+            self.assertEqual([dog["name"] for dog in response.json()["results"]], names, age)
+
+    def test_age_filter_is_a_range_on_the_indexed_column(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search("молода собака")
+        sql = next(query["sql"] for query in queries if "dog_card_dogcardmodel" in query["sql"])
+        self.assertIn('"age_months" BETWEEN 12 AND 41', sql)
+
+    def test_unknown_category_finds_nothing(self):
+        self.assertEqual(self.search("старенький").status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_age_text_follows_the_language(self):
+        self.assertEqual(self.search("puppy", "uk").json()["results"][0]["age"], "6 місяців")
+        self.assertEqual(self.search("puppy", "en").json()["results"][0]["age"], "6 months")
+        self.assertEqual(self.search("puppy", "en").json()["results"][0]["age_months"], 6)
+
+    def test_admin_can_send_months_or_text(self):
+        for age, months in (("18", 18), ("2 роки", 24), ("8 months", 8)):
+            response = self.client.post(
+                reverse("dog_card"),
+                {
+                    "name": "Новий",
+                    "ready_for_adoption": True,
+                    "gender": "дівчинка",
+                    "age": age,
+                    "size": "маленький",
+                    "description": "Опис",
+                    "photo": make_photo(),
+                },
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+            self.assertEqual(response.data["age_months"], months)
+            self.assertEqual(response.data["age_en"], format_age(months, "en"))
+
+    def test_unreadable_age_is_rejected(self):
+        response = self.client.post(
+            reverse("dog_card"),
+            {
+                "name": "Новий",
+                "gender": "дівчинка",
+                "age": "не знаю",
+                "size": "маленький",
+                "description": "Опис",
+                "photo": make_photo(),
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(
+    IMAGE_JOBS_ASYNC=False,
+    IMAGE_POOL_SIZE=0,
+    IMAGE_STORAGE_BACKEND="backblaze.utils.storage.InMemoryStorage",
+)
+class CatalogFilterTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        make_dog("Бім", 6, size="маленький", gender="дівчинка", ready_for_adoption=True)
+        make_dog("Рекс", 30, size="великий", gender="хлопчик", ready_for_adoption=False)
+        make_dog("Лорд", 50, size="маленький", gender="хлопчик", ready_for_adoption=True)
+
+    def search(self, **params):
+        return self.client.get(reverse("search_dogs_cards"), params)
+
+    def names(self, **params):
+        response = self.search(**params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, params)
+        return sorted(dog["name"] for dog in response.json()["results"])
+
+    def test_filters_accept_either_language(self):
+        self.assertEqual(self.names(size="маленький"), ["Бім", "Лорд"])
+        self.assertEqual(self.names(size="Small"), ["Бім", "Лорд"])
+        self.assertEqual(self.names(gender="girl"), ["Бім"])
+        self.assertEqual(self.names(size="small", gender="хлопчик"), ["Лорд"])
+
+    def test_ready_for_adoption_is_a_boolean(self):
+        self.assertEqual(self.names(ready_for_adoption="true"), ["Бім", "Лорд"])
+        self.assertEqual(self.names(ready_for_adoption="false"), ["Рекс"])
+
+    def test_unknown_values_find_nothing(self):
+        for params in ({"size": "величезний"}, {"gender": "кіт"}, {"ready_for_adoption": "може"}):
+            self.assertEqual(self.search(**params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_are_exact_matches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search(size="small", gender="boy")
+        sql = next(query["sql"] for query in queries if "dog_card_dogcardmodel" in query["sql"])
+        self.assertIn('"size_uk" = ', sql)
+        self.assertIn('"gender_uk" = ', sql)
+        self.assertNotIn("LIKE", sql)
+
+    def test_catalog_query_uses_the_composite_index(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+        plan = DogCardModel.objects.filter(
+            size_uk="маленький", gender_uk="хлопчик", age_months__range=(12, 41)
+        ).explain()
+        self.assertIn("dog_card_catalog_idx", plan)
+
+    def test_admin_values_are_stored_canonically(self):
+        response = self.client.post(
+            reverse("dog_card"),
+            {
+                "name": "Новий",
+                "gender": "girl",
+                "age": "2",
+                "size": "medium",
+                "description": "Опис",
+                "photo": make_photo(),
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        dog = DogCardModel.objects.get(pk=response.data["id"])
+        self.assertEqual((dog.gender_uk, dog.gender_en), ("дівчинка", "girl"))
+        self.assertEqual((dog.size_uk, dog.size_en), ("середній", "medium"))
+
+
+@override_settings(CATALOG_PAGE_SIZE=2, CATALOG_MAX_PAGE_SIZE=3)
+class CatalogPaginationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        self.dogs = [make_dog(f"Пес {number}", 6) for number in range(5)]
+
+    def follow(self, url, params=None):
+        names = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.json()["results"]), 2)
+            names += [dog["name"] for dog in response.json()["results"]]
+            url, params = response.json()["next"], None
+        return names
+
+    def test_pages_follow_next_links(self):
+        expected = [dog.name for dog in self.dogs]
+        self.assertEqual(self.follow(reverse("search_dogs_cards")), expected)
+        self.assertEqual(self.follow(reverse("search_dogs_cards"), {"age": "puppy"}), expected)
+        self.assertEqual(self.follow(reverse("dog_card")), expected)
+
+    def test_page_is_a_keyset_range(self):
+        first = self.client.get(reverse("search_dogs_cards"))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.json()["next"])
+        sql = next(query["sql"] for query in queries if "dog_card_dogcardmodel" in query["sql"])
+        self.assertIn(f'"id" > {self.dogs[1].pk}', sql)
+        self.assertIn("LIMIT 3", sql)
+        self.assertNotIn("OFFSET", sql)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(reverse("search_dogs_cards"), {"page_size": 50})
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_bad_cursor_is_not_found(self):
+        response = self.client.get(reverse("search_dogs_cards"), {"cursor": "зламаний"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TextSearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        self.bim = make_dog("Бім", 6, description="Любить гратися з м'ячем")
+        self.rex = make_dog("Рекс", 30, description="Спокійний, дружить з Бімом")
+        DogCardModel.objects.filter(pk=self.bim.pk).update(description_en="Loves playing ball")
+        self.bim.refresh_from_db()
+        self.bim.save()
+
+    def names(self, q, **params):
+        response = self.client.get(reverse("search_dogs_cards"), {"q": q, **params})
+        if response.status_code == status.HTTP_400_BAD_REQUEST:
+            return []
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [dog["name"] for dog in response.json()["results"]]
+
+    def test_names_rank_above_descriptions(self):
+        self.assertEqual(self.names("бім"), ["Бім", "Рекс"])
+
+    def test_searches_both_languages_by_word_prefix(self):
+        self.assertEqual(self.names("спокій"), ["Рекс"])
+        self.assertEqual(self.names("play ball"), ["Бім"])
+        self.assertEqual(self.names("play кіт"), [])
+
+    def test_combines_with_filters(self):
+        self.assertEqual(self.names("бім", age="young dog"), ["Рекс"])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.bim.delete()
+        self.assertEqual(self.names("бім"), ["Рекс"])
+        self.rex.description_uk = "Сторожовий"
+        self.rex.save()
+        self.assertEqual(self.names("спокій"), [])
+        self.assertEqual(self.names("сторож"), ["Рекс"])
+
+    @override_settings(CATALOG_PAGE_SIZE=1)
+    def test_ranked_results_page(self):
+        first = self.client.get(reverse("search_dogs_cards"), {"q": "бім"})
+        second = self.client.get(first.json()["next"])
+        self.assertEqual([dog["name"] for dog in first.json()["results"]], ["Бім"])
+        self.assertEqual([dog["name"] for dog in second.json()["results"]], ["Рекс"])
+        self.assertIsNone(second.json()["next"])
+
+    @override_settings(CATALOG_PAGE_SIZE=2)
+    def test_equal_ranks_span_pages(self):
+        best = make_dog("Близнюк", 12, description="Близнюк")
+        twins = [make_dog("Лорд", 12, description="Близнюк") for _ in range(5)]
+        expected = [best.pk] + [dog.pk for dog in twins]
+        pages = [expected[:2], expected[2:4], expected[4:]]
+
+        response = self.client.get(reverse("search_dogs_cards"), {"q": "близнюк"})
+        # Forward, back across the tie, then forward again to the end
+        for link, page in (("next", 1), ("previous", 0), ("next", 1), ("next", 2)):
+            response = self.client.get(response.json()[link])
+            self.assertEqual([dog["id"] for dog in response.json()["results"]], pages[page])
+        self.assertIsNone(response.json()["next"])
+
+    def test_query_without_words_finds_nothing(self):
+        self.assertEqual(self.names("!!!"), [])
+
+
+class CatalogCacheTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        self.photo = FileModel.objects.create(id="photo", name="dog.webp", category="image")
+        self.dog = make_dog("Бім", 6, size="маленький", photo=self.photo)
+
+    def search(self, **params):
+        headers = {key: params.pop(key) for key in list(params) if key.startswith("HTTP_")}
+        response = self.client.get(reverse("search_dogs_cards"), params, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def card_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            self.search(**params)
+        return [query for query in queries if "dog_card_dogcardmodel" in query["sql"]]
+
+    def test_equal_searches_share_one_entry(self):
+        first = self.search(size="маленький")
+        before = stats()
+        self.assertEqual(self.card_queries(size="Small"), [])
+        self.assertEqual(self.search(size="small").content, first.content)
+        self.assertEqual(stats()["hits"], before["hits"] + 2)
+        self.assertEqual(stats()["misses"], before["misses"])
+
+    def test_language_is_part_of_the_key(self):
+        self.search()
+        self.assertNotEqual(self.card_queries(HTTP_ACCEPT_LANGUAGE="en"), [])
+        self.assertEqual(self.card_queries(HTTP_ACCEPT_LANGUAGE="en"), [])
+        # Every client gets the same image sources
+        self.assertEqual(self.card_queries(HTTP_ACCEPT="application/json, image/avif"), [])
+
+    def test_card_writes_invalidate(self):
+        self.search()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dog.name_uk = "Бімко"
+            self.dog.save()
+        self.assertEqual(self.search().json()["results"][0]["name"], "Бімко")
+        with self.captureOnCommitCallbacks(execute=True):
+            make_dog("Рекс", 30)
+        self.assertEqual(len(self.search().json()["results"]), 2)
+
+    def test_only_photos_shown_on_cards_invalidate(self):
+        version = current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            FileModel.objects.create(id="other", name="news.webp", category="image")
+        self.assertEqual(current_version(), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.photo.status = FileModel.READY
+            self.photo.save()
+        self.assertNotEqual(current_version(), version)
+
+    @override_settings(
+        IMAGE_JOBS_ASYNC=True, IMAGE_STORAGE_BACKEND="backblaze.utils.storage.InMemoryStorage"
+    )
+    def test_finished_and_failed_jobs_invalidate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dog.photo = submit_image(make_photo())
+            self.dog.save()
+        self.assertEqual(self.search().json()["results"][0]["photo"]["status"], "pending")
+        with self.captureOnCommitCallbacks(execute=True):
+            process_pending_jobs()
+        self.assertEqual(self.search().json()["results"][0]["photo"]["status"], "ready")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dog.photo = submit_image(make_photo(color=(0, 0, 0)))
+            self.dog.save()
+        with mock.patch("backblaze.utils.image_jobs.MAX_ATTEMPTS", 1), mock.patch(
+            "backblaze.utils.image_jobs.convert_upload", side_effect=ValueError("broken")
+        ), self.captureOnCommitCallbacks(execute=True):
+            process_pending_jobs()
+        self.assertEqual(self.search().json()["results"][0]["photo"]["status"], "failed")
+
+    def test_hits_do_not_write(self):
+        self.search()
+        with CaptureQueriesContext(connection) as queries:
+            self.search()
+        writes = [query for query in queries if not query["sql"].startswith("SELECT")]
+        self.assertEqual(writes, [])
+
+    def test_counters_are_exposed(self):
+        self.search()
+        self.search()
+        response = self.client.get(reverse("catalog_cache_stats"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["hits"], response.data["misses"]), (1, 1))
+        self.assertEqual(response.data["hit_ratio"], 0.5)
+
+
+class CatalogFacetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "password")
+        )
+        make_dog("Бім", 6, size="маленький", gender="хлопчик", ready_for_adoption=True)
+        make_dog("Рекс", 30, size="великий", gender="хлопчик", ready_for_adoption=True)
+        make_dog("Люся", 50, size="маленький", gender="дівчинка", ready_for_adoption=False)
+
+    def facets(self, **params):
+        headers = {key: params.pop(key) for key in list(params) if key.startswith("HTTP_")}
+        return self.client.get(reverse("catalog_facets"), params, **headers)
+
+    def test_counts_every_option(self):
+        response = self.facets()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {
+                "total": 3,
+                "size": {"маленький": 2, "середній": 0, "великий": 1},
+                "gender": {"хлопчик": 2, "дівчинка": 1},
+                "age": {"щеня": 1, "молода собака": 1, "доросла собака": 1},
+                "ready_for_adoption": {"true": 2, "false": 1},
+            },
+        )
+
+    def test_each_facet_keeps_the_other_filters(self):
+        facets = self.facets(size="small", HTTP_ACCEPT_LANGUAGE="en").json()
+        self.assertEqual(facets["total"], 2)
+        # Other sizes are counted as if chosen instead of small
+        self.assertEqual(facets["size"], {"small": 2, "medium": 0, "large": 1})
+        self.assertEqual(facets["gender"], {"boy": 1, "girl": 1})
+        self.assertEqual(facets["age"], {"puppy": 1, "young dog": 0, "adult dog": 1})
+
+    def test_text_search_narrows_the_counts(self):
+        self.assertEqual(self.facets(q="рекс").json()["total"], 1)
+
+    def test_counts_come_from_one_query_and_are_cached(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.facets(gender="girl")
+        card_queries = [query for query in queries if "dog_card_dogcardmodel" in query["sql"]]
+        self.assertEqual(len(card_queries), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.facets(gender="дівчинка")
+        self.assertFalse(any("dog_card_dogcardmodel" in query["sql"] for query in queries))
+        with self.captureOnCommitCallbacks(execute=True):
+            make_dog("Жужа", 8, gender="дівчинка")
+        self.assertEqual(self.facets(gender="girl").json()["total"], 2)
+
+    def test_unknown_filter_is_rejected(self):
+        self.assertEqual(self.facets(size="величезний").status_code, status.HTTP_400_BAD_REQUEST)
@@ -4,4 +4,4 @@ from .models import DogCardModel
 
 @register(DogCardModel)
 class DogCardTranslationOptions(TranslationOptions):
-    fields = ('name', 'description', 'gender', 'age', 'size',)
+    fields = ('name', 'description', 'gender', 'size',)
@@ -1,8 +1,18 @@
 from django.urls import path
-from dog_card.views import DogCardSearch, DogCardView
+from dog_card.views import CatalogCacheStatsView, DogCardSearch, DogCardView
 
 urlpatterns = [
     path("catalog/", DogCardSearch.as_view({"get": "list"}), name="search_dogs_cards"),
+    path(
+        "catalog/facets",
+        DogCardSearch.as_view({"get": "facets"}),
+        name="catalog_facets",
+    ),
+    path(
+        "catalog/cache",
+        CatalogCacheStatsView.as_view({"get": "list"}),
+        name="catalog_cache_stats",
+    ),
     path(
         "dog_card",
         DogCardView.as_view({"get": "list", "post": "create"}),
@@ -1,16 +1,24 @@
 from rest_framework import status, mixins
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from dog_card.models import DogCardModel
+from dog_card.age import AGE_CATEGORY_NAMES, age_filter
+from dog_card.models import GENDERS, SIZES, DogCardModel, canonical_choice
+from dog_card.pagination import DogCardPagination
+from dog_card.cache import cache_key, get_response, set_response, stats
+from dog_card.search import search_cards, search_terms
 from rest_framework.response import Response
 from dog_card.serializer import DogCardSerializer, DogCardTranslationSerializer
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, Q
+from django.http import HttpResponse
+from django.utils.translation import get_language
 from api.models import IsApprovedUser
-from backblaze.models import FileModel
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.viewsets import GenericViewSet
-from backblaze.utils.b2_utils import converter_to_webP, delete_file_from_backblaze
+from backblaze.utils.b2_utils import release_file
+from backblaze.utils.image_jobs import submit_image
 from drf_spectacular.types import OpenApiTypes
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import JSONRenderer
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiParameter,
@@ -20,193 +28,202 @@ from drf_spectacular.utils import (
 # Create your views here.
 
 
+# Query parameters shared by the catalog and its facets
+SEARCH_PARAMETERS = [
+    OpenApiParameter(
+        name="Accept-Language",
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.HEADER,
+        required=False,
+        description="Specify the language for content localization.",
+        enum=["en", "uk"],
+    ),
+    OpenApiParameter(
+        name="q",
+        description="Words to find in dog names and descriptions, in Ukrainian or English. "
+        "Every word must match the start of a word in the card; the best matches come first.",
+        required=False,
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+    ),
+    OpenApiParameter(
+        name="age",
+        description='Filter by age category. Supported values are "puppy", "young dog", "adult dog" and their Ukrainian equivalents.',
+        required=False,
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        enum=[
+            "щеня",
+            "молода собака",
+            "доросла собака",
+            "puppy",
+            "young dog",
+            "adult dog",
+        ],
+    ),
+    OpenApiParameter(
+        name="size",
+        description='Filter by size category. Supported values are "small", "medium", "large" and their Ukrainian equivalents.',
+        required=False,
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        enum=["small", "medium", "large", "маленький", "середній", "великий"],
+    ),
+    OpenApiParameter(
+        name="gender",
+        description='Filter by gender. Supported values are "boy", "girl" and their Ukrainian equivalents.',
+        required=False,
+        type=OpenApiTypes.STR,
+        location=OpenApiParameter.QUERY,
+        enum=["boy", "girl", "хлопчик", "дівчинка"],
+    ),
+    OpenApiParameter(
+        name="ready_for_adoption",
+        description='Filter by adoption readiness status. Expected boolean values "true" or "false".',
+        required=False,
+        type=OpenApiTypes.BOOL,
+        location=OpenApiParameter.QUERY,
+    ),
+]
+
+
 class DogCardSearch(mixins.ListModelMixin, GenericViewSet):
     """
     A viewset that provides list operations for searching DogCardModel instances
-    based on age, size, gender, and adoption status.
+    based on age, size, gender, adoption status and free text. Results are
+    paginated by id with DogCardPagination, or by rank for text searches.
     """
 
     permission_classes = [AllowAny]
+    pagination_class = DogCardPagination
 
-    def age_years(self, *, lower_bound, upper_bound):
-        """
-        Generates a list of age descriptions in years from lower_bound to upper_bound.
-
-        The method accounts for language specifics related to age descriptions,
-        providing appropriate suffixes based on the age.
-
-        Args:
-            lower_bound (int): The minimum age in months to include in the age range.
-            upper_bound (int): The maximum age in months to include in the age range.
+    def parse_bool(self, value):
+        return {"true": True, "1": True, "false": False, "0": False}.get(value.strip().lower())
 
-        Returns:
-            list: A list of strings describing ages in years, adjusted for language nuances.
+    def search_filters(self, *, age, size, gender, ready_for_adoption):
         """
-        possible_ages = []
-        lower_bound_years = max(1, lower_bound / 12)
-        upper_bound_years = upper_bound / 12
-
-        age_years = lower_bound_years
-        while age_years <= upper_bound_years:
-            if age_years == 1:
-                year_str = "рік"
-            elif 1 < age_years < 5 or (age_years % 1 == 0.5 and age_years <= 4.5):
-                year_str = "роки"
-            else:
-                year_str = "років"
-
-            year_num = (
-                f"{int(age_years)}"
-                if age_years % 1 == 0
-                else f"{age_years:.1f}".replace(".", ",")
-            )
-
-            possible_ages.append(f"{year_num} {year_str}")
-
-            age_years += 0.5
-        return possible_ages
-
-    def age_in_months(self, *, lower_bound, upper_bound):
+        The condition each given filter adds, by parameter name, or None if a
+        value is unknown. Filters are exact matches on the Ukrainian columns,
+        which dog_card_catalog_idx covers, or the single-column indexes when
+        no size is given; values in either language are accepted.
         """
-        Generates a list of age strings in months and years between the specified bounds.
-
-        Args:
-            lower_bound (float): The lower bound of age in months.
-            upper_bound (float): The upper bound of age in months.
-
-        Returns:
-            list: A list of age strings in months and years.
-        """
-        possible_ages = []
-        age_months = lower_bound
-        while age_months <= upper_bound:
-            if age_months in [1, 2, 3, 4]:
-                month_str = "місяць" if age_months == 1 else "місяці"
-            else:
-                month_str = "місяців"
-
-                age_str = (
-                    f"{age_months:.1f}" if age_months % 1 else f"{int(age_months)}"
-                )
-                possible_ages.append(f"{age_str} {month_str}")
-
-            age_months += 0.5
-        if upper_bound >= 12 and "1 рік" not in possible_ages:
-            possible_ages.append("1 рік")
-        return possible_ages
-
-    def get_age_range(self, *, age_category):
-        """
-        Determines the age range for a given age category and generates age descriptions
-        either in months or years based on the category.
-
-        Args:
-            age_category (str): A string representing the age category of the dog. Expected values
-                                include 'щеня' (puppy), 'молода собака' (young dog), and 'доросла собака' (adult dog),
-                                with their English equivalents.
-
-        Returns:
-            list: A list of strings representing age descriptions within the specified range.
-                The descriptions are in months for puppies and in years for older dogs.
-        """
-        age_ranges = {
-            "щеня": (0, 12),
-            "puppy": (0, 12),
-            "молода собака": (12, 36),
-            "young dog": (12, 36),
-            "доросла собака": (42, 240),
-            "adult dog": (42, 240),
-        }
-
-        lower_bound, upper_bound = age_ranges.get(age_category, (0, 0))
-        # Generate age descriptions based on whether the age range falls below or above 12 months
-        if lower_bound < 12:
-            return self.age_in_months(lower_bound=lower_bound, upper_bound=upper_bound)
-        elif lower_bound >= 12:
-            return self.age_years(lower_bound=lower_bound, upper_bound=upper_bound)
+        filters = {}
+        if age:
+            age_range = age_filter(age)
+            if age_range is None:
+                return None
+            # Indexed BETWEEN on the age in months
+            filters["age"] = Q(**age_range)
+        if size:
+            size = canonical_choice(size, SIZES)
+            if size is None:
+                return None
+            filters["size"] = Q(size_uk=size)
+        if gender:
+            gender = canonical_choice(gender, GENDERS)
+            if gender is None:
+                return None
+            filters["gender"] = Q(gender_uk=gender)
+        if ready_for_adoption:
+            ready_for_adoption = self.parse_bool(ready_for_adoption)
+            if ready_for_adoption is None:
+                return None
+            filters["ready_for_adoption"] = Q(ready_for_adoption=ready_for_adoption)
+        return filters
 
-    def search_dogs_cards(self, *, age, size, gender, ready_for_adoption):
+    def search_dogs_cards(self, *, age, size, gender, ready_for_adoption, text=""):
         """
         Constructs a query to search for DogCardModel instances based on specified criteria.
+        Unknown filter values match nothing.
 
         Args:
             age (str): Age category to filter by.
             size (str): Size category to filter by.
             gender (str): Gender to filter by.
             ready_for_adoption (str): Adoption readiness to filter by, expects 'true' or 'false'.
+            text (str): Words to look for in names and descriptions; matches are ranked.
 
         Returns:
             QuerySet: A queryset of filtered DogCardModel instances.
         """
-        query = Q()
-        if age:
-            age_range = self.get_age_range(age_category=age)
-            query &= Q(age_uk__in=age_range)
-        if size:
-            # Assuming exact match is more appropriate
-            query &= Q(size__icontains=size)
-        if gender:
-            # Assuming exact match is more appropriate
-            query &= Q(gender__icontains=gender)
-        if ready_for_adoption:
-            query &= Q(ready_for_adoption__icontains=ready_for_adoption)
-        if not any([age, size, gender, ready_for_adoption]):
-            return DogCardModel.objects.all()
-
-        searched_cards = DogCardModel.objects.filter(query).prefetch_related("photo")
+        filters = self.search_filters(
+            age=age, size=size, gender=gender, ready_for_adoption=ready_for_adoption
+        )
+        if filters is None:
+            return DogCardModel.objects.none()
+        searched_cards = DogCardModel.objects.filter(*filters.values()).prefetch_related("photo")
+        if text:
+            searched_cards = search_cards(searched_cards, text)
         return searched_cards
 
+    def count_facets(self, *, age, size, gender, ready_for_adoption, text=""):
+        """
+        Counts the cards each filter option would find, keeping the other
+        active filters, in one aggregate query with a conditional COUNT per
+        option. Options are named in the active language. Returns None if a
+        filter value is unknown.
+        """
+        filters = self.search_filters(
+            age=age, size=size, gender=gender, ready_for_adoption=ready_for_adoption
+        )
+        if filters is None:
+            return None
+        language = "en" if (get_language() or "uk")[:2] == "en" else "uk"
+        options = {
+            "size": {
+                (en if language == "en" else uk): Q(size_uk=uk) for uk, en in SIZES.items()
+            },
+            "gender": {
+                (en if language == "en" else uk): Q(gender_uk=uk) for uk, en in GENDERS.items()
+            },
+            "age": {name: Q(**age_filter(name)) for name in AGE_CATEGORY_NAMES[language]},
+            "ready_for_adoption": {
+                "true": Q(ready_for_adoption=True),
+                "false": Q(ready_for_adoption=False),
+            },
+        }
+
+        def count(facet, condition=Q()):
+            condition &= Q(*[q for name, q in filters.items() if name != facet])
+            return Count("id", filter=condition or None)
+
+        aggregates = {"total": count(None)}
+        for facet, choices in options.items():
+            for index, condition in enumerate(choices.values()):
+                aggregates[f"{facet}_{index}"] = count(facet, condition)
+        cards = DogCardModel.objects.all()
+        if text:
+            cards = search_cards(cards, text)
+        counts = cards.aggregate(**aggregates)
+
+        facets = {"total": counts["total"]}
+        for facet, choices in options.items():
+            facets[facet] = {
+                option: counts[f"{facet}_{index}"] for index, option in enumerate(choices)
+            }
+        return facets
+
+    def search_key(self, *, age, size, gender, ready_for_adoption, text):
+        """
+        The search as a tuple that is equal for searches finding the same
+        cards, e.g. size=small and size=маленький. Unknown values are kept as given.
+        """
+        age_range = age_filter(age) if age else None
+        ready = self.parse_bool(ready_for_adoption) if ready_for_adoption else None
+        return (
+            tuple(age_range.items()) if age_range else age,
+            (canonical_choice(size, SIZES) or size) if size else "",
+            (canonical_choice(gender, GENDERS) or gender) if gender else "",
+            ready_for_adoption if ready is None else ready,
+            tuple(search_terms(text)),
+        )
+
     @extend_schema(
         summary="Search dog cards based on various criteria",
-        description="Performs a search across dog cards using filters like age, size, gender, and adoption status.",
-        parameters=[
-            OpenApiParameter(
-                name="Accept-Language",
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.HEADER,
-                required=False,
-                description="Specify the language for content localization.",
-                enum=["en", "uk"],
-            ),
-            OpenApiParameter(
-                name="age",
-                description='Filter by age category. Supported values are "puppy", "young dog", "adult dog" and their Ukrainian equivalents.',
-                required=False,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.QUERY,
-                enum=[
-                    "щеня",
-                    "молода собака",
-                    "доросла собака",
-                    "puppy",
-                    "young dog",
-                    "adult dog",
-                ],
-            ),
-            OpenApiParameter(
-                name="size",
-                description='Filter by size category. Supported values are "small", "medium", "large" and their Ukrainian equivalents.',
-                required=False,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.QUERY,
-                enum=["small", "medium", "large", "маленький", "середній", "великий"],
-            ),
-            OpenApiParameter(
-                name="gender",
-                description='Filter by gender. Supported values are "boy", "girl" and their Ukrainian equivalents.',
-                required=False,
-                type=OpenApiTypes.STR,
-                location=OpenApiParameter.QUERY,
-                enum=["boy", "girl", "хлопчик", "дівчинка"],
-            ),
-            OpenApiParameter(
-                name="ready_for_adoption",
-                description='Filter by adoption readiness status. Expected boolean values "true" or "false".',
-                required=False,
-                type=OpenApiTypes.BOOL,
-                location=OpenApiParameter.QUERY,
-            ),
-        ],
+        description="Performs a search across dog cards using filters like age, size, gender, and adoption status, "
+        "and a full-text search over names and descriptions. "
+        "Results come a page at a time; follow the `next` link for more.",
+        parameters=SEARCH_PARAMETERS,
         responses={
             200: DogCardSerializer(many=True),
             400: {"message": "Карт не знайдено"},
@@ -216,25 +233,89 @@ class DogCardSearch(mixins.ListModelMixin, GenericViewSet):
         """
         Overrides the default list method to incorporate search functionality based on query parameters.
         """
+        search = self.search_params(request)
+        return self.cached_json(request, search, lambda: self.search_response(request, search))
+
+    @extend_schema(
+        summary="Count dog cards per catalog filter option",
+        description="For each size, gender, age category and adoption status, the number of cards "
+        "the catalog would find with that option and the other given filters. "
+        "Options are named in the requested language.",
+        parameters=SEARCH_PARAMETERS,
+        responses={
+            200: {"description": "Кількість карт для кожного фільтра"},
+            400: {"message": "Невідомий фільтр"},
+        },
+    )
+    def facets(self, request, *args, **kwargs):
+        search = self.search_params(request)
+        return self.cached_json(request, search, lambda: self.facets_response(search))
+
+    def search_params(self, request):
+        return {
+            "age": request.GET.get("age", ""),
+            "size": request.GET.get("size", ""),
+            "gender": request.GET.get("gender", ""),
+            "ready_for_adoption": request.GET.get("ready_for_adoption", ""),
+            "text": request.GET.get("q", ""),
+        }
+
+    def cached_json(self, request, search, build):
+        """
+        Returns the JSON response for search from the catalog cache, or builds
+        it with build() and caches it; see dog_card.cache. Other formats are
+        always built.
+        """
+        if request.accepted_renderer.format != "json":
+            return build()
+
+        key = cache_key(request, self.search_key(**search))
+        cached = get_response(key)
+        if cached is None:
+            response = build()
+            if response.status_code >= 500:
+                return response
+            cached = (response.status_code, JSONRenderer().render(response.data))
+            set_response(key, *cached)
+        status_code, content = cached
+        return HttpResponse(content, status=status_code, content_type="application/json")
+
+    def search_response(self, request, search):
+        """
+        Searches with the given parameters and returns a page of cards.
+        """
         try:
-            search_age = request.GET.get("age", "")
-            search_size = request.GET.get("size", "")
-            search_gender = request.GET.get("gender", "")
-            serach_ready_for_adoption = request.GET.get("ready_for_adoption", "")
-
-            searched_dogs_cards = self.search_dogs_cards(
-                age=search_age,
-                size=search_size,
-                gender=search_gender,
-                ready_for_adoption=serach_ready_for_adoption,
-            )
-            if searched_dogs_cards:
-                serializers = DogCardSerializer(searched_dogs_cards, many=True)
-                return Response(serializers.data, status=status.HTTP_200_OK)
-            else:
+            searched_dogs_cards = self.search_dogs_cards(**search)
+            page = self.paginate_queryset(searched_dogs_cards)
+            if not page and not request.GET.get(self.paginator.cursor_query_param):
                 return Response(
                     {"message": "Карт не знайдено"}, status=status.HTTP_400_BAD_REQUEST
                 )
+            serializers = DogCardSerializer(
+                page, many=True, context=self.get_serializer_context()
+            )
+            return self.get_paginated_response(serializers.data)
+        except NotFound:
+            return Response(
+                {"message": "Сторінку не знайдено"}, status=status.HTTP_404_NOT_FOUND
+            )
+        except Exception:
+            return Response(
+                {"message": "Помилка сервера"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+    def facets_response(self, search):
+        """
+        Counts the cards per filter option for the given parameters.
+        """
+        try:
+            facets = self.count_facets(**search)
+            if facets is None:
+                return Response(
+                    {"message": "Невідомий фільтр"}, status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(facets, status=status.HTTP_200_OK)
         except Exception:
             return Response(
                 {"message": "Помилка сервера"},
@@ -242,6 +323,23 @@ class DogCardSearch(mixins.ListModelMixin, GenericViewSet):
             )
 
 
+class CatalogCacheStatsView(GenericViewSet):
+    """
+    Exposes the catalog cache counters.
+    """
+
+    permission_classes = [IsAuthenticated, IsApprovedUser]
+
+    @extend_schema(
+        summary="Get catalog cache metrics",
+        description="Hits, misses and hit ratio of the /catalog/ response cache "
+        "for the gunicorn worker that answered, and the current cache version.",
+        responses={200: {"description": "Метрики кешу каталогу"}},
+    )
+    def list(self, request):
+        return Response(stats(), status=status.HTTP_200_OK)
+
+
 class DogCardView(
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
@@ -251,7 +349,8 @@ class DogCardView(
 ):
     """
     ViewSet for handling CRUD operations for DogCardModel instances.
-    Allows listing, creating, updating, and deleting dog cards.
+    Allows listing, creating, updating, and deleting dog cards. The list is
+    paginated by id with DogCardPagination.
 
     Attributes:
         permission_classes: Enforces authentication and user approval.
@@ -264,6 +363,7 @@ class DogCardView(
     parser_classes = [MultiPartParser, FormParser]
     queryset = DogCardModel.objects.all().prefetch_related("photo")
     serializer_class = DogCardTranslationSerializer
+    pagination_class = DogCardPagination
 
     def update_dog_card(self, dog_card, data):
         """
@@ -295,22 +395,25 @@ class DogCardView(
             dog_card: The DogCardModel instance to associate with the photo.
 
         Returns:
-            A FileModel instance representing the uploaded photo.
+            A FileModel instance representing the uploaded photo. It stays pending
+            until the photo is converted and uploaded.
         """
         if not photo:
             return None
-        if dog_card and dog_card.photo:
-            dog_card.photo.delete()
-            delete_file_from_backblaze(dog_card.photo_id)
+        new_photo = submit_image(photo)
+        if dog_card and dog_card.photo and dog_card.photo_id != new_photo.pk:
+            old_photo = dog_card.photo
+            with transaction.atomic():
+                dog_card.photo = new_photo
+                dog_card.save(update_fields=["photo"])
+                release_file(old_photo)
 
-        webp_image_name, webp_image_id, image_url = converter_to_webP(photo)
-        return FileModel.objects.create(
-            id=webp_image_id, name=webp_image_name, url=image_url, category="image"
-        )
+        return new_photo
 
     @extend_schema(
         summary="Retrieve a list of all dog cards",
-        description="Provides a list of all available dog cards in the system with detailed information.",
+        description="Provides a list of all available dog cards in the system with detailed information, "
+        "a page at a time; follow the `next` link for more.",
         responses={200: DogCardSerializer(many=True)},
         parameters=[
             OpenApiParameter(
@@ -353,11 +456,8 @@ class DogCardView(
                     },
                     "age": {
                         "type": "string",
-                        "description": "Age of the dog",
-                    },
-                    "age_en": {
-                        "type": "string",
-                        "description": "Age of the dog",
+                        "description": "Age of the dog in months, or as text such as "
+                        '"2 роки" or "8 months". Returned as text in both languages.',
                     },
                     "sterilization": {"type": "boolean"},
                     "vaccination_parasite_treatment": {"type": "boolean"},
@@ -445,11 +545,8 @@ class DogCardView(
                     },
                     "age": {
                         "type": "string",
-                        "description": "Age of the dog",
-                    },
-                    "age_en": {
-                        "type": "string",
-                        "description": "Age of the dog",
+                        "description": "Age of the dog in months, or as text such as "
+                        '"2 роки" or "8 months". Returned as text in both languages.',
                     },
                     "sterilization": {"type": "boolean"},
                     "vaccination_parasite_treatment": {"type": "boolean"},
@@ -538,10 +635,10 @@ class DogCardView(
         """
         try:
             card = DogCardModel.objects.get(pk=pk)
-            if card.photo:
-                delete_file_from_backblaze(card.photo_id)
-            card.photo.delete()
-            card.delete()
+            photo = card.photo
+            with transaction.atomic():
+                card.delete()
+                release_file(photo)
             return Response(
                 {"description": "Карта видалена"}, status=status.HTTP_200_OK
             )
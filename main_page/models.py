@@ -1,6 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from backblaze.models import FileModel
-from backblaze.utils.b2_utils import delete_file_from_backblaze
+from backblaze.utils.b2_utils import release_file
 
 # Create your models here.
 
@@ -26,10 +26,10 @@ class NewsModel(models.Model):
         MAX_ITEMS = 4
         if NewsModel.objects.count() > MAX_ITEMS:
             oldest_news = NewsModel.objects.all().order_by("post_at").first()
-            if oldest_news.photo is not None:
-                delete_file_from_backblaze(oldest_news.photo_id)
-                oldest_news.photo.delete()
-            oldest_news.delete()
+            photo = oldest_news.photo
+            with transaction.atomic():
+                oldest_news.delete()
+                release_file(photo)
 
     def photo_url(self):
         if self.photo:
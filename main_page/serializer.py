@@ -1,6 +1,7 @@
 from rest_framework.serializers import ModelSerializer
 from main_page.models import NewsModel as News, Partners
 from backblaze.serializer import FileSerializer
+from django.db import transaction
 from rest_framework.exceptions import ValidationError
 
 
@@ -44,18 +45,21 @@ class NewsTranslationsSerializer(ModelSerializer):
 
     def create(self, validated_data):
         photo_data = self.context["request"].FILES.get("photo", None)
-        if photo_data is not None:
-            photo_obj = self.context["view"].handle_photo(photo_data, None)
-            validated_data["photo"] = photo_obj
-            news = News.objects.create(**validated_data)
+        # A reused photo stays locked until the news item references it
+        with transaction.atomic():
+            if photo_data is not None:
+                photo_obj = self.context["view"].handle_photo(photo_data, None)
+                validated_data["photo"] = photo_obj
+                news = News.objects.create(**validated_data)
         return news
 
     def update(self, instance, validated_data):
         photo_data = self.context["request"].FILES.get("photo", None)
-        if photo_data is not None:
-            photo_obj = self.context["view"].handle_photo(photo_data, instance)
-            validated_data["photo"] = photo_obj
-        news = super().update(instance, validated_data)
+        with transaction.atomic():
+            if photo_data is not None:
+                photo_obj = self.context["view"].handle_photo(photo_data, instance)
+                validated_data["photo"] = photo_obj
+            news = super().update(instance, validated_data)
         return news
 
 
@@ -17,8 +17,9 @@ from main_page.serializer import (
 )
 from dog_card.serializer import DogCardSerializer
 from .models import NewsModel as News, Partners
-from backblaze.utils.b2_utils import converter_to_webP, delete_file_from_backblaze
-from backblaze.models import FileModel
+from django.db import transaction
+from backblaze.utils.b2_utils import release_file
+from backblaze.utils.image_jobs import submit_image
 from dog_card.models import DogCardModel
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
@@ -90,12 +91,15 @@ class MainPageView(ListModelMixin, GenericViewSet):
         dog_cards_queryset = DogCardModel.objects.all().prefetch_related("photo")
         partners_queryset = Partners.objects.all().prefetch_related("logo")
 
-        news_serializer = self.serializer_mapping[News](news_queryset, many=True)
+        context = self.get_serializer_context()
+        news_serializer = self.serializer_mapping[News](
+            news_queryset, many=True, context=context
+        )
         dog_cards_serializer = self.serializer_mapping[DogCardModel](
-            dog_cards_queryset, many=True
+            dog_cards_queryset, many=True, context=context
         )
         partners_serializer = self.serializer_mapping[Partners](
-            partners_queryset, many=True
+            partners_queryset, many=True, context=context
         )
 
         # Make response data
@@ -138,18 +142,19 @@ class NewsView(
             news: The news instance to associate the photo with, or None if creating a new news item.
 
         Returns:
-            A FileModel instance representing the uploaded and converted photo.
+            A FileModel instance representing the photo, pending until it is converted.
         """
         if not photo:
             return None
-        if news and news.photo:
-            news.photo.delete()
-            delete_file_from_backblaze(news.photo_id)
+        new_photo = submit_image(photo)
+        if news and news.photo and news.photo_id != new_photo.pk:
+            old_photo = news.photo
+            with transaction.atomic():
+                news.photo = new_photo
+                news.save(update_fields=["photo"])
+                release_file(old_photo)
 
-        webp_image_name, webp_image_id, image_url = converter_to_webP(photo)
-        return FileModel.objects.create(
-            id=webp_image_id, name=webp_image_name, url=image_url, category="image"
-        )
+        return new_photo
 
     def perform_create(self, serilaizer):
         """
@@ -364,10 +369,10 @@ class NewsView(
         """
         try:
             news_item = News.objects.get(pk=pk)
-            if news_item.photo:
-                delete_file_from_backblaze(news_item.photo_id)
-            news_item.photo.delete()
-            news_item.delete()
+            photo = news_item.photo
+            with transaction.atomic():
+                news_item.delete()
+                release_file(photo)
 
             return Response({"message": "Новина видалена"}, status=status.HTTP_200_OK)
 
@@ -400,18 +405,16 @@ class PartnersView(ListModelMixin, CreateModelMixin, DestroyModelMixin, GenericV
         """
         Handles the upload and conversion of a partner's logo to webP format. If a logo is provided,
         it is converted, and a new FileModel instance is created to represent the uploaded and converted logo.
+        SVG logos are not rasterized: they are sanitized and stored as vectors.
 
         Args:
             logo: The uploaded logo file.
 
         Returns:
-            FileModel: An instance representing the converted logo's storage details.
+            FileModel: An instance representing the logo, pending until it is converted.
         """
         if logo:
-            webp_image_name, webp_image_id, image_url = converter_to_webP(logo)
-            new_file = FileModel.objects.create(
-                id=webp_image_id, name=webp_image_name, url=image_url, category="image"
-            )
+            new_file = submit_image(logo)
         return new_file
 
     @extend_schema(
@@ -469,12 +472,14 @@ class PartnersView(ListModelMixin, CreateModelMixin, DestroyModelMixin, GenericV
         logo = request.FILES.get("logo")
         data["website"] = request.data.get("website")
         try:
-            new_file = self.upload_logo(logo=logo)
-            if new_file:
-                data["name"] = new_file.name
-                data["logo"] = new_file
-            new_partner = Partners.objects.create(**data)
-            serializer = PartnerSerializer(new_partner)
+            # A reused logo stays locked until the partner references it
+            with transaction.atomic():
+                new_file = self.upload_logo(logo=logo)
+                if new_file:
+                    data["name"] = new_file.name
+                    data["logo"] = new_file
+                new_partner = Partners.objects.create(**data)
+            serializer = PartnerSerializer(new_partner, context=self.get_serializer_context())
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except ValidationError as e:
@@ -511,10 +516,10 @@ class PartnersView(ListModelMixin, CreateModelMixin, DestroyModelMixin, GenericV
         """
         try:
             partner = Partners.objects.get(pk=pk)
-            if partner.logo is not None:
-                delete_file_from_backblaze(partner.logo_id)
-            partner.logo.delete()
-            partner.delete()
+            logo = partner.logo
+            with transaction.atomic():
+                partner.delete()
+                release_file(logo)
             return Response(
                 {"description": "Партнер був видалений"}, status=status.HTTP_200_OK
             )
@@ -143,7 +143,12 @@ REST_FRAMEWORK = {
         "rest_framework.throttling.AnonRateThrottle",
         "rest_framework.throttling.UserRateThrottle",
     ],
-    "DEFAULT_THROTTLE_RATES": {"anon": "6/minute", "user": "160/minute"},
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "6/minute",
+        "user": "160/minute",
+        # The unauthenticated local upload target, per client address
+        "direct_upload": "30/minute",
+    },
 }
 
 SPECTACULAR_SETTINGS = {
@@ -198,6 +203,63 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
 
+# Image uploads
+# When true, uploads are converted by the `process_image_jobs` worker instead
+# of inside the request.
+IMAGE_JOBS_ASYNC = os.environ.get("IMAGE_JOBS_ASYNC", "True").lower() == "true"
+# Where converted images are stored: B2Storage, LocalStorage (MEDIA_ROOT/images)
+# or InMemoryStorage, all in backblaze.utils.storage
+IMAGE_STORAGE_BACKEND = os.environ.get(
+    "IMAGE_STORAGE_BACKEND", "backblaze.utils.storage.B2Storage"
+)
+# Uploads with more pixels than this are rejected before decoding
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 64_000_000))
+# Uploads with a side longer than this are rejected before decoding
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", 16384))
+# Longest side images are decoded and stored at
+IMAGE_MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 2048))
+# Processes per gunicorn worker that decode and encode images; 0 runs inline
+IMAGE_POOL_SIZE = int(os.environ.get("IMAGE_POOL_SIZE", 2))
+# Seconds an upload waits for its encoding job before giving up
+IMAGE_POOL_TIMEOUT = float(os.environ.get("IMAGE_POOL_TIMEOUT", 60))
+# Also store AVIF copies of every image, listed in the `sources` of files.
+# Needs Pillow with AVIF support (pillow-avif-plugin); skipped without it.
+IMAGE_AVIF = os.environ.get("IMAGE_AVIF", "True").lower() == "true"
+# Seconds a direct upload authorization, and the B2 key it hands out, stay
+# valid, and the largest object finalize accepts
+IMAGE_DIRECT_UPLOAD_MAX_AGE = int(os.environ.get("IMAGE_DIRECT_UPLOAD_MAX_AGE", 900))
+IMAGE_DIRECT_UPLOAD_MAX_BYTES = int(
+    os.environ.get("IMAGE_DIRECT_UPLOAD_MAX_BYTES", 20 * 1024 * 1024)
+)
+# Store SVG uploads as sanitized SVG; when false they are rasterized to webp,
+# which needs cairosvg and the cairo library
+IMAGE_SVG_PASSTHROUGH = (
+    os.environ.get("IMAGE_SVG_PASSTHROUGH", "True").lower() == "true"
+)
+
+# Dog cards per page of /catalog/ and /dog_card, and the most a client may
+# ask for with ?page_size=
+CATALOG_PAGE_SIZE = int(os.environ.get("CATALOG_PAGE_SIZE", 20))
+CATALOG_MAX_PAGE_SIZE = int(os.environ.get("CATALOG_MAX_PAGE_SIZE", 100))
+
+# The `catalog` cache holds rendered /catalog/ responses and must be shared by
+# every process that writes dog cards (gunicorn workers and the image job
+# worker). Use Redis in production (docker-compose runs one):
+# CATALOG_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CATALOG_CACHE_LOCATION=redis://redis:6379/1. Without it the cache falls back
+# to a database table made by `createcachetable`, which costs a query per read.
+# Entries expire after CATALOG_CACHE_TIMEOUT seconds even without writes.
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "catalog": {
+        "BACKEND": os.environ.get(
+            "CATALOG_CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache"
+        ),
+        "LOCATION": os.environ.get("CATALOG_CACHE_LOCATION", "catalog_cache"),
+        "TIMEOUT": int(os.environ.get("CATALOG_CACHE_TIMEOUT", 3600)),
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -27,6 +27,7 @@ urlpatterns = [
     path("", include("main_page.urls")),
     path("", include("about.urls")),
     path("", include("formcallback.urls")),
+    path("", include("backblaze.urls")),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path(
         "api/docs/swagger-ui",